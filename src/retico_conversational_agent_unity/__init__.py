@@ -1,5 +1,30 @@
 """ """
 
-from retico_conversational_agent_unity.unity_communicator import UnityCommunicatorModule
-from retico_conversational_agent_unity.nonverbal_generator import NonverbalGeneratorModule
-from retico_conversational_agent_unity.additional_IUs import UnityMessageIU
+import importlib
+
+# exported classes, imported on first access (PEP 562) so that importing a light submodule (e.g. hot_logging or
+# startup) doesn't import retico_amq, retico_conversational_agent and torch
+_EXPORTS = {
+    "UnityCommunicatorModule": "retico_conversational_agent_unity.unity_communicator",
+    "NonverbalGeneratorModule": "retico_conversational_agent_unity.nonverbal_generator",
+    "UnityMessageIU": "retico_conversational_agent_unity.additional_IUs",
+    "SharedAudioRing": "retico_conversational_agent_unity.shared_audio",
+    "LatencyTracker": "retico_conversational_agent_unity.latency_tracker",
+    "FillerAudioCache": "retico_conversational_agent_unity.filler_cache",
+    "PlaybackScheduler": "retico_conversational_agent_unity.playback_scheduler",
+    "ClauseBatcher": "retico_conversational_agent_unity.clause_batcher",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,144 @@
+"""
+Audio codecs
+============
+
+Optional encoding stage applied to the clause audio before it is sent to
+Unity, to reduce the size of the AMQ messages. Every codec takes the WAV
+buffer of the clause and returns the payload to put in the audio action,
+and a descriptor sent alongside it in the audio action's "codec" field,
+so that Unity knows how to decode the payload :
+
+- "wav" : passthrough, the WAV PCM16 buffer is sent as is.
+- "wav_downsample" : the audio is resampled to `sample_rate` Hz and sent
+  as WAV PCM16 (lossy, playable as is).
+- "ulaw" : G.711 mu-law, 8 bits per sample, raw payload without header
+  (lossy, half the size, trivial to decode).
+- "delta_zlib" : lossless, the first-order difference of the PCM16
+  samples (per channel, wrapping on 16 bits) compressed with zlib, raw
+  payload without header.
+
+Every codec is pure Python / NumPy, and has a `decode` method returning
+the PCM16 samples, used by tests and local readers.
+"""
+
+import zlib
+
+import numpy as np
+
+from . import audio_utils
+
+
+class AudioCodec:
+    """Passthrough codec, base class of the other codecs."""
+
+    name = "wav"
+
+    def descriptor(self, sample_rate, channels, sampwidth):
+        return {"name": self.name, "sampleRate": sample_rate, "channels": channels, "sampleWidth": sampwidth}
+
+    def encode(self, wav, header_size, sample_rate, channels, sampwidth):
+        """Encode the clause audio.
+
+        Args:
+            wav (bytearray): the clause audio, starting with a WAV header.
+            header_size (int): size of the WAV header in `wav`.
+            sample_rate (int): sample rate of the audio.
+            channels (int): number of channels.
+            sampwidth (int): sample width in bytes.
+
+        Returns:
+            tuple[bytes-like, dict]: the payload and the codec descriptor.
+        """
+        return wav, self.descriptor(sample_rate, channels, sampwidth)
+
+    def decode(self, payload, descriptor):
+        """Return the PCM samples of the payload."""
+        return bytes(memoryview(payload)[audio_utils.WAV_HEADER_SIZE :])
+
+    @staticmethod
+    def samples(wav, header_size, channels, sampwidth):
+        if sampwidth != 2:
+            raise ValueError(f"codecs only support PCM16 audio, got a sample width of {sampwidth}")
+        return np.frombuffer(wav, dtype=np.int16, offset=header_size).reshape(-1, channels)
+
+
+class DownsampleCodec(AudioCodec):
+    """Resample the audio to `sample_rate` Hz, averaging the samples when the
+    ratio is an integer and interpolating linearly otherwise."""
+
+    name = "wav_downsample"
+
+    def __init__(self, sample_rate=16000):
+        self.sample_rate = sample_rate
+
+    def encode(self, wav, header_size, sample_rate, channels, sampwidth):
+        if sample_rate <= self.sample_rate:
+            return wav, self.descriptor(sample_rate, channels, sampwidth)
+        samples = self.samples(wav, header_size, channels, sampwidth)
+        ratio = sample_rate / self.sample_rate
+        if ratio.is_integer():
+            ratio = int(ratio)
+            nb_samples = len(samples) // ratio
+            resampled = samples[: nb_samples * ratio].reshape(nb_samples, ratio, channels).mean(axis=1)
+        else:
+            nb_samples = int(len(samples) / ratio)
+            positions = np.arange(nb_samples) * ratio
+            indices = np.arange(len(samples))
+            resampled = np.stack([np.interp(positions, indices, samples[:, c]) for c in range(channels)], axis=1)
+        pcm = np.round(resampled).astype(np.int16)
+        payload, _ = audio_utils.assemble_audio([pcm], sample_rate=self.sample_rate, num_channels=channels, sampwidth=2)
+        return payload, self.descriptor(self.sample_rate, channels, sampwidth)
+
+
+class MuLawCodec(AudioCodec):
+    """G.711 mu-law encoding, 8 bits per sample."""
+
+    name = "ulaw"
+    BIAS = 0x84
+    CLIP = 32635
+
+    def encode(self, wav, header_size, sample_rate, channels, sampwidth):
+        samples = self.samples(wav, header_size, channels, sampwidth).ravel().astype(np.int32)
+        sign = (samples < 0).astype(np.int32) << 7
+        magnitude = np.minimum(np.abs(samples), self.CLIP) + self.BIAS
+        exponent = np.floor(np.log2(magnitude)).astype(np.int32) - 7
+        mantissa = (magnitude >> (exponent + 3)) & 0x0F
+        payload = (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8)
+        return payload.tobytes(), self.descriptor(sample_rate, channels, sampwidth)
+
+    def decode(self, payload, descriptor):
+        encoded = ~np.frombuffer(payload, dtype=np.uint8).astype(np.int32) & 0xFF
+        exponent = (encoded >> 4) & 0x07
+        mantissa = encoded & 0x0F
+        magnitude = (((mantissa << 3) + self.BIAS) << exponent) - self.BIAS
+        return np.where(encoded & 0x80, -magnitude, magnitude).astype(np.int16).tobytes()
+
+
+class DeltaZlibCodec(AudioCodec):
+    """Lossless : zlib compression of the first-order difference of the samples."""
+
+    name = "delta_zlib"
+
+    def __init__(self, level=1):
+        self.level = level
+
+    def encode(self, wav, header_size, sample_rate, channels, sampwidth):
+        samples = self.samples(wav, header_size, channels, sampwidth)
+        delta = np.diff(samples, axis=0, prepend=np.zeros((1, channels), dtype=np.int16))
+        return zlib.compress(delta.tobytes(), self.level), self.descriptor(sample_rate, channels, sampwidth)
+
+    def decode(self, payload, descriptor):
+        delta = np.frombuffer(zlib.decompress(payload), dtype=np.int16).reshape(-1, descriptor["channels"])
+        return np.cumsum(delta, axis=0, dtype=np.int16).tobytes()
+
+
+CODECS = {codec.name: codec for codec in [AudioCodec, DownsampleCodec, MuLawCodec, DeltaZlibCodec]}
+
+
+def get_codec(codec):
+    """Return a codec instance from its name, or the codec itself if it is already an instance."""
+    if codec is None or isinstance(codec, AudioCodec):
+        return codec
+    if codec not in CODECS:
+        raise ValueError(f"unknown audio codec {codec}, expected one of {list(CODECS)}")
+    return CODECS[codec]()
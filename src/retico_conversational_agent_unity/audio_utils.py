@@ -0,0 +1,68 @@
+"""
+Audio utils
+===========
+
+Helpers to assemble the audio of a clause from the TTS chunks without
+repeated concatenations : the destination buffer is allocated once from
+the sum of the chunk lengths, the WAV header is written once, and each
+chunk is copied exactly once.
+"""
+
+import struct
+
+WAV_HEADER_SIZE = 44
+
+
+def wav_header(nb_bytes, sample_rate, num_channels, sampwidth):
+    """Return the 44-byte RIFF/WAVE header of a PCM payload of `nb_bytes`
+    bytes, identical to the one written by the `wave` module."""
+    byte_rate = sample_rate * num_channels * sampwidth
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF",
+        36 + nb_bytes,
+        b"WAVE",
+        b"fmt ",
+        16,
+        1,  # PCM
+        num_channels,
+        sample_rate,
+        byte_rate,
+        num_channels * sampwidth,
+        sampwidth * 8,
+        b"data",
+        nb_bytes,
+    )
+
+
+def assemble_audio(chunks, sample_rate=None, num_channels=1, sampwidth=2, header=True, token=None):
+    """Copy the audio `chunks` into a single preallocated buffer.
+
+    Args:
+        chunks (list): bytes-like audio chunks (bytes, bytearray, memoryview,
+            numpy arrays, ...).
+        sample_rate (int): sample rate written in the WAV header.
+        num_channels (int): number of channels written in the WAV header.
+        sampwidth (int): sample width in bytes written in the WAV header.
+        header (bool): if True, the buffer starts with a WAV header, making
+            it playable as is in Unity.
+        token (CancellationToken, optional): checked before copying each
+            chunk, aborting the assembly with ClauseCancelled.
+
+    Returns:
+        tuple[bytearray, int]: the buffer and the offset of the PCM data in
+        it (`WAV_HEADER_SIZE` if `header`, 0 otherwise).
+    """
+    views = [memoryview(c).cast("B") for c in chunks]
+    nb_bytes = sum(v.nbytes for v in views)
+    offset = WAV_HEADER_SIZE if header else 0
+    buffer = bytearray(offset + nb_bytes)
+    if header:
+        buffer[:offset] = wav_header(nb_bytes, sample_rate, num_channels, sampwidth)
+    for view in views:
+        if token is not None:
+            token.check()
+        end = offset + view.nbytes
+        buffer[offset:end] = view
+        offset = end
+    return buffer, WAV_HEADER_SIZE if header else 0
@@ -0,0 +1,81 @@
+"""
+Cancellation
+============
+
+Per-turn cancellation tokens, so that the work of an interrupted turn
+stops as soon as the user barges in, instead of being finished and sent
+to Unity : the NonverbalGenerator cancels the token of the current turn
+on a hard interruption, and the assembly, encoding and sending steps of
+a clause check the token of its turn, aborting with `ClauseCancelled`.
+
+    cancellations = TurnCancellations()
+    token = cancellations.token(turn_id)
+    ...
+    cancellations.cancel(turn_id)  # from another thread
+    token.check()  # raises ClauseCancelled
+"""
+
+import threading
+
+from .turn_index import TurnIndex
+
+
+class ClauseCancelled(Exception):
+    """The turn of the clause being processed was cancelled."""
+
+    def __init__(self, turn_id):
+        super().__init__(f"turn {turn_id} was cancelled")
+        self.turn_id = turn_id
+
+
+class CancellationToken:
+    """Cancellation flag of a turn, set from any thread and checked by the worker processing its clauses."""
+
+    __slots__ = ("turn_id", "cancelled")
+
+    def __init__(self, turn_id=None):
+        self.turn_id = turn_id
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def check(self):
+        """Raise ClauseCancelled if the turn was cancelled."""
+        if self.cancelled:
+            raise ClauseCancelled(self.turn_id)
+
+
+class TurnCancellations:
+    """Cancellation token of each turn.
+
+    Args:
+        max_turns (int): maximum number of turns whose token is kept (see `TurnIndex`).
+    """
+
+    def __init__(self, max_turns=100):
+        self._tokens = TurnIndex(max_turns=max_turns)
+        self._lock = threading.Lock()
+
+    def token(self, turn_id):
+        """Return the token of a turn, created on first use."""
+        with self._lock:
+            token = self._tokens.get(turn_id)
+            if token is None:
+                token = self._tokens[turn_id] = CancellationToken(turn_id)
+            return token
+
+    def cancelled(self, turn_id):
+        with self._lock:
+            token = self._tokens.get(turn_id)
+            return token is not None and token.cancelled
+
+    def cancel(self, turn_id):
+        """Cancel a turn : every step checking its token aborts."""
+        self.token(turn_id).cancel()
+
+    def renew(self, turn_id):
+        """Give a new token to a cancelled turn that is resumed (e.g. the user's barge-in was a backchannel). The
+        work aborted with the previous token stays aborted."""
+        with self._lock:
+            self._tokens[turn_id] = CancellationToken(turn_id)
@@ -0,0 +1,106 @@
+"""
+Clause batcher
+==============
+
+Coalescing of consecutive short clauses of a turn into a single
+multi-audio GestureIU, to reduce the number of AMQ messages (and the
+per-message broker overhead) when the TTS produces clauses of a word or
+two.
+
+The NonverbalGenerator holds a short clause for a time window, or for as
+long as Unity is busy playing the previous clauses (according to its
+PlaybackScheduler), and merges the short clauses of the same turn it
+receives meanwhile. The merged GestureIU carries :
+
+- one audio action per clause, with the clause's `clauseID`, its `delay`
+  in the merged command (the cumulated duration of the previous clauses),
+  and the `timingOffset` of its first word in the merged `timings` ;
+- a single talking animation, and the blendshapes of every clause, shifted
+  by their clause's delay ;
+- the concatenated word `timings`, so that Unity's timingIndex indexes
+  the words of every clause ;
+- `clauseIDs`, the merged clauses, the IU's clauseID being the last one,
+  so that the UnityCommunicatorModule detects the end of turn when the
+  merged command is completed.
+"""
+
+import time
+
+
+class ClauseBatcher:
+    """Policy and merge of the clause batches.
+
+    Args:
+        window (float): time (in seconds) a short clause waits for the next ones.
+        max_clause_duration (float): clauses shorter than this (in seconds of audio) are coalesced.
+        max_duration (float): maximum audio duration of a batch.
+        max_clauses (int): maximum number of clauses of a batch.
+        busy_margin (float): when Unity is busy, the batch is sent this long (in seconds) before Unity is expected
+            to be done with the previous clauses.
+    """
+
+    def __init__(self, window=0.05, max_clause_duration=1.0, max_duration=4.0, max_clauses=4, busy_margin=0.1):
+        self.window = window
+        self.max_clause_duration = max_clause_duration
+        self.max_duration = max_duration
+        self.max_clauses = max_clauses
+        self.busy_margin = busy_margin
+        self.nb_clauses = 0
+        self.nb_batches = 0
+
+    def is_short(self, duration):
+        return duration < self.max_clause_duration
+
+    def deadline(self, playback_scheduler=None, clock=time.monotonic):
+        """Time until which a batch can wait for more clauses : the end of the window, or the time at which the
+        batch must be sent for Unity to receive it before it is done playing the previous clauses."""
+        now = clock()
+        deadline = now + self.window
+        if playback_scheduler is not None and playback_scheduler.expected_end is not None:
+            busy_until = playback_scheduler.expected_end - playback_scheduler.transport - self.busy_margin
+            deadline = max(deadline, busy_until)
+        return deadline
+
+    def accepts(self, durations, duration):
+        """Return True if a clause of `duration` seconds can be added to a batch of clauses of `durations`."""
+        return len(durations) < self.max_clauses and sum(durations) + duration <= self.max_duration
+
+    def merge(self, clauses):
+        """Merge the actions of consecutive clauses.
+
+        Args:
+            clauses (list): (clause ID, actions, duration) of each clause, whose audio actions already carry their
+                audio.
+
+        Returns:
+            dict: the actions of the merged GestureIU, with `clauseIDs`.
+        """
+        self.nb_clauses += len(clauses)
+        self.nb_batches += 1
+        audios, timings, blendshapes, offset = [], [], [], 0.0
+        for clause_id, actions, duration in clauses:
+            for audio in actions["audios"]:
+                audios.append(
+                    {
+                        **audio,
+                        "clauseID": clause_id,
+                        "delay": round(audio.get("delay", 0.0) + offset, 4),
+                        "timingOffset": len(timings),
+                    }
+                )
+            timings.extend(round(start + offset, 4) for start in actions["timings"])
+            for blendshape in actions.get("blendshapes") or []:
+                blendshapes.append({**blendshape, "delay": round(blendshape.get("delay", 0.0) + offset, 4)})
+            offset += duration
+        animation = dict(clauses[0][1]["animations"][0], duration=offset)
+        merged = dict(audios=audios, animations=[animation], timings=timings, clauseIDs=[c[0] for c in clauses])
+        if blendshapes:
+            merged["blendshapes"] = blendshapes
+        return merged
+
+    def metrics(self):
+        return {
+            "clauses": self.nb_clauses,
+            "batches": self.nb_batches,
+            "clauses_per_batch": self.nb_clauses / self.nb_batches if self.nb_batches else None,
+        }
@@ -0,0 +1,178 @@
+"""
+Filler cache
+============
+
+Cache of ready-to-send clause payloads for short ritual phrases and
+backchannels ("okay", "I see", "hmm"...), so that the NonverbalGenerator
+can send them to Unity instantly, e.g. as an acknowledgement while the LLM
+is still generating, instead of waiting for the TTS and re-encoding the
+same audio every time.
+
+Entries are keyed by normalized text, voice and sample rate. They hold the
+clause actions (audio action without its bytes, animations, word timings,
+blendshapes) and the encoded audio payload. The cache is bounded both in
+number of entries and in payload bytes, the least recently used entries
+being evicted first, and can be persisted to disk (msgpack) to be reloaded
+by the next run.
+
+Only the phrases of the cache's phrase list are cached : they are added
+when the NonverbalGenerator encodes a clause with this text, or when the
+cache is warmed at startup with a synthesizer.
+"""
+
+import collections
+import copy
+import os
+import re
+import threading
+
+import msgpack
+
+_PUNCTUATION = re.compile(r"^[\s.,!?;:…\"'«»()-]+|[\s.,!?;:…\"'«»()-]+$")
+_SPACES = re.compile(r"\s+")
+
+# turn of the filler clauses (see NonverbalGeneratorModule.send_filler) : it never ends, and is played outside of
+# the generated turns
+FILLER_TURN_ID = -1
+
+
+def normalize_text(text):
+    """Lowercase, collapse the whitespaces and strip the surrounding punctuation :
+    "  Okay, I see! " -> "okay, i see"."""
+    return _PUNCTUATION.sub("", _SPACES.sub(" ", text.lower()))
+
+
+class FillerEntry:
+    """Cached clause : its actions (without the audio bytes) and its encoded audio payload."""
+
+    __slots__ = ("actions", "payload")
+
+    def __init__(self, actions, payload):
+        self.actions = actions
+        self.payload = bytes(payload)
+
+    @property
+    def nbytes(self):
+        return len(self.payload)
+
+    def clause_actions(self):
+        """Copy of the actions, whose audio actions can receive the payload (as "bytes" or "shm")."""
+        actions = dict(self.actions)
+        actions["audios"] = [dict(audio) for audio in self.actions["audios"]]
+        return actions
+
+
+class FillerAudioCache:
+    """LRU cache of filler clauses, bounded in entries and payload bytes.
+
+    Args:
+        phrases (list[str], optional): the phrases to cache.
+        max_entries (int): maximum number of entries.
+        max_bytes (int): maximum total size of the audio payloads.
+        path (str, optional): file the cache is loaded from (if it exists) and saved to.
+    """
+
+    def __init__(self, phrases=None, max_entries=128, max_bytes=16 * 2**20, path=None):
+        self.phrases = {normalize_text(phrase) for phrase in phrases or []}
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.path = path
+        self.nbytes = 0
+        self.nb_hits = 0
+        self.nb_misses = 0
+        self.nb_evicted = 0
+        self._entries = collections.OrderedDict()  # (text, voice, rate) -> FillerEntry
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    @staticmethod
+    def key(text, voice, rate):
+        return normalize_text(text), voice, rate
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.key(*key) in self._entries
+
+    def wants(self, text):
+        """Return True if `text` is one of the phrases to cache."""
+        return normalize_text(text) in self.phrases
+
+    def get(self, text, voice, rate):
+        """Return the FillerEntry of a phrase, None if it isn't cached."""
+        key = self.key(text, voice, rate)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.nb_misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.nb_hits += 1
+            return entry
+
+    def put(self, text, voice, rate, actions, payload):
+        """Cache the actions and payload of a clause, evicting the least recently used entries if needed."""
+        cached_actions = copy.deepcopy({k: v for k, v in actions.items() if k != "audios"})
+        cached_actions["audios"] = [
+            {k: v for k, v in audio.items() if k not in ("bytes", "shm")} for audio in actions["audios"]
+        ]
+        entry = FillerEntry(cached_actions, payload)
+        if entry.nbytes > self.max_bytes:
+            return
+        key = self.key(text, voice, rate)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= previous.nbytes
+            self._entries[key] = entry
+            self.nbytes += entry.nbytes
+            self._evict()
+
+    def offer(self, text, voice, rate, actions, payload):
+        """Cache a clause if its text is one of the phrases and it isn't already cached."""
+        if self.wants(text) and (text, voice, rate) not in self:
+            self.put(text, voice, rate, actions, payload)
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries or self.nbytes > self.max_bytes:
+            _, entry = self._entries.popitem(last=False)
+            self.nbytes -= entry.nbytes
+            self.nb_evicted += 1
+
+    def warm(self, build, voice, rate):
+        """Cache every phrase that isn't cached yet, `build(text)` returns its (actions, payload)."""
+        for phrase in sorted(self.phrases):
+            if (phrase, voice, rate) not in self:
+                self.put(phrase, voice, rate, *build(phrase))
+
+    def save(self, path=None):
+        """Persist the cache, from the least to the most recently used entry."""
+        path = path if path is not None else self.path
+        with self._lock:
+            entries = [[text, voice, rate, e.actions, e.payload] for (text, voice, rate), e in self._entries.items()]
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(msgpack.packb({"version": 1, "entries": entries}, use_bin_type=True))
+        os.replace(tmp_path, path)
+
+    def load(self, path=None):
+        """Add the entries of a persisted cache."""
+        path = path if path is not None else self.path
+        with open(path, "rb") as f:
+            data = msgpack.unpackb(f.read(), raw=False)
+        for text, voice, rate, actions, payload in data["entries"]:
+            self.put(text, voice, rate, actions, payload)
+
+    def metrics(self):
+        return {
+            "size": len(self._entries),
+            "bytes": self.nbytes,
+            "hits": self.nb_hits,
+            "misses": self.nb_misses,
+            "evicted": self.nb_evicted,
+        }
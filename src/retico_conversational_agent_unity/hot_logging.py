@@ -0,0 +1,202 @@
+"""
+Hot-path logging
+================
+
+Logging facade for the per-IU logs of the NonverbalGenerator and
+UnityCommunicator modules. Compared to calling the module's
+`terminal_logger` directly, a `HotPathLogger` :
+
+- decides whether a record would be emitted before building its
+  arguments : the filters given to `configure` (the same ones as
+  `retico_core.log_utils.configurate_logger`, e.g. `filter_cases`) are
+  applied once per (event, level, debug) and the decision is cached, and
+  expensive arguments are passed as a callable, only called if the record
+  is emitted ;
+- samples high-frequency events (e.g. "process_update"), keeping one
+  record out of N ;
+- hands the records over to a background thread through a bounded ring
+  (a deque, appended to without lock), so that the formatting and
+  printing of the records happen outside of the module's threads.
+
+    # in main, after configurate_logger
+    hot_logging.configure(filters=filters, sampling={"process_update": 100})
+
+    # in a module
+    self.hot_logger = HotPathLogger(self.terminal_logger, module=self.name())
+    self.hot_logger.info("message received from Unity", lambda: dict(iu=iu.to_dict()))
+
+The `file_logger` records (used to plot the latencies) are not routed
+through the facade, as their timestamps must stay those of the event.
+"""
+
+import collections
+import itertools
+import threading
+import time
+import weakref
+
+try:
+    from structlog import DropEvent
+except ImportError:  # filters can't drop records without structlog
+
+    class DropEvent(BaseException):
+        pass
+
+
+_config = {"filters": [], "sampling": {}, "background": True, "ring_size": 8192, "flush_interval": 0.02}
+
+
+def configure(filters=None, sampling=None, background=True, ring_size=8192, flush_interval=0.02):
+    """Configure every HotPathLogger.
+
+    Args:
+        filters (list, optional): structlog processors deciding whether a record is emitted (raising DropEvent if
+            not), called with an event dict holding the event, level, module and debug flag of the record.
+        sampling (dict, optional): {event: N}, only one record out of N of these events is emitted.
+        background (bool): if True, records are emitted by a background thread.
+        ring_size (int): maximum number of records waiting for the background thread, the oldest are dropped.
+        flush_interval (float): time (in seconds) the background thread waits when there is no record to emit.
+    """
+    _config.update(
+        filters=list(filters or []),
+        sampling=dict(sampling or {}),
+        background=background,
+        ring_size=ring_size,
+        flush_interval=flush_interval,
+    )
+    for logger in list(HotPathLogger.instances):
+        logger.reset()
+    _worker.resize(ring_size)
+
+
+class _Worker:
+    """Background thread emitting the records of every HotPathLogger."""
+
+    def __init__(self, ring_size):
+        self.ring = collections.deque(maxlen=ring_size)
+        self.nb_dropped = 0
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def resize(self, ring_size):
+        self.ring = collections.deque(self.ring, maxlen=ring_size)
+
+    def put(self, record):
+        ring = self.ring
+        if len(ring) == ring.maxlen:
+            self.nb_dropped += 1
+        ring.append(record)
+        if self._thread is None:
+            self.start()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self.run, daemon=True, name="hot-logging")
+                self._thread.start()
+
+    def run(self):
+        while True:
+            if not self.flush():
+                time.sleep(_config["flush_interval"])
+
+    def flush(self):
+        """Emit the pending records, returns the number of records emitted."""
+        nb_records = 0
+        ring = self.ring
+        while True:
+            try:
+                logger, level, event, kwargs = ring.popleft()
+            except IndexError:
+                return nb_records
+            getattr(logger, level)(event, **kwargs)
+            nb_records += 1
+
+
+_worker = _Worker(_config["ring_size"])
+
+
+def flush():
+    """Emit every pending record (e.g. before shutdown)."""
+    _worker.flush()
+
+
+class HotPathLogger:
+    """Facade of a module's logger, see the module's documentation.
+
+    Args:
+        logger: the logger of the module (its terminal_logger).
+        module (str): name of the module, as bound in the module's logger (used by the filters).
+    """
+
+    instances = weakref.WeakSet()
+
+    def __init__(self, logger, module=None):
+        self.logger = logger
+        self.module = module
+        self._enabled = dict()
+        self._counters = dict()
+        HotPathLogger.instances.add(self)
+
+    def reset(self):
+        self._enabled.clear()
+        self._counters.clear()
+
+    def enabled(self, event, level="info", debug=False):
+        """Return True if a record would pass the filters, the decision is cached."""
+        key = (event, level, debug)
+        decision = self._enabled.get(key)
+        if decision is None:
+            decision = self._enabled[key] = self._apply_filters(event, level, debug)
+        return decision
+
+    def _apply_filters(self, event, level, debug):
+        event_dict = {"event": event, "level": level, "module": self.module}
+        if debug:
+            event_dict["debug"] = debug
+        for log_filter in _config["filters"]:
+            try:
+                event_dict = log_filter(None, level, event_dict)
+            except DropEvent:
+                return False
+            if event_dict is None:
+                return False
+        return True
+
+    def sampled(self, event):
+        """Return True if this occurrence of `event` is kept by the sampling."""
+        rate = _config["sampling"].get(event)
+        if rate is None or rate <= 1:
+            return True
+        counter = self._counters.get(event)
+        if counter is None:
+            counter = self._counters[event] = itertools.count()
+        return next(counter) % rate == 0
+
+    def log(self, level, event, lazy_kwargs=None, **kwargs):
+        """Log a record if it passes the filters and the sampling.
+
+        Args:
+            level (str): "info", "warning", "error"...
+            event (str): the event of the record.
+            lazy_kwargs (Callable[[], dict], optional): returns the expensive arguments of the record, only called
+                if it is emitted.
+            kwargs: the other arguments of the record.
+        """
+        if not self.enabled(event, level, kwargs.get("debug", False)) or not self.sampled(event):
+            return
+        if lazy_kwargs is not None:
+            kwargs.update(lazy_kwargs())
+        if _config["background"]:
+            _worker.put((self.logger, level, event, kwargs))
+        else:
+            getattr(self.logger, level)(event, **kwargs)
+
+    def info(self, event, lazy_kwargs=None, **kwargs):
+        self.log("info", event, lazy_kwargs, **kwargs)
+
+    def warning(self, event, lazy_kwargs=None, **kwargs):
+        self.log("warning", event, lazy_kwargs, **kwargs)
+
+    def error(self, event, lazy_kwargs=None, **kwargs):
+        self.log("error", event, lazy_kwargs, **kwargs)
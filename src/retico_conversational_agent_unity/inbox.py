@@ -0,0 +1,219 @@
+"""
+Inbox
+=====
+
+Thread-safe hand-off buffer between a module's `process_update` and its
+worker thread. The consumer blocks on a condition variable and is woken
+as soon as an item is put, instead of polling the buffer.
+
+The inbox can be bounded, in which case the overflow policy decides what
+happens when a producer puts an item in a full inbox:
+
+- "block" : the producer waits until the consumer frees a slot (backpressure).
+- "drop_oldest" : the oldest pending item is discarded.
+- "drop_newest" : the new item is discarded.
+
+A PriorityInbox has several lanes : `get` pops the oldest item of the
+most urgent non-empty lane, so that e.g. control messages jump ahead of
+the audio clauses queued before them.
+"""
+
+import collections
+import threading
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "drop_newest")
+
+
+class Inbox:
+    """FIFO buffer with a blocking `get`, safe to share between threads.
+
+    Args:
+        maxsize (int): maximum number of pending items, 0 means unbounded.
+        policy (str): overflow policy, one of `OVERFLOW_POLICIES`.
+    """
+
+    def __init__(self, maxsize=0, policy="block"):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy {policy}, expected one of {OVERFLOW_POLICIES}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.nb_dropped = 0
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def _full(self):
+        return self.maxsize > 0 and len(self._items) >= self.maxsize
+
+    def put(self, item, timeout=None):
+        """Append an item and wake up the consumer.
+
+        Returns:
+            bool: False if the item was dropped (full inbox with the
+            "drop_newest" policy, or "block" timeout expired), True
+            otherwise.
+        """
+        with self._cond:
+            if self._full():
+                if self.policy == "drop_newest":
+                    self.nb_dropped += 1
+                    return False
+                elif self.policy == "drop_oldest":
+                    self._items.popleft()
+                    self.nb_dropped += 1
+                elif not self._cond.wait_for(lambda: not self._full() or self._closed, timeout):
+                    self.nb_dropped += 1
+                    return False
+            self._items.append(item)
+            self._cond.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """Pop the oldest item, blocking until one is available.
+
+        Args:
+            timeout (float, optional): maximum time to wait, in seconds.
+
+        Returns:
+            The oldest item, or None if the timeout expired or the inbox
+            was closed while empty.
+        """
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if self._items:
+                item = self._items.popleft()
+                self._cond.notify_all()
+                return item
+            return None
+
+    def clear(self):
+        """Remove every pending item."""
+        with self._cond:
+            self._items.clear()
+            self._cond.notify_all()
+
+    def drain(self):
+        """Atomically remove and return every pending item, oldest first."""
+        with self._cond:
+            items = list(self._items)
+            self._items.clear()
+            self._cond.notify_all()
+            return items
+
+    def replace(self, items):
+        """Atomically replace the pending items with `items`.
+
+        The bound is not enforced here, as this is used to restore items
+        that were previously drained from the same inbox.
+        """
+        with self._cond:
+            self._items = collections.deque(items)
+            self._cond.notify_all()
+
+    def close(self):
+        """Wake up every waiting consumer and producer, used on module shutdown."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def reopen(self):
+        with self._cond:
+            self._closed = False
+
+
+class PriorityInbox(Inbox):
+    """Inbox with `nb_lanes` FIFO lanes, lane 0 being the most urgent.
+
+    Only the items of the lanes other than 0 count towards `maxsize` : the items of lane 0 (control messages)
+    are never dropped, and never wait for a slot.
+
+    Args:
+        nb_lanes (int): number of lanes.
+        maxsize (int): maximum number of pending items in the lanes other than 0, 0 means unbounded.
+        policy (str): overflow policy, one of `OVERFLOW_POLICIES`, "drop_oldest" drops the oldest item of the
+            least urgent non-empty lane.
+    """
+
+    def __init__(self, nb_lanes=2, maxsize=0, policy="block"):
+        super().__init__(maxsize=maxsize, policy=policy)
+        self.nb_lanes = nb_lanes
+        self._lanes = [collections.deque() for _ in range(nb_lanes)]
+
+    def __len__(self):
+        return sum(len(lane) for lane in self._lanes)
+
+    def lane_size(self, lane):
+        return len(self._lanes[lane])
+
+    def _full(self):
+        return self.maxsize > 0 and sum(len(lane) for lane in self._lanes[1:]) >= self.maxsize
+
+    def put(self, item, timeout=None, lane=None):
+        """Append an item to a lane (the least urgent one by default) and wake up the consumer.
+
+        Returns:
+            bool: False if the item was dropped, True otherwise.
+        """
+        lane = self.nb_lanes - 1 if lane is None else lane
+        with self._cond:
+            if lane > 0 and self._full():
+                if self.policy == "drop_newest":
+                    self.nb_dropped += 1
+                    return False
+                elif self.policy == "drop_oldest":
+                    next(queued for queued in reversed(self._lanes) if queued).popleft()
+                    self.nb_dropped += 1
+                elif not self._cond.wait_for(lambda: not self._full() or self._closed, timeout):
+                    self.nb_dropped += 1
+                    return False
+            self._lanes[lane].append(item)
+            self._cond.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """Pop the oldest item of the most urgent non-empty lane, blocking until one is available.
+
+        Returns:
+            The item, or None if the timeout expired or the inbox was closed while empty.
+        """
+        with self._cond:
+            if not any(self._lanes) and not self._closed:
+                self._cond.wait(timeout)
+            for lane in self._lanes:
+                if lane:
+                    item = lane.popleft()
+                    self._cond.notify_all()
+                    return item
+            return None
+
+    def clear(self, lane=None):
+        """Remove every pending item, or the pending items of `lane`."""
+        with self._cond:
+            for cleared in self._lanes if lane is None else [self._lanes[lane]]:
+                cleared.clear()
+            self._cond.notify_all()
+
+    def drain(self):
+        """Atomically remove and return every pending item, in the order `get` would return them."""
+        with self._cond:
+            items = [item for lane in self._lanes for item in lane]
+            for lane in self._lanes:
+                lane.clear()
+            self._cond.notify_all()
+            return items
+
+    def replace(self, items, lane=None):
+        """Atomically replace the pending items with `items`, put in `lane` (the least urgent one by default)."""
+        with self._cond:
+            for cleared in self._lanes:
+                cleared.clear()
+            self._lanes[self.nb_lanes - 1 if lane is None else lane].extend(items)
+            self._cond.notify_all()
@@ -0,0 +1,211 @@
+"""
+Latency tracker
+===============
+
+Structured timing of the TTS -> NonverbalGenerator -> Unity -> alignment
+loop. The modules stamp a monotonic time for each (turnID, clauseID) when
+a clause reaches one of the stages of `STAGES`, and the tracker records,
+in fixed-size log-scale histograms, the time between consecutive stages
+and the time since the TTS IU arrival. Percentiles (p50/p95/p99) are
+computed on demand and exported as a dict, JSON or Prometheus text.
+
+A single tracker is shared between the modules of a system :
+
+    tracker = LatencyTracker()
+    nvg = NonverbalGeneratorModule(latency_tracker=tracker)
+    unity_comm = UnityCommunicatorModule(latency_tracker=tracker)
+    ...
+    print(tracker.to_json())
+"""
+
+import collections
+import datetime
+import functools
+import json
+import math
+import threading
+import time
+
+TTS_ARRIVAL = "tts_arrival"
+GESTURE_EMIT = "gesture_emit"
+AMQ_SEND = "amq_send"
+UNITY_START = "unity_start"
+UNITY_COMPLETED = "unity_completed"
+ALIGNMENT_EMIT = "alignment_emit"
+STAGES = [TTS_ARRIVAL, GESTURE_EMIT, AMQ_SEND, UNITY_START, UNITY_COMPLETED, ALIGNMENT_EMIT]
+
+UNITY_PLAYBACK = "unity_playback"
+
+
+def turn_key(turn_id, session_id=None):
+    """Key of a turn in the tracker, the turns of different sessions (see `UnitySession`) are told apart by their
+    session ID."""
+    return turn_id if session_id is None else (session_id, turn_id)
+
+
+def parse_timestamp(value):
+    """Convert a timestamp sent by Unity to seconds : numbers are returned as
+    is, ISO datetimes are converted to POSIX time, and "HH:MM:SS[.fff]" to
+    seconds since midnight. Returns None if the value can't be parsed."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    return _parse_timestamp_string(value)
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_timestamp_string(value):
+    # cached : the timestamps of the messages received during the same second are identical
+    parts = value.split(":")
+    if len(parts) == 3 and parts[0].isdigit() and parts[1].isdigit():
+        try:
+            return int(parts[0]) * 3600 + int(parts[1]) * 60 + float(parts[2])
+        except ValueError:
+            return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+class _Clocks:
+    """Offsets between the wall clock, the local midnight and the monotonic clock, refreshed every minute."""
+
+    refresh_at = -math.inf
+    midnight = 0.0
+    monotonic_offset = 0.0
+
+    @classmethod
+    def get(cls):
+        now = time.monotonic()
+        if now >= cls.refresh_at:
+            cls.monotonic_offset = now - time.time()
+            cls.midnight = datetime.datetime.combine(datetime.date.today(), datetime.time()).timestamp()
+            cls.refresh_at = now + 60
+        return cls.midnight, cls.monotonic_offset
+
+
+def to_monotonic(*values):
+    """Convert timestamps sent by Unity (see `parse_timestamp`) to the monotonic clock of this process, so that
+    they can be compared with the stamps of the tracker. "HH:MM:SS" timestamps are taken in the current local
+    day, and values that can't be parsed are converted to None. Returns a single value if a single timestamp is
+    given, a tuple otherwise."""
+    midnight, monotonic_offset = _Clocks.get()
+    result = []
+    for value in values:
+        seconds = parse_timestamp(value)
+        if seconds is not None:
+            seconds += monotonic_offset + (midnight if seconds < 86400 else 0)
+        result.append(seconds)
+    return result[0] if len(values) == 1 else tuple(result)
+
+
+class LatencyHistogram:
+    """Log-scale histogram of durations, from 1 microsecond to 100 seconds,
+    with `buckets_per_decade` buckets per power of ten."""
+
+    MIN = 1e-6
+    DECADES = 8
+
+    def __init__(self, buckets_per_decade=20):
+        self.buckets_per_decade = buckets_per_decade
+        self.counts = [0] * (self.DECADES * buckets_per_decade + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        index = 0
+        if seconds > self.MIN:
+            index = min(int(math.log10(seconds / self.MIN) * self.buckets_per_decade), len(self.counts) - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the `q` quantile (0 < q <= 1)."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulated = 0
+        for index, count in enumerate(self.counts):
+            cumulated += count
+            if cumulated >= rank:
+                return min(self.MIN * 10 ** ((index + 1) / self.buckets_per_decade), self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else None,
+            "max": self.max,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+        }
+
+
+class LatencyTracker:
+    """Stamps the stages of each clause and aggregates their latencies.
+
+    Args:
+        max_clauses (int): number of clauses whose stamps are kept in
+            memory, the oldest clauses are forgotten first.
+        clock (Callable[[], float]): monotonic clock, in seconds.
+    """
+
+    def __init__(self, max_clauses=1000, clock=time.monotonic):
+        self.max_clauses = max_clauses
+        self.clock = clock
+        self.histograms = collections.defaultdict(LatencyHistogram)
+        self._stamps = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def stamp(self, stage, turn_id, clause_id, t=None):
+        """Stamp `stage` for a clause, only the first stamp of each stage is kept
+        (e.g. the first sub-chunk of a streamed clause)."""
+        t = self.clock() if t is None else t
+        key = (turn_id, clause_id)
+        with self._lock:
+            stamps = self._stamps.get(key)
+            if stamps is None:
+                stamps = self._stamps[key] = dict()
+                if len(self._stamps) > self.max_clauses:
+                    self._stamps.popitem(last=False)
+            if stage in stamps:
+                return
+            stamps[stage] = t
+            previous = next((s for s in reversed(STAGES[: STAGES.index(stage)]) if s in stamps), None)
+            if previous is not None:
+                self.histograms[f"{previous}->{stage}"].record(t - stamps[previous])
+            if stage != TTS_ARRIVAL and previous != TTS_ARRIVAL and TTS_ARRIVAL in stamps:
+                self.histograms[f"{TTS_ARRIVAL}->{stage}"].record(t - stamps[TTS_ARRIVAL])
+
+    def record(self, name, seconds):
+        """Record a duration measured outside of the tracker (e.g. the playback duration reported by Unity)."""
+        with self._lock:
+            self.histograms[name].record(seconds)
+
+    def summary(self):
+        with self._lock:
+            return {name: histogram.to_dict() for name, histogram in sorted(self.histograms.items())}
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.summary(), **kwargs)
+
+    def to_prometheus(self, prefix="retico_unity_latency_seconds"):
+        """Export the histograms in the Prometheus text format, as summaries."""
+        lines = [f"# TYPE {prefix} summary"]
+        for name, stats in self.summary().items():
+            for q in ["0.5", "0.95", "0.99"]:
+                value = stats[f"p{round(float(q) * 100)}"]
+                lines.append(f'{prefix}{{path="{name}",quantile="{q}"}} {value}')
+            lines.append(f'{prefix}_sum{{path="{name}"}} {stats["mean"] * stats["count"]}')
+            lines.append(f'{prefix}_count{{path="{name}"}} {stats["count"]}')
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,124 @@
+"""
+Lipsync
+=======
+
+Audio-driven mouth blendshapes for the NonverbalGenerator. The clause PCM
+is cut in fixed-length frames, and everything is computed on all frames
+at once with NumPy :
+
+- the RMS energy of each frame, normalized against the clause's loud
+  frames and smoothed, gives the jaw opening,
+- optionally, the zero-crossing rate of each voiced frame gives a coarse
+  viseme class : "wide" for noisy, high-frequency frames (fricatives such
+  as s, f, ch), "round" for smooth, low-frequency frames (o, u), and
+  "open" otherwise.
+
+Consecutive frames with the same quantized value are merged, so a clause
+produces a few dozen blendshape actions `{"id", "value", "duration",
+"delay"}` rather than one per frame.
+"""
+
+import numpy as np
+
+JAW_OPEN = "A25_Jaw_Open"
+VISEME_BLENDSHAPES = {
+    "wide": "A50_Mouth_Stretch_Left",
+    "round": "A30_Mouth_Pucker",
+}
+SAMPLE_DTYPES = {2: np.int16, 4: np.int32}
+
+
+def frame_features(pcm, sample_rate, sampwidth=2, channels=1, frame_duration=0.04):
+    """Compute the RMS energy and the zero-crossing rate of each frame.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: RMS (in [0, 1]) and zero-crossing
+        rate (in [0, 1]) of each complete frame of the audio.
+    """
+    if sampwidth not in SAMPLE_DTYPES:
+        raise ValueError(f"unsupported sample width {sampwidth}")
+    dtype = SAMPLE_DTYPES[sampwidth]
+    samples = np.frombuffer(pcm, dtype=dtype).astype(np.float32) / np.iinfo(dtype).max
+    if channels > 1:
+        samples = samples[: len(samples) // channels * channels].reshape(-1, channels).mean(axis=1)
+    frame_length = max(1, int(sample_rate * frame_duration))
+    nb_frames = len(samples) // frame_length
+    frames = samples[: nb_frames * frame_length].reshape(nb_frames, frame_length)
+    rms = np.sqrt(np.mean(frames**2, axis=1))
+    zcr = np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1)
+    return rms, zcr
+
+
+def mouth_opening(rms, noise_floor=0.01, smoothing_frames=3):
+    """Map the RMS energy of each frame to a mouth opening in [0, 1]."""
+    if len(rms) == 0:
+        return rms
+    peak = max(np.percentile(rms, 95), noise_floor * 2)
+    opening = np.clip((rms - noise_floor) / (peak - noise_floor), 0.0, 1.0)
+    if smoothing_frames > 1:
+        kernel = np.ones(smoothing_frames) / smoothing_frames
+        opening = np.convolve(opening, kernel, mode="same")
+    return opening
+
+
+def viseme_classes(zcr, opening, wide_threshold=0.25, round_threshold=0.06):
+    """Return, for each frame, "wide", "round", "open", or None for silent frames."""
+    classes = np.full(len(zcr), "open", dtype=object)
+    classes[zcr >= wide_threshold] = "wide"
+    classes[zcr <= round_threshold] = "round"
+    classes[opening <= 0] = None
+    return classes
+
+
+def runs_to_blendshapes(blendshape_id, values, frame_duration):
+    """Merge consecutive frames with equal values into blendshape actions,
+    silent (zero) runs are dropped."""
+    if len(values) == 0:
+        return []
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(values) != 0) + 1))
+    ends = np.concatenate((starts[1:], [len(values)]))
+    return [
+        {
+            "id": blendshape_id,
+            "value": round(float(values[start]), 3),
+            "duration": round(float((end - start) * frame_duration), 3),
+            "delay": round(float(start * frame_duration), 3),
+        }
+        for start, end in zip(starts, ends)
+        if values[start] > 0
+    ]
+
+
+def compute_mouth_blendshapes(
+    pcm,
+    sample_rate,
+    sampwidth=2,
+    channels=1,
+    frame_duration=0.04,
+    quantization=0.1,
+    visemes=False,
+):
+    """Compute the time-stamped mouth blendshapes of a clause.
+
+    Args:
+        pcm (bytes-like): raw PCM audio of the clause, without header.
+        sample_rate (int): sample rate of the audio.
+        sampwidth (int): sample width in bytes.
+        channels (int): number of channels.
+        frame_duration (float): duration of an analysis frame, in seconds.
+        quantization (float): step of the blendshape values, coarser steps
+            merge more frames into each action.
+        visemes (bool): if True, add the coarse viseme blendshapes.
+
+    Returns:
+        list[dict]: blendshape actions, with their delay relative to the
+        beginning of the clause.
+    """
+    rms, zcr = frame_features(pcm, sample_rate, sampwidth, channels, frame_duration)
+    opening = np.round(mouth_opening(rms) / quantization) * quantization
+    blendshapes = runs_to_blendshapes(JAW_OPEN, opening, frame_duration)
+    if visemes:
+        classes = viseme_classes(zcr, opening)
+        for viseme, blendshape_id in VISEME_BLENDSHAPES.items():
+            blendshapes += runs_to_blendshapes(blendshape_id, np.where(classes == viseme, opening, 0.0), frame_duration)
+    return blendshapes
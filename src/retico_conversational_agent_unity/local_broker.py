@@ -0,0 +1,232 @@
+"""
+Local broker
+============
+
+Minimal in-process STOMP broker, standing in for ActiveMQ in benchmarks
+and load tests, so that they can run on a machine without an ActiveMQ
+install. It implements the subset of STOMP 1.1/1.2 used by the AMQ
+modules : CONNECT/STOMP, SUBSCRIBE/UNSUBSCRIBE, SEND (delivered as
+MESSAGE to every subscriber of the destination), receipts and DISCONNECT.
+Messages are not persisted, and ACK/NACK/transactions are accepted and
+ignored.
+
+In-process code can also publish messages with `publish`, and listen to
+every message sent to a destination with `add_listener` (e.g. to emulate
+the Unity side without a STOMP client).
+
+The frame encoding / parsing helpers are shared with the STOMP clients of
+the package (see `unity_simulator`).
+"""
+
+import itertools
+import socket
+import socketserver
+import threading
+
+ESCAPES = {"\\": "\\\\", "\r": "\\r", "\n": "\\n", ":": "\\c"}
+UNESCAPES = {"\\\\": "\\", "\\r": "\r", "\\n": "\n", "\\c": ":"}
+
+
+def escape(value):
+    return "".join(ESCAPES.get(c, c) for c in str(value))
+
+
+def unescape(value):
+    result, i = [], 0
+    while i < len(value):
+        if value[i] == "\\" and value[i : i + 2] in UNESCAPES:
+            result.append(UNESCAPES[value[i : i + 2]])
+            i += 2
+        else:
+            result.append(value[i])
+            i += 1
+    return "".join(result)
+
+
+def encode_frame(command, headers=None, body=b""):
+    """Encode a STOMP frame, a content-length header is always added."""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    headers = dict(headers or {})
+    headers["content-length"] = len(body)
+    lines = [command] + [f"{escape(k)}:{escape(v)}" for k, v in headers.items()]
+    return ("\n".join(lines) + "\n\n").encode("utf-8") + bytes(body) + b"\x00"
+
+
+class FrameReader:
+    """Incremental STOMP frame parser, fed with the bytes received on a socket."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer += data
+
+    def frames(self):
+        """Yield every complete frame of the buffer as (command, headers, body)."""
+        while True:
+            # heart-beats and EOLs between frames
+            start = 0
+            while start < len(self.buffer) and self.buffer[start] in b"\r\n":
+                start += 1
+            del self.buffer[:start]
+            header_end = self.buffer.find(b"\n\n")
+            if header_end < 0:
+                return
+            lines = self.buffer[:header_end].decode("utf-8").replace("\r", "").split("\n")
+            command, headers = lines[0], dict()
+            for line in lines[1:]:
+                key, _, value = line.partition(":")
+                key, value = (key, value) if command in ("CONNECT", "CONNECTED") else (unescape(key), unescape(value))
+                headers.setdefault(key, value)
+            body_start = header_end + 2
+            if "content-length" in headers:
+                body_end = body_start + int(headers["content-length"])
+                if len(self.buffer) < body_end + 1:
+                    return
+            else:
+                body_end = self.buffer.find(b"\x00", body_start)
+                if body_end < 0:
+                    return
+            body = bytes(self.buffer[body_start:body_end])
+            del self.buffer[: body_end + 1]
+            yield command, headers, body
+
+
+class _Connection(socketserver.BaseRequestHandler):
+
+    def setup(self):
+        self.lock = threading.Lock()
+
+    def send_frame(self, command, headers=None, body=b""):
+        data = encode_frame(command, headers, body)
+        with self.lock:
+            self.request.sendall(data)
+
+    def handle(self):
+        broker = self.server.broker
+        reader = FrameReader()
+        try:
+            while True:
+                data = self.request.recv(65536)
+                if not data:
+                    return
+                reader.feed(data)
+                for command, headers, body in reader.frames():
+                    if command in ("CONNECT", "STOMP"):
+                        version = "1.2" if "1.2" in headers.get("accept-version", "1.0") else "1.1"
+                        self.send_frame(
+                            "CONNECTED", {"version": version, "heart-beat": "0,0", "server": "retico-local"}
+                        )
+                        continue
+                    if command == "SUBSCRIBE":
+                        broker._subscribe(self, headers["destination"], headers.get("id", headers["destination"]))
+                    elif command == "UNSUBSCRIBE":
+                        broker._unsubscribe(self, headers.get("id", headers.get("destination")))
+                    elif command == "SEND":
+                        extra = {
+                            k: v for k, v in headers.items() if k not in ("destination", "content-length", "receipt")
+                        }
+                        broker.publish(headers["destination"], body, extra)
+                    if "receipt" in headers:
+                        self.send_frame("RECEIPT", {"receipt-id": headers["receipt"]})
+                    if command == "DISCONNECT":
+                        return
+        except OSError:
+            return
+        finally:
+            broker._drop(self)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class LocalStompBroker:
+    """In-process STOMP broker listening on `host`:`port` (a free port if 0).
+
+    Use it as a context manager, or call `start` and `stop`.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        self.nb_messages = 0
+        self.nb_bytes = 0
+        self._server = None
+        self._subscribers = dict()
+        self._listeners = dict()
+        self._lock = threading.Lock()
+        self._message_ids = itertools.count()
+
+    def start(self):
+        self._server = _Server((self.host, self.port), _Connection)
+        self._server.broker = self
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            with self._lock:
+                connections = {connection for connection, _ in itertools.chain(*self._subscribers.values())}
+            for connection in connections:
+                try:
+                    connection.request.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def add_listener(self, destination, callback):
+        """Call `callback(body, headers)` for every message sent to `destination`."""
+        with self._lock:
+            self._listeners.setdefault(destination, []).append(callback)
+
+    def publish(self, destination, body, headers=None):
+        """Deliver a message to every subscriber and listener of `destination`."""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        with self._lock:
+            self.nb_messages += 1
+            self.nb_bytes += len(body)
+            subscribers = list(self._subscribers.get(destination, []))
+            listeners = list(self._listeners.get(destination, []))
+        for connection, subscription_id in subscribers:
+            message_headers = dict(headers or {})
+            message_headers.update(
+                {
+                    "destination": destination,
+                    "message-id": next(self._message_ids),
+                    "subscription": subscription_id,
+                }
+            )
+            try:
+                connection.send_frame("MESSAGE", message_headers, body)
+            except OSError:
+                self._drop(connection)
+        for callback in listeners:
+            callback(body, dict(headers or {}))
+
+    def _subscribe(self, connection, destination, subscription_id):
+        with self._lock:
+            self._subscribers.setdefault(destination, []).append((connection, subscription_id))
+
+    def _unsubscribe(self, connection, subscription_id):
+        with self._lock:
+            for destination, subscribers in self._subscribers.items():
+                self._subscribers[destination] = [s for s in subscribers if s != (connection, subscription_id)]
+
+    def _drop(self, connection):
+        with self._lock:
+            for destination, subscribers in self._subscribers.items():
+                self._subscribers[destination] = [s for s in subscribers if s[0] is not connection]
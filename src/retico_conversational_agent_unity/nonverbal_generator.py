@@ -1,15 +1,28 @@
+import functools
 import io
+import itertools
 import json
-import os
-import pathlib
 import threading
 import time
-import wave
 
 import retico_core
 from retico_amq import GestureIU
 from retico_conversational_agent import DMIU, TextAlignedAudioIU
 
+from . import audio_codecs, audio_utils, lipsync
+from . import latency_tracker as latency
+from .cancellation import ClauseCancelled, TurnCancellations
+from .filler_cache import FILLER_TURN_ID
+from .hot_logging import HotPathLogger
+from .inbox import Inbox, PriorityInbox
+from .turn_index import TurnIndex
+from .wav_writer import WavFileWriter
+from .word_timings import WordTimings
+
+# lanes of the output of the NonverbalGenerator : the ends of turns are sent ahead of the audio clauses
+CONTROL_LANE = 0
+AUDIO_LANE = 1
+
 
 class NonverbalGeneratorModule(retico_core.abstract.AbstractModule):
     """A Module producing audio action from TextAlignedAudioIUs from TTS."""
@@ -30,14 +43,82 @@ class NonverbalGeneratorModule(retico_core.abstract.AbstractModule):
     def output_iu():
         return GestureIU
 
-    def __init__(self, tts_framerate=48000, samplewidth=2, channels=1, store_audio=False, **kwargs):
+    def __init__(
+        self,
+        tts_framerate=48000,
+        samplewidth=2,
+        channels=1,
+        store_audio=False,
+        stream_chunk_duration=None,
+        wav_writer=None,
+        shared_audio_ring=None,
+        lipsync=False,
+        lipsync_visemes=False,
+        codec=None,
+        latency_tracker=None,
+        session_id=None,
+        filler_cache=None,
+        filler_synthesizer=None,
+        filler_triggers=None,
+        voice="default",
+        playback_scheduler=None,
+        clause_batcher=None,
+        **kwargs,
+    ):
         """
         Initialize the NonverbalGenerator Module.
+
+        Args:
+            stream_chunk_duration (float, optional): if set (in seconds), each clause is sent to Unity as a
+                sequence of GestureIUs carrying sub-chunks of at least this duration, instead of one GestureIU
+                carrying the whole clause. Only available when store_audio is False.
+            wav_writer (WavFileWriter, optional): background writer of the clause files when store_audio is True,
+                sets the folder, file names and retention policy. Defaults to a WavFileWriter writing in the
+                package's wav_files folder.
+            shared_audio_ring (SharedAudioRing, optional): if set (and store_audio is False), the clause audio is
+                written in this memory-mapped ring and the audio actions carry a "shm" reference to it instead of
+                the audio "bytes", for a Unity reader running on the same host. The ring is closed, and its file
+                removed, when the module shuts down.
+            lipsync (bool): if True, each clause carries mouth blendshapes computed from the energy of its audio.
+            lipsync_visemes (bool): if True, the lipsync blendshapes also include coarse viseme classes.
+            codec (str or AudioCodec, optional): codec applied to the clause audio sent as bytes or through the
+                shared audio ring ("wav", "wav_downsample", "ulaw", "delta_zlib"). The audio action then carries a
+                "codec" descriptor telling Unity how to decode it. Audio files of store_audio stay in WAV.
+            latency_tracker (LatencyTracker, optional): if set, stamps the arrival of each clause from the TTS and
+                the emission of its GestureIU.
+            session_id (str, optional): ID of the avatar session this module generates the behavior of, set as the
+                sessionID of every GestureIU, so that one UnityCommunicatorModule can serve several avatars.
+            filler_cache (FillerAudioCache, optional): cache of the encoded clauses of filler phrases, filled with the
+                clauses of these phrases encoded by the module, and sent instantly by `send_filler`. Saved to its
+                path on shutdown. Only available when store_audio is False.
+            filler_synthesizer (Callable[[str], list], optional): synthesizes a phrase into TextAlignedAudioIU-like
+                objects (raw_audio, grounded_word, rate...), used to warm the filler cache in the background when
+                the module starts.
+            filler_triggers (dict, optional): {DMIU action or event: phrase}, the filler phrase sent when the
+                module receives a DMIU with this action or event (e.g. an acknowledgement at the user's end of
+                turn).
+            voice (str): voice of the TTS, part of the filler cache keys.
+            playback_scheduler (PlaybackScheduler, optional): if set, each clause is dispatched as soon as it is
+                ready, with the delay after which Unity should start it so that it follows the previous clause
+                without gap. The scheduler must also be given to the UnityCommunicatorModule, which relays Unity's
+                start acks to it.
+            clause_batcher (ClauseBatcher, optional): if set, consecutive short clauses of a turn are merged into
+                one multi-audio GestureIU, within the batcher's time window or while Unity is busy playing the
+                previous clauses. Only available when store_audio is False and stream_chunk_duration isn't set.
         """
         super().__init__(**kwargs)
+        # per-IU logs, filtered and sampled before their arguments are built, emitted by a background thread
+        self.hot_logger = HotPathLogger(self.terminal_logger, module=self.name())
         self._thread_active = False
         self.cpt = 0
-        self.clause_ius_buffer = []
+        self.clause_ius_buffer = Inbox()
+        # GestureIUs waiting to be sent, the control lane being served first
+        self.output_buffer = PriorityInbox(nb_lanes=2)
+        # last clause received from the TTS of each turn being generated, carried by the final GestureIU
+        self.last_clause_each_turn = TurnIndex()
+        # cancelled on a hard interruption, aborting the clauses of the turn being encoded or waiting to be sent
+        self.cancellations = TurnCancellations()
+        self.nb_cancelled_clauses = 0
         self.tts_framerate = tts_framerate
         self.samplewidth = samplewidth
         self.channels = channels
@@ -45,15 +126,49 @@ class NonverbalGeneratorModule(retico_core.abstract.AbstractModule):
         self.interrupted_turn = -1
         self.current_turn_id = -1
         self.store_audio = store_audio
+        self.stream_chunk_duration = stream_chunk_duration
+        self.wav_writer = wav_writer
+        self.shared_audio_ring = shared_audio_ring
+        self.lipsync = lipsync
+        self.lipsync_visemes = lipsync_visemes
+        self.codec = audio_codecs.get_codec(codec)
+        self.latency_tracker = latency_tracker
+        self.session_id = session_id
+        self.filler_cache = filler_cache
+        self.filler_synthesizer = filler_synthesizer
+        self.filler_triggers = filler_triggers if filler_triggers is not None else dict()
+        self.voice = voice
+        self.nb_fillers = 0
+        self.playback_scheduler = playback_scheduler
+        self.clause_batcher = clause_batcher
+        # clause received while coalescing, that couldn't join the batch
+        self._next_clause_ius = None
+        if self.store_audio and self.wav_writer is None:
+            self.wav_writer = WavFileWriter()
 
     def prepare_run(self):
         super().prepare_run()
         self._thread_active = True
+        self.clause_ius_buffer.reopen()
+        self.output_buffer.reopen()
+        if self.wav_writer is not None:
+            self.wav_writer.start()
+        if self.filler_cache is not None and self.filler_synthesizer is not None:
+            threading.Thread(target=self.warm_filler_cache, daemon=True).start()
         threading.Thread(target=self._nvg_thread).start()
+        threading.Thread(target=self._output_thread).start()
 
     def shutdown(self):
         super().shutdown()
         self._thread_active = False
+        self.clause_ius_buffer.close()
+        self.output_buffer.close()
+        if self.wav_writer is not None:
+            self.wav_writer.shutdown()
+        if self.shared_audio_ring is not None:
+            self.shared_audio_ring.close(unlink=True)
+        if self.filler_cache is not None and self.filler_cache.path is not None:
+            self.filler_cache.save()
 
     def process_update(self, update_message):
         clause_ius = []
@@ -66,8 +181,9 @@ class NonverbalGeneratorModule(retico_core.abstract.AbstractModule):
                     if iu.action == "hard_interruption":
                         self.file_logger.info("hard_interruption")
                         self.interrupted_turn = self.current_turn_id
+                        self.cancel_turn(self.interrupted_turn)
                         self.first_clause = True
-                        self.clause_ius_buffer = []
+                        self.clear_audio()
                     elif iu.action == "soft_interruption":
                         self.file_logger.info("soft_interruption")
                     elif iu.action == "stop_turn_id":
@@ -80,130 +196,335 @@ class NonverbalGeneratorModule(retico_core.abstract.AbstractModule):
                         self.file_logger.info("stop_turn_id")
                         if iu.turn_id > self.current_turn_id:
                             self.interrupted_turn = self.current_turn_id
+                            self.cancel_turn(self.interrupted_turn)
                         self.first_clause = True
-                        self.clause_ius_buffer = []
+                        self.clear_audio()
                     if iu.event == "user_BOT_same_turn":
+                        if self.interrupted_turn is not None:
+                            self.cancellations.renew(self.interrupted_turn)
                         self.interrupted_turn = None
+                    filler = self.filler_triggers.get(iu.action) or self.filler_triggers.get(iu.event)
+                    if filler is not None:
+                        self.send_filler(filler)
         if len(clause_ius) != 0:
-            self.clause_ius_buffer.append(clause_ius)
+            self.enqueue_clause(clause_ius)
+
+    def enqueue_clause(self, clause_ius):
+        """Hand the TTS IUs of a clause over to the encoding thread. The end of a turn isn't encoded : its final
+        GestureIU is sent right away, through the control lane."""
+        turn_id = clause_ius[-1].turn_id
+        if getattr(clause_ius[0], "final", False):
+            self.end_turn(turn_id)
+            return
+        self.stamp(latency.TTS_ARRIVAL, turn_id, clause_ius[-1].clause_id)
+        self.last_clause_each_turn[turn_id] = clause_ius[-1].clause_id
+        self.clause_ius_buffer.put(clause_ius)
+
+    def end_turn(self, turn_id):
+        """Send the final GestureIU of a turn ahead of its clauses still being encoded or queued. It carries the
+        clauseID of the last clause of the turn, so that the end of turn doesn't depend on the order in which
+        the UnityCommunicatorModule receives them."""
+        self.hot_logger.info("agent_EOT")
+        self.file_logger.info("EOT")
+        output_iu = self.create_iu(
+            turnID=turn_id,
+            clauseID=self.last_clause_each_turn.pop(turn_id, None),
+            final=True,
+            **self.session_fields(),
+        )
+        self.output_buffer.put(output_iu, lane=CONTROL_LANE)
+
+    def cancel_turn(self, turn_id):
+        """Cancel the clauses of an interrupted turn. The filler turn is never cancelled (its queued clauses are
+        dropped by `clear_audio`), it is also the current turn before the first generated one."""
+        if turn_id != FILLER_TURN_ID:
+            self.cancellations.cancel(turn_id)
+
+    def clear_audio(self):
+        """Drop the clauses waiting to be encoded or sent, and forget the playback timeline."""
+        self.clause_ius_buffer.clear()
+        # the clause the batcher took from the buffer but left for the next batch
+        self._next_clause_ius = None
+        self.output_buffer.clear(lane=AUDIO_LANE)
+        self.reset_playback()
 
     def _nvg_thread(self):
-        # The module doesn't send enough audio to have a continous signal, it's just a test module
-        # If you want the module to send continous signal, change the time.sleep to time.sleep(self.frame_length), or the frame_length to 10
+        # blocks until process_update hands over a clause, or until shutdown closes the buffer
         while self._thread_active:
-            if len(self.clause_ius_buffer) == 0:
-                time.sleep(0.1)
+            clause_ius, self._next_clause_ius = self._next_clause_ius, None
+            if clause_ius is None:
+                clause_ius = self.clause_ius_buffer.get()
+            if clause_ius is not None:
+                try:
+                    self.process_clause(clause_ius)
+                except ClauseCancelled as e:
+                    # the turn was interrupted while the clause was being encoded
+                    self.nb_cancelled_clauses += 1
+                    self.hot_logger.info("clause cancelled", turn_id=e.turn_id, clause_id=clause_ius[-1].clause_id)
+
+    def process_clause(self, clause_ius):
+        """Encode a clause and queue its GestureIUs, raises ClauseCancelled if its turn is cancelled meanwhile."""
+        turn_id = clause_ius[-1].turn_id
+        self.cancellations.token(turn_id).check()
+        self.hot_logger.info("EOC NV")
+        if self.first_clause or turn_id != self.current_turn_id:
+            self.terminal_logger.info("start_answer_generation")
+            self.file_logger.info("start_answer_generation")
+            self.first_clause = False
+        self.current_turn_id = turn_id
+        if self.store_audio:
+            output_ius = [self.generate_nonverbal_one_clause_audio_file(clause_ius)]
+        elif self.stream_chunk_duration:
+            # lazily encoded : each sub-chunk is queued before the next one is encoded
+            output_ius = self.generate_nonverbal_one_clause_audio_stream(clause_ius)
+        elif self.clause_batcher is not None:
+            output_ius = self.generate_nonverbal_coalesced_clauses(clause_ius)
+        else:
+            output_ius = [self.generate_nonverbal_one_clause_audio_bytes(clause_ius)]
+        self.file_logger.info("send_clause")
+
+        for output_iu in output_ius:
+            if self.store_audio:
+                # queued once its file, and the files of every previous clause, are written
+                self.wav_writer.call_in_order(functools.partial(self.output_buffer.put, output_iu))
             else:
-                clause_ius = self.clause_ius_buffer.pop(0)
-                if hasattr(clause_ius[0], "final") and clause_ius[0].final:
-                    self.terminal_logger.info("agent_EOT")
-                    self.file_logger.info("EOT")
-                    output_iu = self.create_iu(
-                        turnID=clause_ius[0].turn_id,
-                        final=True,
-                    )
-                    self.first_clause = True
-                else:
-                    self.terminal_logger.info("EOC NV")
-                    if self.first_clause:
-                        self.terminal_logger.info("start_answer_generation")
-                        self.file_logger.info("start_answer_generation")
-                        self.first_clause = False
-                    self.current_turn_id = clause_ius[-1].turn_id
-                    if self.store_audio:
-                        output_iu = self.generate_nonverbal_one_clause_audio_file(clause_ius)
-                    else:
-                        output_iu = self.generate_nonverbal_one_clause_audio_bytes(clause_ius)
-                    self.file_logger.info("send_clause")
-
-                um = retico_core.UpdateMessage()
-                um.add_iu(output_iu, retico_core.UpdateType.ADD)
-                self.append(um)
-                self.terminal_logger.info(
-                    "NonverbalGenerator creates a retico IU",
-                )
+                self.output_buffer.put(output_iu)
+
+    def _output_thread(self):
+        # sends the GestureIUs, the ends of turns first, then the clauses in order, except the clauses of an
+        # interrupted turn encoded meanwhile
+        while self._thread_active:
+            output_iu = self.output_buffer.get()
+            if output_iu is None:
+                continue
+            if not output_iu.final and self.cancellations.cancelled(output_iu.turnID):
+                self.nb_cancelled_clauses += 1
+                continue
+            self.send_iu(output_iu)
+
+    def send_iu(self, output_iu):
+        if self.playback_scheduler is not None and not output_iu.final:
+            self.schedule_playback(output_iu)
+        um = retico_core.UpdateMessage()
+        um.add_iu(output_iu, retico_core.UpdateType.ADD)
+        self.append(um)
+        if not output_iu.final:
+            for clause_id in getattr(output_iu, "clauseIDs", None) or [output_iu.clauseID]:
+                self.stamp(latency.GESTURE_EMIT, output_iu.turnID, clause_id)
+        self.hot_logger.info("NonverbalGenerator creates a retico IU")
+
+    def reset_playback(self):
+        if self.playback_scheduler is not None:
+            self.playback_scheduler.reset()
+
+    def schedule_playback(self, output_iu):
+        """Delay the actions of a clause so that Unity starts it when the previous one ends."""
+        animations = getattr(output_iu, "animations", None) or []
+        duration = animations[0]["duration"] if animations else 0.0
+        delay = self.playback_scheduler.schedule(output_iu.turnID, output_iu.clauseID, duration)
+        output_iu.interrupt = self.playback_scheduler.interrupt
+        blendshapes = getattr(output_iu, "blendshapes", None) or []
+        for action in itertools.chain(output_iu.audios, animations, blendshapes):
+            action["delay"] = action.get("delay", 0.0) + delay
+
+    def stamp(self, stage, turn_id, clause_id):
+        if self.latency_tracker is not None:
+            self.latency_tracker.stamp(stage, latency.turn_key(turn_id, self.session_id), clause_id)
+
+    def session_fields(self):
+        """Fields identifying the avatar session, added to every GestureIU."""
+        return dict(sessionID=self.session_id) if self.session_id is not None else dict()
 
     def generate_nonverbal_one_clause_audio_file(self, clause_ius):
-        # recreate full audio
-        full_data = b""
-        full_sentence = ""
-        for iu in clause_ius:
-            full_data += bytes(iu.raw_audio)
-            full_sentence += iu.grounded_word
-        len_audio_bytes = len(full_data)
+        iu = clause_ius[-1]
+        token = self.cancellations.token(iu.turn_id)
+        # recreate full audio, with its WAV header
+        full_data, header_size = audio_utils.assemble_audio(
+            [iu.raw_audio for iu in clause_ius],
+            sample_rate=self.tts_framerate,
+            num_channels=self.channels,
+            sampwidth=self.samplewidth,
+            token=token,
+        )
+        word_timings = WordTimings.from_ius(clause_ius, self.tts_framerate * self.samplewidth * self.channels)
+        len_audio_bytes = len(full_data) - header_size
         len_audio_seconds = len_audio_bytes / (self.tts_framerate * self.samplewidth)
-        # self.terminal_logger.info(f"len_audio {len_audio_bytes} {len_audio_seconds} {full_sentence}", debug=True)
-
-        # save full audio into wav file
-        current_local_path = pathlib.Path(__file__).parent.resolve()
-        folder_path = f"{current_local_path}/wav_files/"
-        filename = f"clause_{clause_ius[0].clause_id}.wav"
-        path = folder_path + filename
-        if not os.path.exists(folder_path):
-            os.makedirs(folder_path)
-        with wave.open(path, "wb") as wav_file:
-            wav_file.setnchannels(self.channels)  # Set the number of channels
-            wav_file.setsampwidth(self.samplewidth)  # Set the sample width in bytes
-            wav_file.setframerate(self.tts_framerate)  # Set the frame rate (sample rate)
-            wav_file.writeframes(full_data)  # Write the audio byte data
 
         # create audio action for AMQ
-        interrupt = 2
         audios = [
             {
-                "path": path,
-                "transcription": "TEST DEMO",
+                "path": self.wav_writer.path(iu.turn_id, iu.clause_id),
+                "transcription": word_timings.transcription,
                 "volume": 1,
                 # "delay": 0,
-                # "Timing Index": 0
+                **word_timings.audio_fields(),
             },
         ]
-        animations = [
-            {
-                "animation": "talking_4",
-                "duration": len_audio_seconds,
-                "delay": 0.0,
-            },
-        ]
-        output_iu = self.create_iu(
-            interrupt=interrupt,
-            turnID=iu.turn_id,
-            clauseID=iu.clause_id,
-            audios=audios,
-            animations=animations,
+
+        # save full audio into wav file, in the background. If the file can't be written, the audio is sent in the
+        # GestureIU instead (the IU is queued after the commit of its file, see process_clause)
+        token.check()
+        self.wav_writer.write(
+            full_data,
+            iu.turn_id,
+            iu.clause_id,
+            on_failed=lambda e: self.send_audio_inline(audios[0], full_data),
+        ).add_done_callback(self._log_write_error)
+        actions = self.clause_actions(
+            audios,
+            len_audio_seconds,
+            word_timings,
+            pcm=memoryview(full_data)[header_size:],
+            rate=self.tts_framerate,
+            sampwidth=self.samplewidth,
         )
-        return output_iu
+        return self.create_clause_iu(clause_ius, actions)
 
-    def generate_nonverbal_one_clause_audio_bytes(self, clause_ius):
-        # recreate full audio
-        full_data = b""
-        full_sentence = ""
-        for iu in clause_ius:
-            full_data += bytes(iu.raw_audio)
-            full_sentence += iu.grounded_word
-        len_audio_bytes = len(full_data)
-        len_audio_seconds = len_audio_bytes / (self.tts_framerate * self.samplewidth)
-        # self.terminal_logger.info(f"len_audio {len_audio_bytes} {len_audio_seconds} {full_sentence}", debug=True)
+    def send_audio_inline(self, audio, data):
+        """Replace the path of an audio action, whose file couldn't be written, by the audio itself."""
+        del audio["path"]
+        self.attach_payload(audio, data)
+
+    def _log_write_error(self, future):
+        if future.exception() is not None:
+            self.terminal_logger.error("failed to write clause audio file", exception=repr(future.exception()))
+
+    def generate_nonverbal_one_clause_audio_stream(self, clause_ius):
+        """Split the clause into consecutive groups of TTS IUs holding at least `stream_chunk_duration` seconds
+        of audio, and yield one GestureIU per group as soon as it is encoded. Each audio action carries its
+        `chunkIndex` in the clause and a `lastChunk` flag so that Unity can play them back to back."""
+        rate = clause_ius[0].rate if clause_ius[0].rate else self.tts_framerate
+        sampwidth = clause_ius[0].sample_width if clause_ius[0].sample_width else self.samplewidth
+        chunk_size = int(self.stream_chunk_duration * rate) * sampwidth * self.channels
+        chunk_ius, chunk_bytes, chunk_index = [], 0, 0
+        for i, iu in enumerate(clause_ius):
+            chunk_ius.append(iu)
+            chunk_bytes += memoryview(iu.raw_audio).nbytes
+            last_chunk = i == len(clause_ius) - 1
+            if chunk_bytes >= chunk_size or last_chunk:
+                yield self.generate_nonverbal_one_clause_audio_bytes(
+                    chunk_ius, chunk_index=chunk_index, last_chunk=last_chunk
+                )
+                chunk_ius, chunk_bytes = [], 0
+                chunk_index += 1
 
-        # convert audio_bytes to make it possible to play in Unity
-        full_data = retico_core.audio.convert_audio_PCM16_to_WAVPCM16(
-            raw_audio=full_data,
-            sample_rate=clause_ius[0].rate if clause_ius[0].rate else self.tts_framerate,
+    def generate_nonverbal_one_clause_audio_bytes(self, clause_ius, chunk_index=None, last_chunk=True):
+        actions, payload, _ = self.encode_clause(clause_ius, chunk_index, last_chunk)
+        if chunk_index is None:
+            self.offer_filler(actions, payload)
+        self.attach_payload(actions["audios"][0], payload)
+        return self.create_clause_iu(clause_ius, actions)
+
+    def generate_nonverbal_coalesced_clauses(self, clause_ius):
+        """Encode a clause and, if it is short, the next short clauses of its turn received before the batcher's
+        deadline, and merge them into one GestureIU (see ClauseBatcher). Whether a clause can join the batch is
+        decided from its duration, before it is encoded : the first clause that can't is processed next."""
+        batch = [self.encode_for_batch(clause_ius)]
+        deadline = self.clause_batcher.deadline(self.playback_scheduler)
+        turn_id = clause_ius[-1].turn_id
+        token = self.cancellations.token(turn_id)
+        while self.clause_batcher.is_short(batch[-1][2]) and self._thread_active and not token.cancelled:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            next_clause_ius = self.clause_ius_buffer.get(timeout=remaining)
+            if next_clause_ius is None:
+                continue
+            if next_clause_ius[-1].turn_id != turn_id:
+                self._next_clause_ius = next_clause_ius
+                break
+            duration = self.clause_duration(next_clause_ius)
+            if not self.clause_batcher.is_short(duration) or not self.clause_batcher.accepts(
+                [encoded[2] for encoded in batch], duration
+            ):
+                self._next_clause_ius = next_clause_ius
+                break
+            batch.append(self.encode_for_batch(next_clause_ius))
+        token.check()
+        if len(batch) == 1:
+            return [self.create_clause_iu(batch[0][3], batch[0][1])]
+        clauses = [(clause_id, actions, duration) for clause_id, actions, duration, _ in batch]
+        return [self.create_clause_iu(batch[-1][3], self.clause_batcher.merge(clauses))]
+
+    def clause_duration(self, clause_ius):
+        """Duration of the audio of a clause, the duration of its talking animation (see `encode_clause`)."""
+        return sum(memoryview(iu.raw_audio).nbytes for iu in clause_ius) / (self.tts_framerate * self.samplewidth)
+
+    def encode_for_batch(self, clause_ius):
+        """Encode a clause with its audio attached, returns (clause ID, actions, duration, clause IUs)."""
+        actions, payload, _ = self.encode_clause(clause_ius)
+        self.offer_filler(actions, payload)
+        self.attach_payload(actions["audios"][0], payload)
+        return clause_ius[-1].clause_id, actions, actions["animations"][0]["duration"], clause_ius
+
+    def offer_filler(self, actions, payload):
+        """Cache an encoded clause if its text is one of the filler phrases. Like in `send_filler` and
+        `warm_filler_cache`, the entries are keyed by `tts_framerate`."""
+        if self.filler_cache is not None:
+            text = actions["audios"][0]["transcription"]
+            self.filler_cache.offer(text, self.voice, self.tts_framerate, actions, payload)
+
+    def encode_clause(self, clause_ius, chunk_index=None, last_chunk=True):
+        """Assemble and encode the audio of a clause, and build its actions.
+
+        Returns:
+            tuple: the actions (whose audio action doesn't carry the audio yet, see `attach_payload`), the encoded
+            audio payload, and its sample rate.
+        """
+        rate = clause_ius[0].rate if clause_ius[0].rate else self.tts_framerate
+        sampwidth = clause_ius[0].sample_width if clause_ius[0].sample_width else self.samplewidth
+        token = self.cancellations.token(clause_ius[-1].turn_id)
+        # recreate full audio, with a WAV header to make it possible to play in Unity
+        full_data, header_size = audio_utils.assemble_audio(
+            [iu.raw_audio for iu in clause_ius],
+            sample_rate=rate,
             num_channels=self.channels,
-            sampwidth=clause_ius[0].sample_width if clause_ius[0].sample_width else self.samplewidth,
+            sampwidth=sampwidth,
+            token=token,
         )
+        word_timings = WordTimings.from_ius(clause_ius, rate * sampwidth * self.channels)
+        len_audio_bytes = len(full_data) - header_size
+        len_audio_seconds = len_audio_bytes / (self.tts_framerate * self.samplewidth)
 
         # create audio action for AMQ
-        interrupt = 2
         audios = [
             {
-                "bytes": full_data,
-                "transcription": "TEST DEMO",
+                "transcription": word_timings.transcription,
                 "volume": 1,
                 # "delay": 0,
-                # "Timing Index": 0
+                **word_timings.audio_fields(),
             },
         ]
+        payload = full_data
+        if self.codec is not None:
+            token.check()
+            payload, audios[0]["codec"] = self.codec.encode(full_data, header_size, rate, self.channels, sampwidth)
+        if chunk_index is not None:
+            audios[0]["chunkIndex"] = chunk_index
+            audios[0]["lastChunk"] = last_chunk
+        actions = self.clause_actions(
+            audios,
+            len_audio_seconds,
+            word_timings,
+            pcm=memoryview(full_data)[header_size:],
+            rate=rate,
+            sampwidth=sampwidth,
+        )
+        # before the payload is attached (written in the shared audio ring)
+        token.check()
+        return actions, payload, rate
+
+    def attach_payload(self, audio, payload):
+        """Add the encoded audio to an audio action, through the shared audio ring if there is one."""
+        if self.shared_audio_ring is not None:
+            audio["shm"] = self.shared_audio_ring.write(payload)
+        else:
+            audio["bytes"] = payload
+
+    def clause_actions(self, audios, len_audio_seconds, word_timings, pcm, rate, sampwidth):
+        """Actions of a clause's GestureIU : its audio actions, the animations, the start time of each word
+        (`timings`, indexed by Unity's timingIndex) and, if lipsync is enabled, the mouth blendshapes computed from
+        the clause `pcm`."""
         animations = [
             {
                 "animation": "talking_4",
@@ -211,15 +532,71 @@ class NonverbalGeneratorModule(retico_core.abstract.AbstractModule):
                 "delay": 0.0,
             },
         ]
+        actions = dict(audios=audios, animations=animations, timings=word_timings.starts)
+        if self.lipsync:
+            actions["blendshapes"] = lipsync.compute_mouth_blendshapes(
+                pcm,
+                sample_rate=rate,
+                sampwidth=sampwidth,
+                channels=self.channels,
+                visemes=self.lipsync_visemes,
+            )
+        return actions
+
+    def create_clause_iu(self, clause_ius, actions):
+        """Create the GestureIU of a clause from its actions (see `clause_actions`)."""
+        iu = clause_ius[-1]
+        interrupt = 2
         output_iu = self.create_iu(
             interrupt=interrupt,
             turnID=iu.turn_id,
             clauseID=iu.clause_id,
-            audios=audios,
-            animations=animations,
+            **actions,
+            **self.session_fields(),
         )
         return output_iu
 
+    def send_filler(self, text, turn_id=FILLER_TURN_ID):
+        """Send the cached clause of a filler phrase to Unity without waiting for the TTS, e.g. as an acknowledgement
+        while the LLM is still generating. The clause goes through the audio lane of the output, behind the clauses
+        already encoded.
+
+        Fillers are sent as the clauses of `turn_id` (FILLER_TURN_ID by default, a turn that never ends, so that
+        they don't interfere with the clause indexes of the generated turns), each with a new clause ID.
+
+        Returns:
+            bool: False if the phrase isn't cached.
+        """
+        if self.filler_cache is None or self.store_audio:
+            return False
+        entry = self.filler_cache.get(text, self.voice, self.tts_framerate)
+        if entry is None:
+            return False
+        actions = entry.clause_actions()
+        self.attach_payload(actions["audios"][0], entry.payload)
+        self.nb_fillers += 1
+        output_iu = self.create_iu(
+            interrupt=2,
+            turnID=turn_id,
+            clauseID=self.nb_fillers,
+            **actions,
+            **self.session_fields(),
+        )
+        self.hot_logger.info("send filler", text=text)
+        # queued after the clauses already encoded, and dropped with them if the agent is interrupted
+        self.output_buffer.put(output_iu)
+        return True
+
+    def warm_filler_cache(self):
+        """Cache the filler phrases missing from the cache, synthesized by `filler_synthesizer`."""
+
+        def build(text):
+            actions, payload, _ = self.encode_clause(self.filler_synthesizer(text))
+            return actions, payload
+
+        self.filler_cache.warm(build, self.voice, self.tts_framerate)
+        self.hot_logger.info("filler cache warmed", lambda: self.filler_cache.metrics())
+
     def create_iu_from_dict(self, dict):
         return self.create_iu(**dict)
 
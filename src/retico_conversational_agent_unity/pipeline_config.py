@@ -0,0 +1,435 @@
+"""
+Pipeline config
+===============
+
+Builds a dialog system from a declarative config (JSON, or YAML if PyYAML
+is installed) instead of hard-coded wiring : the modules to instantiate
+and their arguments (which is also how perf features such as audio
+streaming, codecs or the number of UnityCommunicator workers are enabled),
+the connections between them, and the AMQ routes. Configs are validated
+when loaded, before any model is loaded.
+
+    {
+        "logging": {"folder": "logs/run", "filters": [[["level", ["warning", "error"]]]],
+                    "sampling": {"process_update": 100}},
+        "plot": {"config_path": "configs/plot_config_DM.json", "live": true},
+        "objects": {
+            "dialogue_history": {"class": "retico_conversational_agent.DialogueHistory",
+                                 "positional": ["configs/prompt_format_config.json"],
+                                 "args": {"terminal_logger": "$terminal_logger"}}
+        },
+        "modules": {
+            "tts": {"class": "retico_conversational_agent.TtsDmModule", "args": {"device": "$device"},
+                    "background": true},
+            "nvg": {"class": "retico_conversational_agent_unity.NonverbalGeneratorModule",
+                    "args": {"stream_chunk_duration": 0.2, "codec": "ulaw"}},
+            "dm": {"class": "retico_conversational_agent.DialogueManagerModule",
+                   "calls": ["add_repeat_policy"]},
+            ...
+        },
+        "connections": [["tts", "nvg"], ...],
+        "amq": {"ip": "localhost", "port": "61613",
+                "out": [{"module": "unity_comm", "destination": "/topic/retico_out"}],
+                "in": [{"destination": "/topic/unity_out",
+                        "iu_type": "retico_conversational_agent_unity.UnityMessageIU",
+                        "subscribers": ["unity_comm"]}]}
+    }
+
+Argument values starting with "$" reference an object of the "objects"
+section (created in order), or a built-in value : "$device" ("cuda" if
+available, "cpu" otherwise) and "$terminal_logger". Modules with
+"background": true are created and set up in background threads while the
+rest of the network comes up (see startup.ParallelLoader).
+"""
+
+import functools
+import importlib
+import importlib.util
+import inspect
+import json
+import os
+import sys
+import warnings
+
+from . import audio_codecs, hot_logging
+from .startup import ParallelLoader, StartupTimer, run_modules
+
+try:
+    import yaml
+except ImportError:  # JSON configs only
+    yaml = None
+
+BUILTIN_REFERENCES = ("device", "terminal_logger")
+SECTIONS = ("logging", "plot", "objects", "modules", "connections", "amq")
+
+
+class PipelineConfigError(ValueError):
+    """Invalid pipeline config, `errors` lists every problem found."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("invalid pipeline config :\n" + "\n".join(f"  - {error}" for error in errors))
+
+
+def load_config(path, validate=True):
+    """Load a pipeline config from a JSON or YAML file, and validate it (see `validate_config`)."""
+    with open(path, encoding="utf-8") as f:
+        if os.path.splitext(path)[1] in (".yaml", ".yml"):
+            if yaml is None:
+                raise ImportError(f"PyYAML is required to load {path}")
+            config = yaml.safe_load(f)
+        else:
+            config = json.load(f)
+    if validate:
+        for warning in validate_config(config):
+            warnings.warn(warning)
+    return config
+
+
+def import_object(path):
+    """Import a class from its dotted path, e.g. "retico_conversational_agent.TtsDmModule"."""
+    module_name, _, name = path.rpartition(".")
+    if not module_name:
+        raise ImportError(f"{path} is not a dotted path")
+    return getattr(importlib.import_module(module_name), name)
+
+
+def find_object(path):
+    """Find a class from its dotted path without importing its module (only its parent packages).
+
+    Returns:
+        the class if its module is already imported, None otherwise.
+
+    Raises:
+        ImportError: if the module can't be found.
+        AttributeError: if the module is imported and has no such class.
+    """
+    module_name, _, name = path.rpartition(".")
+    if not module_name:
+        raise ImportError(f"{path} is not a dotted path")
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return getattr(module, name)
+    try:
+        found = importlib.util.find_spec(module_name) is not None
+    except (ImportError, ValueError):
+        found = False
+    if not found:
+        raise ImportError(f"no module named {module_name}")
+    return None
+
+
+def _device():
+    import torch
+
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def _references(value):
+    """Names referenced ("$name") in an argument value."""
+    if isinstance(value, str) and value.startswith("$"):
+        yield value[1:]
+    elif isinstance(value, list):
+        for v in value:
+            yield from _references(v)
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from _references(v)
+
+
+def _resolve(value, references):
+    if isinstance(value, str) and value.startswith("$"):
+        # the device is resolved when used, importing torch on the thread creating the module
+        return _device() if value == "$device" else references[value[1:]]
+    if isinstance(value, list):
+        return [_resolve(v, references) for v in value]
+    if isinstance(value, dict):
+        return {k: _resolve(v, references) for k, v in value.items()}
+    return value
+
+
+def _calls(spec):
+    """(method name, kwargs) of the calls made on a module after its creation."""
+    for call in spec.get("calls", []):
+        if isinstance(call, str):
+            yield call, {}
+        else:
+            yield call[0], call[1] if len(call) > 1 else {}
+
+
+def _validate_nonverbal_generator(name, args):
+    errors = []
+    if args.get("store_audio") and args.get("stream_chunk_duration"):
+        errors.append(f"modules.{name} : stream_chunk_duration is only available when store_audio is false")
+    if args.get("store_audio") and args.get("filler_cache"):
+        errors.append(f"modules.{name} : filler_cache is only available when store_audio is false")
+    if args.get("clause_batcher") and (args.get("store_audio") or args.get("stream_chunk_duration")):
+        errors.append(
+            f"modules.{name} : clause_batcher is only available when store_audio and stream_chunk_duration are false"
+        )
+    codec = args.get("codec")
+    if isinstance(codec, str) and codec not in audio_codecs.CODECS:
+        errors.append(f"modules.{name} : unknown codec {codec}, expected one of {list(audio_codecs.CODECS)}")
+    return errors
+
+
+# class name -> checks of the arguments that the signature can't express
+ARGUMENT_VALIDATORS = {"NonverbalGeneratorModule": _validate_nonverbal_generator}
+
+
+def _validate_spec(section, name, spec, known_references, errors):
+    """Check an object or module spec, returns its class if its module is already imported (see `find_object`)."""
+    where = f"{section}.{name}"
+    if not isinstance(spec, dict) or "class" not in spec:
+        errors.append(f'{where} : expected a dict with a "class" key')
+        return None
+    args, positional = spec.get("args", {}), spec.get("positional", [])
+    if not isinstance(args, dict) or not isinstance(positional, list):
+        errors.append(f'{where} : "args" must be a dict and "positional" a list')
+        return None
+    for reference in _references([positional, args]):
+        if reference not in known_references:
+            errors.append(f"{where} : unknown reference ${reference}")
+    try:
+        cls = find_object(spec["class"])
+    except (ImportError, AttributeError) as e:
+        errors.append(f"{where} : can't import {spec['class']} ({e})")
+        return None
+    validator = ARGUMENT_VALIDATORS.get(spec["class"].rpartition(".")[2])
+    if validator is not None:
+        errors.extend(validator(name, args))
+    if cls is None:  # checked when created
+        return None
+    try:
+        inspect.signature(cls).bind(*positional, **args)
+    except TypeError as e:
+        errors.append(f"{where} : invalid arguments for {spec['class']} ({e})")
+    except ValueError:  # no signature available
+        pass
+    for method, _ in _calls(spec):
+        if not callable(getattr(cls, method, None)):
+            errors.append(f"{where} : {spec['class']} has no method {method}")
+    return cls
+
+
+def validate_config(config):
+    """Check a pipeline config before building it : known sections, importable classes, arguments matching the
+    classes' signatures, defined references, connections and AMQ routes between defined modules, and compatible IU
+    types on each connection.
+
+    The modules of the classes aren't imported, as importing e.g. the ASR or TTS modules takes seconds : the checks
+    needing the class itself (arguments, calls and IU types) are only made if its module is already imported. The
+    other classes are checked when created, by the loader workers for the background modules.
+
+    Returns:
+        list: warnings (connections whose IU types don't obviously match).
+
+    Raises:
+        PipelineConfigError: listing every problem found.
+    """
+    if not isinstance(config, dict):
+        raise PipelineConfigError(["the config must be a dict"])
+    errors, iu_warnings = [], []
+    for section in config:
+        if section not in SECTIONS:
+            errors.append(f"unknown section {section}, expected one of {list(SECTIONS)}")
+    if not config.get("modules"):
+        errors.append("no modules defined")
+
+    known_references = set(BUILTIN_REFERENCES)
+    for name, spec in config.get("objects", {}).items():
+        _validate_spec("objects", name, spec, known_references, errors)
+        known_references.add(name)
+
+    classes = dict()
+    for name, spec in config.get("modules", {}).items():
+        classes[name] = _validate_spec("modules", name, spec, known_references, errors)
+
+    for i, connection in enumerate(config.get("connections", [])):
+        if not isinstance(connection, list) or len(connection) != 2:
+            errors.append(f"connections[{i}] : expected [provider, consumer]")
+            continue
+        unknown = [name for name in connection if name not in classes]
+        if unknown:
+            errors.append(f"connections[{i}] : unknown modules {unknown}")
+            continue
+        provider, consumer = (classes[name] for name in connection)
+        if provider is not None and consumer is not None:
+            try:
+                output_iu, input_ius = provider.output_iu(), tuple(consumer.input_ius())
+            except Exception:  # not static methods, can't be checked before creating the modules
+                continue
+            if output_iu is not None and not any(
+                issubclass(output_iu, iu) or issubclass(iu, output_iu) for iu in input_ius
+            ):
+                iu_warnings.append(
+                    f"connections[{i}] : {connection[1]} doesn't take the {output_iu.__name__}s of {connection[0]}"
+                )
+
+    amq = config.get("amq")
+    if amq is not None:
+        for i, route in enumerate(amq.get("out", [])):
+            if route.get("module") not in classes or "destination" not in route:
+                errors.append(f"amq.out[{i}] : expected a defined module and a destination")
+        for i, route in enumerate(amq.get("in", [])):
+            unknown = [name for name in route.get("subscribers", []) if name not in classes]
+            if unknown or "destination" not in route:
+                errors.append(f"amq.in[{i}] : expected a destination and defined subscribers, unknown {unknown}")
+            try:
+                find_object(route.get("iu_type", ""))
+            except (ImportError, AttributeError):
+                errors.append(f"amq.in[{i}] : can't import the iu_type {route.get('iu_type')}")
+
+    if errors:
+        raise PipelineConfigError(errors)
+    return iu_warnings
+
+
+def logging_filters(config):
+    """structlog filters of the "logging" section : its "filters" are the cases of retico's filter_cases."""
+    from retico_core.log_utils import filter_cases
+
+    cases = config.get("logging", {}).get("filters")
+    if cases is None:
+        return []
+    return [functools.partial(filter_cases, cases=[[tuple(condition) for condition in case] for case in cases])]
+
+
+class Pipeline:
+    """A dialog system built from a config, see `build_pipeline`.
+
+    Attributes:
+        modules (dict): the modules, by name.
+        objects (dict): the objects of the "objects" section, by name.
+        timer (StartupTimer): timing of the startup stages.
+    """
+
+    def __init__(self, config, modules, objects, background_modules, terminal_logger, timer):
+        self.config = config
+        self.modules = modules
+        self.objects = objects
+        self.background_modules = background_modules
+        self.terminal_logger = terminal_logger
+        self.timer = timer
+
+    def __getitem__(self, name):
+        return self.modules[name]
+
+    def network_modules(self):
+        """Every module of the network, including the AMQ readers and writers."""
+        from retico_core import network
+
+        return network.discover(list(self.modules.values()))[0]
+
+    def run(self):
+        """Run the network, without setting up again the modules set up during the build."""
+        run_modules(self.network_modules(), self.timer, already_setup=self.network_modules())
+
+    def stop(self):
+        for module in self.network_modules():
+            module.stop()
+
+
+def build_pipeline(config, parallel_startup=True, timer=None):
+    """Instantiate, connect and set up the modules of a (validated) config.
+
+    Args:
+        config (dict): the pipeline config.
+        parallel_startup (bool): if True, the modules marked "background" are created and set up in background
+            threads while the rest of the network comes up.
+        timer (StartupTimer, optional): timer recording the startup stages.
+
+    Returns:
+        Pipeline: the system, ready to run.
+    """
+    import retico_core
+
+    timer = timer if timer is not None else StartupTimer()
+
+    logging_config = config.get("logging", {})
+    filters = logging_filters(config)
+    terminal_logger, _ = retico_core.log_utils.configurate_logger(
+        logging_config.get("folder", "logs/run"), filters=filters
+    )
+    hot_logging.configure(filters=filters, sampling=logging_config.get("sampling"))
+
+    plot_config = config.get("plot")
+    if plot_config is not None:
+        retico_core.log_utils.configurate_plot(
+            is_plot_live=plot_config.get("live", False),
+            refreshing_time=plot_config.get("refreshing_time", 1),
+            plot_config_path=plot_config["config_path"],
+            window_duration=plot_config.get("window_duration", 30),
+        )
+
+    references = {"terminal_logger": terminal_logger}
+
+    def create(spec):
+        obj = import_object(spec["class"])(
+            *_resolve(spec.get("positional", []), references), **_resolve(spec.get("args", {}), references)
+        )
+        for method, kwargs in _calls(spec):
+            getattr(obj, method)(**kwargs)
+        return obj
+
+    objects = dict()
+    with timer.stage("create objects"):
+        for name, spec in config.get("objects", {}).items():
+            objects[name] = references[name] = create(spec)
+
+    loader = ParallelLoader(timer, parallel=parallel_startup)
+    module_specs = config["modules"]
+    background = [name for name, spec in module_specs.items() if spec.get("background")]
+    for name in background:
+        loader.load(name, functools.partial(create, module_specs[name]))
+
+    modules = dict()
+    with timer.stage("create modules"):
+        for name, spec in module_specs.items():
+            if name not in background:
+                modules[name] = create(spec)
+        for provider, consumer in config.get("connections", []):
+            if provider in modules and consumer in modules:
+                modules[provider].subscribe(modules[consumer])
+
+    amq_config = config.get("amq")
+    if amq_config is not None:
+        with timer.stage("AMQ network"):
+            import retico_amq as amq
+
+            amq.define_amq_network(
+                modules_out_dict=[
+                    {"module": modules[route["module"]], "destination": route["destination"]}
+                    for route in amq_config.get("out", [])
+                ],
+                modules_in_dict=[
+                    {
+                        "destination": route["destination"],
+                        "iu_type": import_object(route["iu_type"]),
+                        "subscriber_modules": [modules[name] for name in route["subscribers"]],
+                    }
+                    for route in amq_config.get("in", [])
+                ],
+                verbose=amq_config.get("verbose", False),
+                ip=amq_config.get("ip", "localhost"),
+                port=amq_config.get("port", "61613"),
+                message_out_is_bytes=amq_config.get("message_out_is_bytes", True),
+                message_in_is_bytes=amq_config.get("message_in_is_bytes", True),
+            )
+
+    # the rest of the network is set up while the background modules load
+    with timer.stage("setup (main thread)"):
+        from retico_core import network
+
+        for module in network.discover(list(modules.values()))[0]:
+            module.setup()
+
+    with timer.stage("wait for background modules"):
+        for name in background:
+            modules[name] = loader.result(name)
+    loader.shutdown()
+    for provider, consumer in config.get("connections", []):
+        if provider in background or consumer in background:
+            modules[provider].subscribe(modules[consumer])
+
+    return Pipeline(config, modules, objects, background, terminal_logger, timer)
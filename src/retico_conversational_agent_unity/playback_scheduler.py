@@ -0,0 +1,143 @@
+"""
+Playback scheduler
+==================
+
+Expected playback timeline of the clauses sent to Unity, so that the
+NonverbalGenerator can dispatch clause N+1 while clause N is still
+playing, with the exact `delay` after which Unity should start it for the
+playback to stay gapless, instead of sending it once ready and letting
+Unity queue it.
+
+The timeline is predicted from the audio duration of each clause, and
+corrected with the `start` acks of Unity, relayed by the
+UnityCommunicatorModule : the ack of the last dispatched clause realigns
+its expected end, and the acks of the clauses started on arrival update
+the estimate of the time a clause takes to reach Unity. The gaps (or
+overlaps) between the consecutive clauses of a turn, as started by
+Unity, are measured.
+
+The clauses are sent with the interrupt mode in which Unity starts a
+clause `delay` seconds after receiving it, defined on the Unity side : it
+can't be QUEUED_INTERRUPT, the mode of the clauses sent without scheduler,
+under which Unity queues the clauses and would add the delays to the
+time they wait in its queue.
+
+A scheduler is shared by the NonverbalGenerator of an avatar and the
+UnityCommunicatorModule :
+
+    scheduler = PlaybackScheduler(interrupt=0)
+    nvg = NonverbalGeneratorModule(playback_scheduler=scheduler)
+    unity_comm = UnityCommunicatorModule(playback_schedulers=[scheduler])
+    ...
+    print(scheduler.metrics())
+"""
+
+import collections
+import threading
+import time
+
+from .latency_tracker import LatencyHistogram
+
+INTER_CLAUSE_GAP = "inter_clause_gap"
+INTER_CLAUSE_OVERLAP = "inter_clause_overlap"
+
+# interrupt mode of the clauses sent without scheduler : Unity queues them
+QUEUED_INTERRUPT = 2
+
+
+class PlaybackScheduler:
+    """Predicts when Unity will end the clauses sent so far, and measures the inter-clause gaps.
+
+    Args:
+        interrupt (int): interrupt mode set on the scheduled clauses, the mode in which Unity starts a clause
+            `delay` seconds after receiving it instead of queueing it, as defined on the Unity side. It can't be
+            QUEUED_INTERRUPT.
+        session_id (str, optional): the avatar session of the clauses (see UnityCommunicatorModule).
+        transport_smoothing (float): weight of the last measure in the estimate of the time a clause takes to
+            reach Unity (exponential moving average).
+        latency_tracker (LatencyTracker, optional): if set, the gaps and overlaps are also recorded in it.
+        clock (Callable[[], float]): monotonic clock, in seconds (the clock of UnityMessageIU.start_time).
+    """
+
+    def __init__(
+        self,
+        interrupt,
+        session_id=None,
+        transport_smoothing=0.2,
+        latency_tracker=None,
+        clock=time.monotonic,
+    ):
+        if interrupt == QUEUED_INTERRUPT:
+            raise ValueError(f"interrupt mode {interrupt} queues the clauses, it can't delay them")
+        self.session_id = session_id
+        self.interrupt = interrupt
+        self.transport_smoothing = transport_smoothing
+        self.latency_tracker = latency_tracker
+        self.clock = clock
+        self.transport = 0.0
+        self.expected_end = None
+        self.gaps = LatencyHistogram()
+        self.overlaps = LatencyHistogram()
+        self._pending = collections.OrderedDict()  # (turn ID, clause ID) -> deque of dispatched commands
+        self._last_started = None  # (turn ID, expected end of the last started clause)
+        self._lock = threading.Lock()
+
+    def schedule(self, turn_id, clause_id, duration):
+        """Register the dispatch of a clause of `duration` seconds.
+
+        Returns:
+            float: the delay (in seconds) after which Unity should start playing the clause once received.
+        """
+        with self._lock:
+            now = self.clock()
+            arrival = now + self.transport
+            delay = 0.0
+            if self.expected_end is not None and self.expected_end > arrival:
+                delay = self.expected_end - arrival
+            self.expected_end = arrival + delay + duration
+            self._pending.setdefault((turn_id, clause_id), collections.deque()).append((now, delay, duration))
+            return round(delay, 4)
+
+    def on_start(self, turn_id, clause_id, start_time=None):
+        """Unity started a clause (at `start_time`, monotonic) : realign the timeline and measure the gap with the
+        previous clause of the turn."""
+        with self._lock:
+            start_time = self.clock() if start_time is None else start_time
+            commands = self._pending.get((turn_id, clause_id))
+            if not commands:
+                return
+            dispatched, delay, duration = commands.popleft()
+            if not commands:
+                del self._pending[(turn_id, clause_id)]
+            # time to reach Unity, measured on the clauses started on arrival
+            if delay == 0.0:
+                transport = max(start_time - dispatched, 0.0)
+                self.transport += self.transport_smoothing * (transport - self.transport)
+            if self._last_started is not None and self._last_started[0] == turn_id:
+                self._record_gap(start_time - self._last_started[1])
+            self._last_started = (turn_id, start_time + duration)
+            # the clauses dispatched after this one have their own delays, only the last one realigns the timeline
+            if not self._pending:
+                self.expected_end = start_time + duration
+
+    def _record_gap(self, gap):
+        name, histogram = (INTER_CLAUSE_GAP, self.gaps) if gap >= 0 else (INTER_CLAUSE_OVERLAP, self.overlaps)
+        histogram.record(abs(gap))
+        if self.latency_tracker is not None:
+            self.latency_tracker.record(name, abs(gap))
+
+    def reset(self):
+        """Forget the timeline, e.g. when the agent is interrupted : the next clause starts on arrival."""
+        with self._lock:
+            self.expected_end = None
+            self._pending.clear()
+            self._last_started = None
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "transport": self.transport,
+                "pending": sum(len(commands) for commands in self._pending.values()),
+                INTER_CLAUSE_GAP: self.gaps.to_dict(),
+                INTER_CLAUSE_OVERLAP: self.overlaps.to_dict(),
+            }
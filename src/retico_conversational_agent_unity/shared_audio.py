@@ -0,0 +1,130 @@
+"""
+Shared audio
+============
+
+Memory-mapped ring of clause audio, shared between the NonverbalGenerator
+and a reader on the same host (Unity, or a local test reader). Instead of
+embedding the WAV bytes in the GestureIU, the NonverbalGenerator writes
+them once in the ring, and the GestureIU only carries a reference :
+`{"path", "offset", "length", "generation"}`.
+
+The file starts with a header holding the capacity of the ring, the
+generation (incremented every time the writer wraps around) and the
+write offset. The writer claims a region in the header before writing
+into it, so a reader can check, after copying a segment, that the
+segment was not overwritten in the meantime : a reference is valid if it
+belongs to the current generation, or to the previous one and lies after
+the current write offset.
+
+Header layout (little endian) : magic (4s), version (I), capacity (Q),
+generation (Q), write offset (Q), padded to `HEADER_SIZE` bytes.
+"""
+
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+MAGIC = b"RSAR"
+VERSION = 1
+HEADER_FORMAT = "<4sIQQQ"
+HEADER_SIZE = 64
+
+
+class StaleSegmentError(Exception):
+    """The referenced segment has been overwritten by the writer."""
+
+
+def default_path():
+    folder = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(folder, f"retico_audio_ring_{os.getpid()}.bin")
+
+
+class SharedAudioRing:
+    """Ring buffer of audio segments in a memory-mapped file.
+
+    Args:
+        path (str, optional): path of the memory-mapped file, defaults to a
+            file in /dev/shm (or the temporary folder).
+        capacity (int): size of the data region in bytes, it must hold
+            every clause that has been sent but not played yet.
+        create (bool): if True, (re)create the file as a writer, otherwise
+            open an existing ring as a reader.
+    """
+
+    def __init__(self, path=None, capacity=32 * 1024 * 1024, create=True):
+        self.path = os.path.abspath(path if path is not None else default_path())
+        self._lock = threading.Lock()
+        if create:
+            with open(self.path, "wb") as f:
+                f.truncate(HEADER_SIZE + capacity)
+        with open(self.path, "r+b") as f:
+            self._mm = mmap.mmap(f.fileno(), 0)
+        if create:
+            struct.pack_into(HEADER_FORMAT, self._mm, 0, MAGIC, VERSION, capacity, 0, 0)
+        magic, version, self.capacity, _, _ = struct.unpack_from(HEADER_FORMAT, self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{self.path} is not a shared audio ring")
+
+    @classmethod
+    def open(cls, path):
+        """Open an existing ring as a reader."""
+        return cls(path=path, create=False)
+
+    def _position(self):
+        _, _, _, generation, offset = struct.unpack_from(HEADER_FORMAT, self._mm, 0)
+        return generation, offset
+
+    def write(self, data):
+        """Copy `data` into the ring.
+
+        Returns:
+            dict: the reference of the segment, to send to the reader.
+        """
+        length = memoryview(data).nbytes
+        if length > self.capacity:
+            raise ValueError(f"segment of {length} bytes does not fit in a ring of {self.capacity} bytes")
+        with self._lock:
+            generation, offset = self._position()
+            if offset + length > self.capacity:
+                generation, offset = generation + 1, 0
+            # claim the region before writing into it
+            struct.pack_into("<QQ", self._mm, 16, generation, offset + length)
+            start = HEADER_SIZE + offset
+            self._mm[start : start + length] = data
+        return {"path": self.path, "offset": offset, "length": length, "generation": generation}
+
+    def is_valid(self, ref):
+        generation, offset = self._position()
+        if ref["generation"] == generation:
+            return True
+        return ref["generation"] == generation - 1 and ref["offset"] >= offset
+
+    def read(self, ref):
+        """Copy the segment referenced by `ref` out of the ring.
+
+        Raises:
+            StaleSegmentError: if the segment has been overwritten.
+        """
+        if not self.is_valid(ref):
+            raise StaleSegmentError(f"segment {ref} has been overwritten")
+        start = HEADER_SIZE + ref["offset"]
+        data = self._mm[start : start + ref["length"]]
+        if not self.is_valid(ref):
+            raise StaleSegmentError(f"segment {ref} has been overwritten while being read")
+        return data
+
+    def close(self, unlink=False):
+        self._mm.close()
+        if unlink:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,142 @@
+"""
+Startup
+=======
+
+Helpers to bring a dialog system up quickly after a restart : the modules
+loading a model (ASR, LLM, TTS) are created and set up in background
+threads, while the rest of the network (AMQ, UnityCommunicator,
+NonverbalGenerator...) is created and set up on the main thread, and every
+stage is timed to report a startup breakdown.
+
+    timer = StartupTimer()
+    loader = ParallelLoader(timer)
+    loader.load("tts", lambda: agent.TtsDmModule(...))
+    with timer.stage("unity modules"):
+        unity_comm = uagent.UnityCommunicatorModule()
+        unity_comm.setup()
+    tts = loader.result("tts")
+    ...
+    run_modules(modules, timer)
+    print(timer.report())
+"""
+
+import concurrent.futures
+import contextlib
+import threading
+import time
+
+
+class StartupTimer:
+    """Records the start and end of named startup stages, possibly overlapping (stages of parallel threads).
+
+    Args:
+        clock (Callable[[], float]): clock, in seconds.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.origin = clock()
+        self.stages = []  # (name, start, end, thread name)
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            end = self.clock()
+            with self._lock:
+                self.stages.append((name, start - self.origin, end - self.origin, threading.current_thread().name))
+
+    def total(self):
+        """Wall-clock duration since the timer's creation."""
+        return self.clock() - self.origin
+
+    def breakdown(self):
+        """Return {stage name: duration}, in the order the stages started."""
+        with self._lock:
+            stages = sorted(self.stages, key=lambda s: s[1])
+        return {name: end - start for name, start, end, _ in stages}
+
+    def report(self):
+        """Human-readable breakdown : start offset, duration and thread of each stage, and the total duration."""
+        with self._lock:
+            stages = sorted(self.stages, key=lambda s: s[1])
+        lines = ["startup breakdown :"]
+        for name, start, end, thread in stages:
+            lines.append(f"  {name:<28} +{start:7.2f}s {end - start:7.2f}s  ({thread})")
+        lines.append(f"  {'total':<28} {'':9} {self.total():7.2f}s")
+        return "\n".join(lines)
+
+
+class ParallelLoader:
+    """Creates and sets up modules in background threads, each load being a stage of the timer.
+
+    Args:
+        timer (StartupTimer, optional): timer recording each load.
+        max_workers (int, optional): maximum number of modules loaded at the same time.
+        parallel (bool): if False, each module is loaded by `load` on the calling thread (sequential startup).
+    """
+
+    def __init__(self, timer=None, max_workers=None, parallel=True):
+        self.timer = timer if timer is not None else StartupTimer()
+        self.parallel = parallel
+        self._executor = (
+            concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="loader")
+            if parallel
+            else None
+        )
+        self._futures = dict()
+
+    def load(self, name, factory, setup=True):
+        """Start creating a module in a background thread.
+
+        Args:
+            name (str): name of the load, used to get its result.
+            factory (Callable[[], AbstractModule]): creates the module (e.g. loads the model).
+            setup (bool): if True, the module's `setup` is also called in the background thread, and it shouldn't be
+                called again (see `run_modules`).
+        """
+
+        def create():
+            with self.timer.stage(name):
+                module = factory()
+                if setup:
+                    module.setup()
+                return module
+
+        if self.parallel:
+            self._futures[name] = self._executor.submit(create)
+            return
+        future = self._futures[name] = concurrent.futures.Future()
+        try:
+            future.set_result(create())
+        except Exception as e:
+            future.set_exception(e)
+
+    def result(self, name, timeout=None):
+        """Wait for a load to end and return its module, raises the exception of a failed load."""
+        return self._futures[name].result(timeout=timeout)
+
+    def modules(self):
+        """Modules loaded so far (waits for the loads in progress)."""
+        return [future.result() for future in self._futures.values()]
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+
+def run_modules(modules, timer=None, already_setup=()):
+    """Like retico_core.network.run on a list of modules, without setting up again the modules of `already_setup`
+    (e.g. the ones set up by a ParallelLoader)."""
+    timer = timer if timer is not None else StartupTimer()
+    already_setup = set(map(id, already_setup))
+    with timer.stage("setup"):
+        for module in modules:
+            if id(module) not in already_setup:
+                module.setup()
+    with timer.stage("run"):
+        for module in modules:
+            module.run(run_setup=False)
@@ -0,0 +1,99 @@
+"""
+Turn index
+==========
+
+Bounded index of per-turn values (e.g. the last clause of each turn), in
+the order of their last update. Turns that never end (interrupted,
+aborted, or never completed by Unity) are evicted once the index holds
+more than `max_turns` turns, or once they haven't been updated for
+`max_age` seconds, so that long-running systems don't grow with them.
+The latest turn is accessed in O(1).
+"""
+
+import collections
+import time
+
+
+class TurnIndex:
+    """Ordered and bounded mapping of turn IDs to values.
+
+    Args:
+        max_turns (int, optional): maximum number of turns kept, the least recently updated are evicted first.
+        max_age (float, optional): turns not updated for `max_age` seconds are evicted.
+        clock (Callable[[], float]): monotonic clock, in seconds.
+    """
+
+    def __init__(self, max_turns=100, max_age=None, clock=time.monotonic):
+        self.max_turns = max_turns
+        self.max_age = max_age
+        self.clock = clock
+        self.nb_evicted_by_count = 0
+        self.nb_evicted_by_age = 0
+        self._entries = collections.OrderedDict()  # turn ID -> (value, time of the last update)
+
+    def __setitem__(self, turn_id, value):
+        self._entries[turn_id] = (value, self.clock())
+        self._entries.move_to_end(turn_id)
+        self.evict()
+
+    def __getitem__(self, turn_id):
+        return self._entries[turn_id][0]
+
+    def __delitem__(self, turn_id):
+        del self._entries[turn_id]
+
+    def __contains__(self, turn_id):
+        return turn_id in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __bool__(self):
+        return bool(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __repr__(self):
+        return f"TurnIndex({ {turn_id: value for turn_id, (value, _) in self._entries.items()} })"
+
+    def get(self, turn_id, default=None):
+        entry = self._entries.get(turn_id)
+        return default if entry is None else entry[0]
+
+    def pop(self, turn_id, *default):
+        if turn_id not in self._entries and default:
+            return default[0]
+        return self._entries.pop(turn_id)[0]
+
+    def setdefault(self, turn_id, default):
+        """Like dict.setdefault, also counts as an update of the turn."""
+        value = self.get(turn_id, default)
+        self[turn_id] = value
+        return value
+
+    def latest(self):
+        """Return the (turn ID, value) of the most recently updated turn, None if the index is empty."""
+        self.evict()
+        if not self._entries:
+            return None
+        turn_id = next(reversed(self._entries))
+        return turn_id, self._entries[turn_id][0]
+
+    def evict(self):
+        """Evict the turns exceeding `max_turns`, and the turns older than `max_age`."""
+        while self.max_turns is not None and len(self._entries) > self.max_turns:
+            self._entries.popitem(last=False)
+            self.nb_evicted_by_count += 1
+        if self.max_age is not None:
+            deadline = self.clock() - self.max_age
+            while self._entries and next(iter(self._entries.values()))[1] < deadline:
+                self._entries.popitem(last=False)
+                self.nb_evicted_by_age += 1
+
+    def metrics(self):
+        return {
+            "size": len(self._entries),
+            "evicted_by_count": self.nb_evicted_by_count,
+            "evicted_by_age": self.nb_evicted_by_age,
+        }
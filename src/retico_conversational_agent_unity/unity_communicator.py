@@ -5,6 +5,114 @@ import retico_core
 from retico_amq import GestureIU
 from retico_conversational_agent import DMIU, SpeakerAlignementIU
 from .additional_IUs import UnityMessageIU
+from . import latency_tracker as latency
+from .filler_cache import FILLER_TURN_ID
+from .hot_logging import HotPathLogger
+from .inbox import Inbox
+from .turn_index import TurnIndex
+from .word_timings import WordTimings
+
+# states of a session
+SPEAKING = "speaking"
+SOFT_INTERRUPTED = "soft_interrupted"
+HARD_INTERRUPTED = "hard_interrupted"
+STATES = (SPEAKING, SOFT_INTERRUPTED, HARD_INTERRUPTED)
+
+# types of events
+GESTURE_EVENT = "gesture"
+DM_EVENT = "dm"
+UNITY_EVENT = "unity"
+EVENT_KINDS = {GestureIU: GESTURE_EVENT, DMIU: DM_EVENT, UnityMessageIU: UNITY_EVENT}
+
+# (states, event type, status/action) -> name of the UnityCommunicatorModule method handling the event.
+# Events without transition are ignored, e.g. the end of a hard interrupted turn.
+TRANSITIONS = [
+    ([SPEAKING], GESTURE_EVENT, "clause", "on_clause"),
+    ([SPEAKING], GESTURE_EVENT, "final", "on_final"),
+    ([SOFT_INTERRUPTED], GESTURE_EVENT, "clause", "on_clause_soft_interrupted"),
+    ([SOFT_INTERRUPTED], GESTURE_EVENT, "final", "on_final_soft_interrupted"),
+    ([HARD_INTERRUPTED], GESTURE_EVENT, "clause", "on_clause_hard_interrupted"),
+    ([HARD_INTERRUPTED], GESTURE_EVENT, "final", "on_final_hard_interrupted"),
+    (STATES, DM_EVENT, "hard_interruption", "on_hard_interruption"),
+    ([SPEAKING], DM_EVENT, "soft_interruption", "on_soft_interruption"),
+    (STATES, DM_EVENT, "stop_turn_id", "on_stop_turn"),
+    ([SOFT_INTERRUPTED], DM_EVENT, "continue", "on_continue"),
+    ([HARD_INTERRUPTED], DM_EVENT, "user_BOT_same_turn", "on_user_bot_same_turn"),
+    (STATES, UNITY_EVENT, "start", "on_unity_start"),
+    (STATES, UNITY_EVENT, "completed", "on_unity_completed"),
+    (STATES, UNITY_EVENT, "interrupted", "on_unity_interrupted"),
+    (STATES, UNITY_EVENT, "aborted", "on_unity_aborted"),
+]
+DM_ACTIONS = {"hard_interruption", "soft_interruption", "stop_turn_id", "continue"}
+
+# requestID prefix of the commands triggered from the Unity side for testing
+MANUAL_REQUEST_PREFIX = "billy"
+
+
+class ClauseCommands:
+    """Commands sent to Unity for a clause : a single one, or one per sub-chunk of a streamed clause, in which case
+    their number is known once the chunk flagged `lastChunk` is sent."""
+
+    __slots__ = ("nb_chunks", "nb_started", "nb_completed")
+
+    def __init__(self):
+        self.nb_chunks = None
+        self.nb_started = 0
+        self.nb_completed = 0
+
+
+class UnitySession:
+    """Dialogue state of one avatar (one Unity client) served by a UnityCommunicatorModule.
+
+    Args:
+        session_id (str): ID of the session, carried by the sessionID of the GestureIUs and UnityMessageIUs.
+        inbox_maxsize (int): maximum number of GestureIUs waiting to be sent to Unity, 0 means unbounded.
+        inbox_policy (str): what to do when the inbox is full, "block", "drop_oldest" or "drop_newest".
+        max_turns (int, optional): maximum number of turns kept in the per-turn indexes, see `TurnIndex`.
+        max_turn_age (float, optional): turns not updated for this many seconds are evicted from the indexes.
+    """
+
+    def __init__(self, session_id=None, inbox_maxsize=0, inbox_policy="block", max_turns=100, max_turn_age=None):
+        self.session_id = session_id
+        self.gesture_inbox = Inbox(maxsize=inbox_maxsize, policy=inbox_policy)
+        # last clause of each turn entirely generated, and of each turn being generated
+        self.last_clause_each_turn = TurnIndex(max_turns=max_turns, max_age=max_turn_age)
+        self.last_clause_each_turn_temp = TurnIndex(max_turns=max_turns, max_age=max_turn_age)
+        self.last_command_started_but_not_ended = None
+        self.first_clause = True
+        self.state = SPEAKING
+        # turn being interrupted, and its clauses kept aside during a soft interruption
+        self.interrupted_turn_id = None
+        self.interrupted_turn_iu_buffer = []
+        self.last_command_ended = None
+        self.current_turn_id = None
+        # commands sent to Unity for each (turnID, clauseID) not entirely played yet (see ClauseCommands)
+        self.commands_each_clause = dict()
+        # word timing table of each clause sent to Unity : {turnID: {clauseID: WordTimings}}
+        self.word_timings_each_turn = TurnIndex(max_turns=max_turns, max_age=max_turn_age)
+        # protects the pending commands, and `scheduled` : True while the session is waiting for, or being served
+        # by, a worker, so that the GestureIUs of a session are sent in order by one worker at a time
+        self.lock = threading.Lock()
+        self.scheduled = False
+
+    def metrics(self):
+        """Size and evictions of the per-turn indexes."""
+        return {
+            "last_clause_each_turn": self.last_clause_each_turn.metrics(),
+            "last_clause_each_turn_temp": self.last_clause_each_turn_temp.metrics(),
+            "word_timings_each_turn": self.word_timings_each_turn.metrics(),
+            "commands_each_clause": len(self.commands_each_clause),
+        }
+
+    def interrupt(self, state, turn_id):
+        self.state = state
+        self.interrupted_turn_id = turn_id
+        self.interrupted_turn_iu_buffer = []
+
+    def resume(self):
+        self.state = SPEAKING
+        self.interrupted_turn_id = None
+        self.interrupted_turn_iu_buffer = []
 
 
 class UnityCommunicatorModule(retico_core.abstract.AbstractModule):
@@ -24,279 +132,528 @@ class UnityCommunicatorModule(retico_core.abstract.AbstractModule):
     def output_iu():
         return retico_core.abstract.IncrementalUnit  # SpeakerAlignementIU, amqu.GestureIU
 
-    def __init__(self, **kwargs):
+    def __init__(
+        self,
+        inbox_maxsize=0,
+        inbox_policy="block",
+        nb_workers=1,
+        max_turns=100,
+        max_turn_age=None,
+        latency_tracker=None,
+        playback_schedulers=None,
+        clock=time.monotonic,
+        **kwargs,
+    ):
+        """
+        Initialize the UnityCommunicator Module.
+
+        The module can serve several avatars : the dialogue state of each avatar lives in a `UnitySession`,
+        looked up by the sessionID of the incoming IUs (or the `session_id` of the module that created them, e.g.
+        the NonverbalGeneratorModule of the avatar), and the SpeakerAlignementIUs are tagged with the sessionID
+        of their session. IUs without session ID belong to the default session (None).
+
+        DMIUs carry no session ID : with several avatars, each avatar has its own dialogue manager, whose
+        `session_id` attribute must be set to the ID of its session (e.g. `dm.session_id = "avatar_1"`). Once the
+        module serves sessions with an ID, the DMIUs whose creator has no session_id are logged and dropped,
+        instead of interrupting the default session.
+
+        Args:
+            inbox_maxsize (int): maximum number of GestureIUs of each session waiting to be sent to Unity, 0 means
+                unbounded.
+            inbox_policy (str): what to do when the inbox is full, "block", "drop_oldest" or "drop_newest".
+            nb_workers (int): number of threads sending the GestureIUs of every session to Unity.
+            max_turns (int, optional): maximum number of turns each session keeps track of, the turns that never
+                end (interrupted, aborted or never completed) are evicted beyond it.
+            max_turn_age (float, optional): if set, turns not updated for this many seconds are evicted.
+            latency_tracker (LatencyTracker, optional): if set, stamps the sending of each clause to Unity, Unity's
+                start and completed responses, and the emission of the SpeakerAlignementIUs.
+            playback_schedulers (list[PlaybackScheduler], optional): the playback schedulers of the
+                NonverbalGenerators (one per session, told apart by their session_id), to which Unity's start acks
+                are relayed, and which are reset when Unity reports an interruption.
+            clock (Callable[[], float]): monotonic clock, in seconds (the clock of UnityMessageIU.start_time), used
+                to estimate the word being spoken when the agent is interrupted before Unity answers.
+        """
         super().__init__(**kwargs)
+        # per-IU logs, filtered and sampled before their arguments are built, emitted by a background thread
+        self.hot_logger = HotPathLogger(self.terminal_logger, module=self.name())
         self._thread_active = False
-        self.last_clause_each_turn = dict()
-        self.last_clause_each_turn_temp = dict()
-        self.last_command_started_but_not_ended = None
-        self.first_clause = True
-        self.interrupted_iu = None
-        self.soft_interrupted_iu = None
-        self.interrupted_turn_iu_buffer = []
-        self.last_command_ended = None
+        self.inbox_maxsize = inbox_maxsize
+        self.inbox_policy = inbox_policy
+        self.nb_workers = nb_workers
+        self.max_turns = max_turns
+        self.max_turn_age = max_turn_age
+        self.latency_tracker = latency_tracker
+        self.playback_schedulers = {scheduler.session_id: scheduler for scheduler in playback_schedulers or []}
+        self.clock = clock
+        self.sessions = dict()
+        self._sessions_lock = threading.Lock()
+        # sessions having GestureIUs to send, served by the workers
+        self._ready_sessions = Inbox()
+        # compiled transition table : (state, event type, status/action) -> bound handler
+        self.transitions = {
+            (state, kind, key): getattr(self, handler) for states, kind, key, handler in TRANSITIONS for state in states
+        }
+        self._event_kinds = dict(EVENT_KINDS)
 
     def prepare_run(self):
         super().prepare_run()
         self._thread_active = True
-        threading.Thread(target=self.run_process).start()
+        self._ready_sessions.reopen()
+        for session in list(self.sessions.values()):
+            session.gesture_inbox.reopen()
+        for _ in range(self.nb_workers):
+            threading.Thread(target=self.run_process).start()
 
     def shutdown(self):
         super().shutdown()
         self._thread_active = False
+        self._ready_sessions.close()
+        for session in list(self.sessions.values()):
+            session.gesture_inbox.close()
+
+    def session(self, session_id=None):
+        """Return the session `session_id`, created on first use."""
+        with self._sessions_lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = self.sessions[session_id] = UnitySession(
+                    session_id,
+                    inbox_maxsize=self.inbox_maxsize,
+                    inbox_policy=self.inbox_policy,
+                    max_turns=self.max_turns,
+                    max_turn_age=self.max_turn_age,
+                )
+            return session
+
+    def session_of(self, iu):
+        """Return the session of an IU, from its sessionID or from the session_id of its creator module. Returns
+        None for a DMIU without session ID if the module serves sessions with an ID : its action can't be routed
+        to the avatar it concerns."""
+        session_id = getattr(iu, "sessionID", None)
+        if session_id is None:
+            session_id = getattr(iu.creator, "session_id", None)
+        if session_id is None and isinstance(iu, DMIU) and self.serves_several_sessions():
+            return None
+        return self.session(session_id)
+
+    def serves_several_sessions(self):
+        with self._sessions_lock:
+            return any(session_id is not None for session_id in self.sessions)
+
+    def metrics(self):
+        """Size and evictions of the per-turn indexes of every session."""
+        with self._sessions_lock:
+            sessions = list(self.sessions.values())
+        return {session.session_id: session.metrics() for session in sessions}
+
+    def close_session(self, session_id):
+        """Forget the state of a session (e.g. when its avatar disconnects)."""
+        with self._sessions_lock:
+            session = self.sessions.pop(session_id, None)
+        if session is not None:
+            session.gesture_inbox.close()
+
+    def enqueue(self, session, iu):
+        """Queue a GestureIU to be sent to Unity."""
+        session.gesture_inbox.put(iu)
+        self.schedule(session)
+
+    def schedule(self, session):
+        """Hand a session over to the workers if it has GestureIUs to send and isn't already handed over."""
+        with session.lock:
+            if session.scheduled or len(session.gesture_inbox) == 0:
+                return
+            session.scheduled = True
+        self._ready_sessions.put(session)
 
     def process_update(self, update_message):
-        self.terminal_logger.info("process_update")
+        self.hot_logger.info("process_update")
         if not update_message:
             return None
 
         for iu, ut in update_message:
-            if isinstance(iu, GestureIU):
-
-                # check interruptions
-                if self.interrupted_iu is not None:
-                    # if, after an interrupted turn, an IU from a new turn has been received
-                    if not iu.final and self.interrupted_iu.turn_id != iu.turn_id:
-                        self.interrupted_iu = None
-                        self.current_input.append(iu)
-                elif self.soft_interrupted_iu is not None:
-                    self.terminal_logger.info(
-                        "IU received during soft interruption",
-                        debug=True,
-                        soft_inter_iu_turn=self.soft_interrupted_iu.turn_id,
-                        TTS_iu_turn=iu.turn_id,
-                        iu_final=iu.final,
-                    )
-                    if hasattr(iu, "final") and iu.final:
-                        self.last_clause_each_turn[iu.turnID] = self.last_clause_each_turn_temp[iu.turnID]
-                        del self.last_clause_each_turn_temp[iu.turnID]
-                        self.terminal_logger.info("DICT updated : ", dict=self.last_clause_each_turn)
-                        self.file_logger.info("turn generated")
-                        self.interrupted_turn_iu_buffer.append(iu)
-                    else:
-                        if self.soft_interrupted_iu.turn_id != iu.turn_id:
-                            self.soft_interrupted_iu = None
-                            self.current_input.append(iu)
-                            self.interrupted_turn_iu_buffer = []
-                        else:
-                            self.interrupted_turn_iu_buffer.append(iu)
-                else:
-                    self.current_input.append(iu)
-                    if hasattr(iu, "final") and iu.final:
-                        try:
-                            self.last_clause_each_turn[iu.turnID] = self.last_clause_each_turn_temp[iu.turnID]
-                            del self.last_clause_each_turn_temp[iu.turnID]
-                        except Exception:
-                            print(f"last_clause_each_turn_temp do not have a value for key={iu.turnID}")
-                        self.terminal_logger.info("DICT updated : ", dict=self.last_clause_each_turn)
-                        self.file_logger.info("turn generated")
-                    else:
-                        self.last_clause_each_turn_temp[iu.turnID] = iu.clauseID
-
-            if isinstance(iu, DMIU):
-                if ut == retico_core.UpdateType.ADD:
-
-                    if iu.action == "hard_interruption":
-                        self.terminal_logger.info("hard_interruption")
-                        self.file_logger.info("hard_interruption")
-                        self.first_clause = True
-
-                        # if some iu was outputted, send to LLM module for alignement
-                        if self.last_command_started_but_not_ended is not None:
-                            output_iu = self.create_speaker_alignement_iu(
-                                # grounded_word=self.last_command_started_but_not_ended.grounded_word,
-                                # word_id=self.last_command_started_but_not_ended.word_id,
-                                # char_id=self.last_command_started_but_not_ended.char_id,
-                                clause_id=self.last_command_started_but_not_ended.clause_id,
-                                turn_id=self.last_command_started_but_not_ended.turn_id,
-                                event="interruption",
-                            )
-                            um = retico_core.UpdateMessage()
-                            um.add_ius(
-                                [(um_iu, retico_core.UpdateType.ADD) for um_iu in self.current_output + [output_iu]]
-                            )
-                            self.append(um)
-                            self.interrupted_iu = output_iu
-                            # remove all audio in audio_buffer
-                            self.current_input = []
-                            self.current_output = []
-                            # self.last_command_started_but_not_ended = None
-                        else:
-                            self.terminal_logger.info("speaker interruption but no outputted audio yet")
-                            self.file_logger.info("speaker interruption but no outputted audio yet")
-
-                    elif iu.action == "soft_interruption":
-                        self.terminal_logger.info(
-                            "soft_interruption",
-                            debug=True,
-                            # grounded_word=self.last_command_started_but_not_ended.grounded_word,
-                            # word_id=self.last_command_started_but_not_ended.word_id,
-                            # char_id=self.last_command_started_but_not_ended.char_id,
-                            clause_id=self.last_command_started_but_not_ended.clause_id,
-                            turn_id=self.last_command_started_but_not_ended.turn_id,
-                            final=iu.final,
-                        )
-                        self.file_logger.info("soft_interruption")
-                        # if some iu was outputted, send to LLM module for alignement
-                        if self.last_command_started_but_not_ended is not None:
-                            output_iu = self.create_speaker_alignement_iu(
-                                # grounded_word=self.last_command_started_but_not_ended.grounded_word,
-                                # word_id=self.last_command_started_but_not_ended.word_id,
-                                # char_id=self.last_command_started_but_not_ended.char_id,
-                                clause_id=self.last_command_started_but_not_ended.clause_id,
-                                turn_id=self.last_command_started_but_not_ended.turn_id,
-                                final=iu.final,
-                                event="interruption",
-                            )
-                            um = retico_core.UpdateMessage.from_iu(output_iu, retico_core.UpdateType.ADD)
-                            self.append(um)
-                            self.soft_interrupted_iu = output_iu
-                            self.interrupted_turn_iu_buffer = self.current_input
-                            self.current_input = []
-
-                        else:
-                            self.terminal_logger.info("speaker soft interruption but no outputted audio yet")
-                            self.file_logger.info("speaker soft interruption but no outputted audio yet")
-
-                    elif iu.action == "stop_turn_id":
-                        self.first_clause = True
-
-                    elif iu.action == "continue":
-                        self.terminal_logger.info("continue")
-                        self.file_logger.info("continue")
-                        output_iu = self.create_speaker_alignement_iu(
-                            event="continue",
-                        )
-                        um = retico_core.UpdateMessage.from_iu(output_iu, retico_core.UpdateType.ADD)
-                        self.append(um)
-                        self.current_input = self.interrupted_turn_iu_buffer
-                        self.soft_interrupted_iu = None
-
-                    elif iu.event == "user_BOT_same_turn":
-                        self.interrupted_iu = None
-
-            elif isinstance(iu, UnityMessageIU):
-
-                self.terminal_logger.info(
-                    "message received from Unity", dict=self.last_clause_each_turn, iu=iu.__dict__
+            kind = self.event_kind(iu)
+            if kind is None or (kind == DM_EVENT and ut != retico_core.UpdateType.ADD):
+                continue
+            session = self.session_of(iu)
+            if session is None:
+                self.terminal_logger.error(
+                    "DMIU without session ID dropped, set the session_id of the dialogue manager of each avatar",
+                    action=iu.action,
+                    event=iu.event,
                 )
+                continue
+            self.handle_event(session, kind, iu)
+
+    def event_kind(self, iu):
+        """Type of event of an IU (GESTURE_EVENT, DM_EVENT or UNITY_EVENT), None if the module ignores it."""
+        kind = self._event_kinds.get(type(iu), False)
+        if kind is False:
+            # subclasses of the input IUs, resolved once per type
+            kind = next((k for iu_type, k in EVENT_KINDS.items() if isinstance(iu, iu_type)), None)
+            self._event_kinds[type(iu)] = kind
+        return kind
 
-                if iu.status == "start":
-                    self.terminal_logger.info("command started", command=iu.requestID)
-                    self.file_logger.info("command started", command=iu.requestID)
-
-                    if self.last_command_started_but_not_ended is None or (
-                        self.last_command_started_but_not_ended.turnID is not None
-                        and iu.turnID is not None
-                        and self.last_command_started_but_not_ended.turnID < iu.turnID
-                    ):
-                        self.file_logger.info("unity_agent_BOT")
-                        output_iu = self.create_speaker_alignement_iu(
-                            clause_id=iu.clauseID, turn_id=iu.turnID, event="agent_BOT"
-                        )
-                        um = retico_core.UpdateMessage()
-                        um.add_iu(output_iu, retico_core.UpdateType.ADD)
-                        self.append(um)
-                    self.last_command_started_but_not_ended = iu
-
-                    # testing with John's space key
-                    if iu.requestID[0:5] == "billy" and len(self.last_clause_each_turn) != 0:
-                        turn = list(self.last_clause_each_turn.keys())[-1]
-                        clause = self.last_clause_each_turn[turn]
-
-                        if self.last_command_started_but_not_ended is None or (
-                            self.last_command_started_but_not_ended.turnID is not None
-                            and turn is not None
-                            and self.last_command_started_but_not_ended.turnID < turn
-                        ):
-                            self.file_logger.info("unity_agent_BOT")
-                            output_iu = self.create_speaker_alignement_iu(
-                                clause_id=clause, turn_id=turn, event="agent_BOT"
-                            )
-                            um = retico_core.UpdateMessage()
-                            um.add_iu(output_iu, retico_core.UpdateType.ADD)
-                            self.append(um)
-                    self.last_command_started_but_not_ended = iu
-                elif iu.status == "completed":
-                    self.terminal_logger.info("command completed", command=iu.requestID)
-                    self.file_logger.info("command completed", command=iu.requestID)
-                    self.last_command_ended = iu
-                    if self.last_command_started_but_not_ended.requestID == iu.requestID:
-                        self.last_command_started_but_not_ended = None
-                    # check if EOT
-                    if iu.turnID in self.last_clause_each_turn and self.last_clause_each_turn[iu.turnID] == iu.clauseID:
-                        self.terminal_logger.info("agent_EOT")
-                        self.file_logger.info("unity_EOT")
-                        self.send_EOT(iu.turnID, iu.clauseID)
-
-                    # testing with John's space key
-                    if iu.requestID[0:5] == "billy" and len(self.last_clause_each_turn) != 0:
-                        turn = list(self.last_clause_each_turn.keys())[-1]
-                        clause = self.last_clause_each_turn[turn]
-                        # create and send IU
-                        self.terminal_logger.info(f"EOT : Turn {turn} finished (clause {clause})")
-                        # self.terminal_logger.info("agent_EOT")
-                        self.file_logger.info("unity_EOT")
-                        self.send_EOT(turn, clause)
-                elif iu.status == "interrupted":
-                    self.terminal_logger.info("command interrupted", command=iu.requestID)
-                    self.file_logger.info("command interrupted", command=iu.requestID)
-                    self.file_logger.info("unity_interruption")
-                    output_iu = self.create_speaker_alignement_iu(
-                        clause_id=iu.clauseID, turn_id=iu.turnID, event="interruption"
-                    )
-                    um = retico_core.UpdateMessage()
-                    um.add_iu(output_iu, retico_core.UpdateType.ADD)
-                    self.append(um)
-
-                    # testing with John's space key
-                    if iu.requestID[0:5] == "billy" and len(self.last_clause_each_turn) != 0:
-                        self.terminal_logger.info("command interrupted", command=iu.requestID)
-                        self.file_logger.info("command interrupted", command=iu.requestID)
-                        self.file_logger.info("unity_interruption")
-                        turn = list(self.last_clause_each_turn.keys())[-1]
-                        clause = self.last_clause_each_turn[turn]
-                        output_iu = self.create_speaker_alignement_iu(
-                            clause_id=clause, turn_id=turn, event="interruption"
-                        )
-                        um = retico_core.UpdateMessage()
-                        um.add_iu(output_iu, retico_core.UpdateType.ADD)
-                        self.append(um)
-                elif iu.status == "aborted":
-                    self.terminal_logger.info("command aborted", command=iu.requestID)
-                    self.file_logger.info("command aborted", command=iu.requestID)
-
-    def send_EOT(self, turnID, clauseID):
-        # clear from dict
-        del self.last_clause_each_turn[turnID]
-
-        # create and send IUs
-        output_ius = []
-        # IU 1
-        output_ius.append(
-            self.create_speaker_alignement_iu(
-                turn_id=turnID,
-                clause_id=clauseID,
-                event="ius_from_last_turn",
-            )
-        )
-        # IU 2
-        output_ius.append(
-            self.create_speaker_alignement_iu(
-                turn_id=turnID,
-                clause_id=clauseID,
-                event="agent_EOT",
+    @staticmethod
+    def event_key(kind, iu):
+        """Second part of the transition key : the status of Unity messages, the action of DMIUs (or their event
+        if the action isn't handled), and whether GestureIUs are a clause or the end of a turn."""
+        if kind == GESTURE_EVENT:
+            return "final" if iu.final else "clause"
+        if kind == DM_EVENT:
+            return iu.action if iu.action in DM_ACTIONS else iu.event
+        return iu.status
+
+    def handle_event(self, session, kind, iu):
+        """Apply the transition of (session state, event type, status/action) and emit the SpeakerAlignementIUs
+        it returns."""
+        if kind != DM_EVENT and iu.turnID == FILLER_TURN_ID:
+            self.on_filler(session, kind, iu)
+            return
+        if kind == GESTURE_EVENT and not iu.final:
+            self.index_word_timings(session, iu)
+        elif kind == UNITY_EVENT:
+            self.hot_logger.info(
+                "message received from Unity",
+                lambda: dict(dict=repr(session.last_clause_each_turn), iu=iu.to_dict()),
             )
-        )
-
+        handler = self.transitions.get((session.state, kind, self.event_key(kind, iu)))
+        if handler is None:
+            return
+        alignments = handler(session, iu)
+        if alignments:
+            self.emit_alignments(session, alignments)
+
+    def emit_alignments(self, session, alignments):
+        """Single emission point of the SpeakerAlignementIUs, `alignments` are the arguments of
+        `create_speaker_alignement_iu`."""
         um = retico_core.UpdateMessage()
-        # um.add_ius([(um_iu, retico_core.UpdateType.ADD) for um_iu in self.current_output + [output_iu]])
-        # self.current_output = []
-        um.add_ius([(output_iu, retico_core.UpdateType.ADD) for output_iu in output_ius])
+        um.add_ius(
+            [
+                (self.create_speaker_alignement_iu(session, **alignment), retico_core.UpdateType.ADD)
+                for alignment in alignments
+            ]
+        )
         self.append(um)
 
-    def create_speaker_alignement_iu(self, clause_id, turn_id, event, final=True):
-        return SpeakerAlignementIU(
+    def on_filler(self, session, kind, iu):
+        """Fillers (see NonverbalGeneratorModule.send_filler) are sent whatever the state of the session, and are
+        played outside of the turns : they don't start or end a turn, and the interruptions and their alignments
+        only concern the commands of the generated turns."""
+        if kind == GESTURE_EVENT:
+            self.enqueue(session, iu)
+        else:
+            self.hot_logger.info("filler command", command=iu.requestID, status=iu.status)
+
+    # GestureIUs received from the NonverbalGenerator
+
+    def on_clause(self, session, iu):
+        self.enqueue(session, iu)
+        self.track_last_clause(session, iu)
+
+    @staticmethod
+    def track_last_clause(session, iu):
+        # the final GestureIU can overtake the last clauses of its turn (see NonverbalGeneratorModule.end_turn)
+        if iu.turnID not in session.last_clause_each_turn:
+            session.last_clause_each_turn_temp[iu.turnID] = iu.clauseID
+
+    def on_final(self, session, iu):
+        self.enqueue(session, iu)
+        self.end_turn_generation(session, iu)
+
+    def on_clause_soft_interrupted(self, session, iu):
+        self.hot_logger.info(
+            "IU received during soft interruption",
+            debug=True,
+            soft_inter_iu_turn=session.interrupted_turn_id,
+            TTS_iu_turn=iu.turnID,
+            iu_final=iu.final,
+        )
+        if session.interrupted_turn_id != iu.turnID:
+            # a new turn starts, the soft interrupted one won't be continued
+            session.resume()
+            return self.on_clause(session, iu)
+        session.interrupted_turn_iu_buffer.append(iu)
+        self.track_last_clause(session, iu)
+
+    def on_final_soft_interrupted(self, session, iu):
+        self.end_turn_generation(session, iu)
+        session.interrupted_turn_iu_buffer.append(iu)
+
+    def on_clause_hard_interrupted(self, session, iu):
+        # the clauses of the interrupted turn are dropped, until an IU from a new turn is received
+        if session.interrupted_turn_id != iu.turnID:
+            session.resume()
+            return self.on_clause(session, iu)
+
+    def on_final_hard_interrupted(self, session, iu):
+        # like its clauses, the final GestureIU of a new turn ends the interruption : it can overtake them (see
+        # NonverbalGeneratorModule.end_turn), and the end of its turn must be recorded
+        if session.interrupted_turn_id != iu.turnID:
+            session.resume()
+            self.on_final(session, iu)
+
+    def end_turn_generation(self, session, iu):
+        """The whole turn has been generated : its last clause is known, carried by the final GestureIU or, if it
+        doesn't, the last clause received."""
+        last_clause = session.last_clause_each_turn_temp.pop(iu.turnID, None)
+        if getattr(iu, "clauseID", None) is not None:
+            session.last_clause_each_turn[iu.turnID] = iu.clauseID
+        elif last_clause is not None:
+            session.last_clause_each_turn[iu.turnID] = last_clause
+        else:
+            self.terminal_logger.info("last_clause_each_turn_temp do not have a value", key=iu.turnID)
+        self.hot_logger.info("DICT updated : ", lambda: dict(dict=repr(session.last_clause_each_turn)))
+        self.file_logger.info("turn generated")
+
+    # DMIUs
+
+    def on_hard_interruption(self, session, iu):
+        self.terminal_logger.info("hard_interruption")
+        self.file_logger.info("hard_interruption")
+        session.first_clause = True
+        command = session.last_command_started_but_not_ended
+        if command is None:
+            self.terminal_logger.info("speaker interruption but no outputted audio yet")
+            self.file_logger.info("speaker interruption but no outputted audio yet")
+            return
+        # send the interrupted clause to the LLM module for alignement, and remove all the queued audio
+        alignment = dict(
+            clause_id=self.interrupted_clause(session, command),
+            turn_id=command.turnID,
+            event="interruption",
+            **self.word_alignment(session, command),
+        )
+        session.interrupt(HARD_INTERRUPTED, command.turnID)
+        session.gesture_inbox.clear()
+        self.forget_commands(session, command.turnID)
+        return [alignment]
+
+    def on_soft_interruption(self, session, iu):
+        command = session.last_command_started_but_not_ended
+        if command is None:
+            self.terminal_logger.info("speaker soft interruption but no outputted audio yet")
+            self.file_logger.info("speaker soft interruption but no outputted audio yet")
+            return
+        self.terminal_logger.info(
+            "soft_interruption", debug=True, clause_id=command.clauseID, turn_id=command.turnID, final=iu.final
+        )
+        self.file_logger.info("soft_interruption")
+        # the queued clauses are kept aside, until the DM decides to continue or not
+        session.interrupt(SOFT_INTERRUPTED, command.turnID)
+        session.interrupted_turn_iu_buffer = session.gesture_inbox.drain()
+        return [
+            dict(
+                clause_id=self.interrupted_clause(session, command),
+                turn_id=command.turnID,
+                final=iu.final,
+                event="interruption",
+                **self.word_alignment(session, command),
+            )
+        ]
+
+    def on_stop_turn(self, session, iu):
+        session.first_clause = True
+
+    def on_continue(self, session, iu):
+        self.terminal_logger.info("continue")
+        self.file_logger.info("continue")
+        turn_id = session.interrupted_turn_id
+        session.gesture_inbox.replace(session.interrupted_turn_iu_buffer)
+        session.resume()
+        self.schedule(session)
+        return [dict(clause_id=None, turn_id=turn_id, event="continue")]
+
+    def on_user_bot_same_turn(self, session, iu):
+        session.resume()
+
+    # UnityMessageIUs
+
+    def manual_command_ids(self, session, iu):
+        """Commands triggered from the Unity side for testing (e.g. John's space key) aren't sent by retico : they
+        are attributed to the last clause of the latest generated turn. Returns its (turnID, clauseID), None for
+        the other commands."""
+        if not str(iu.requestID).startswith(MANUAL_REQUEST_PREFIX):
+            return None
+        return session.last_clause_each_turn.latest()
+
+    def on_unity_start(self, session, iu):
+        self.stamp(session, latency.UNITY_START, iu.turnID, iu.clauseID)
+        scheduler = self.playback_schedulers.get(session.session_id)
+        if scheduler is not None:
+            scheduler.on_start(iu.turnID, iu.clauseID, iu.start_time)
+        self.hot_logger.info("command started", command=iu.requestID)
+        self.file_logger.info("command started", command=iu.requestID)
+        self.start_command(session, iu.turnID, iu.clauseID)
+        turn_id, clause_id = self.manual_command_ids(session, iu) or (iu.turnID, iu.clauseID)
+        previous = session.last_command_started_but_not_ended
+        session.last_command_started_but_not_ended = iu
+        if previous is None or (previous.turnID is not None and turn_id is not None and previous.turnID < turn_id):
+            self.file_logger.info("unity_agent_BOT")
+            return [dict(clause_id=clause_id, turn_id=turn_id, event="agent_BOT")]
+
+    def on_unity_completed(self, session, iu):
+        self.stamp(session, latency.UNITY_COMPLETED, iu.turnID, iu.clauseID)
+        if self.latency_tracker is not None and iu.start_time is not None and iu.end_time is not None:
+            self.latency_tracker.record(latency.UNITY_PLAYBACK, iu.end_time - iu.start_time)
+        self.hot_logger.info("command completed", command=iu.requestID)
+        self.file_logger.info("command completed", command=iu.requestID)
+        session.last_command_ended = iu
+        command = session.last_command_started_but_not_ended
+        if command is not None and command.requestID == iu.requestID:
+            session.last_command_started_but_not_ended = None
+
+        manual_ids = self.manual_command_ids(session, iu)
+        if manual_ids is not None:
+            turn_id, clause_id = manual_ids
+        else:
+            # EOT once every sub-chunk of the last clause of the turn has been completed
+            turn_id, clause_id = iu.turnID, iu.clauseID
+            if (
+                not self.complete_command(session, turn_id, clause_id)
+                or turn_id not in session.last_clause_each_turn
+                or session.last_clause_each_turn[turn_id] != clause_id
+            ):
+                return
+        self.terminal_logger.info(f"EOT : Turn {turn_id} finished (clause {clause_id})")
+        self.file_logger.info("unity_EOT")
+        return self.end_of_turn(session, turn_id, clause_id)
+
+    def on_unity_interrupted(self, session, iu):
+        self.hot_logger.info("command interrupted", command=iu.requestID)
+        self.file_logger.info("command interrupted", command=iu.requestID)
+        self.file_logger.info("unity_interruption")
+        scheduler = self.playback_schedulers.get(session.session_id)
+        if scheduler is not None:
+            scheduler.reset()
+        turn_id, clause_id = self.manual_command_ids(session, iu) or (iu.turnID, self.interrupted_clause(session, iu))
+        alignment = dict(clause_id=clause_id, turn_id=turn_id, event="interruption", **self.word_alignment(session, iu))
+        self.forget_commands(session, iu.turnID, iu.clauseID)
+        return [alignment]
+
+    def on_unity_aborted(self, session, iu):
+        self.hot_logger.info("command aborted", command=iu.requestID)
+        self.file_logger.info("command aborted", command=iu.requestID)
+        self.forget_commands(session, iu.turnID, iu.clauseID)
+
+    def end_of_turn(self, session, turnID, clauseID):
+        """Forget the turn, and return the alignments telling that it has been entirely played."""
+        del session.last_clause_each_turn[turnID]
+        session.word_timings_each_turn.pop(turnID, None)
+        self.forget_commands(session, turnID, previous_turns=True)
+        return [
+            dict(turn_id=turnID, clause_id=clauseID, event="ius_from_last_turn"),
+            dict(turn_id=turnID, clause_id=clauseID, event="agent_EOT"),
+        ]
+
+    def register_command(self, session, iu):
+        """Register a command sent to Unity for a clause, the last one of the clause being flagged `lastChunk`."""
+        audio = (getattr(iu, "audios", None) or [dict()])[0]
+        with session.lock:
+            commands = session.commands_each_clause.setdefault((iu.turnID, iu.clauseID), ClauseCommands())
+            if audio.get("lastChunk", True):
+                commands.nb_chunks = audio.get("chunkIndex", 0) + 1
+
+    def start_command(self, session, turnID, clauseID):
+        """Register the start of a command : Unity plays the chunks of a clause in order."""
+        with session.lock:
+            commands = session.commands_each_clause.get((turnID, clauseID))
+            if commands is not None:
+                commands.nb_started += 1
+
+    def playing_chunk(self, session, turnID, clauseID):
+        """Index of the sub-chunk of a clause that Unity started last (0 for the clauses that aren't streamed)."""
+        with session.lock:
+            commands = session.commands_each_clause.get((turnID, clauseID))
+            return max(commands.nb_started - 1, 0) if commands is not None else 0
+
+    def complete_command(self, session, turnID, clauseID):
+        """Register the completion of a command, returns True if the clause has been entirely played : the
+        commands of all its chunks, up to the last one, have been completed."""
+        with session.lock:
+            key = (turnID, clauseID)
+            commands = session.commands_each_clause.get(key)
+            if commands is None:
+                # not sent by this module's workers
+                return True
+            commands.nb_completed += 1
+            if commands.nb_chunks is None or commands.nb_completed < commands.nb_chunks:
+                return False
+            del session.commands_each_clause[key]
+            return True
+
+    def forget_commands(self, session, turn_id, clause_id=None, previous_turns=False):
+        """Forget the commands that won't be completed : those of a clause, of a turn, or of a turn and the turns
+        before it."""
+        with session.lock:
+            for key in list(session.commands_each_clause):
+                if (key[0] == turn_id or (previous_turns and key[0] < turn_id)) and clause_id in (None, key[1]):
+                    del session.commands_each_clause[key]
+
+    def index_word_timings(self, session, iu):
+        """Store the word timing table of a clause GestureIU, sub-chunks of a streamed clause are appended to the
+        table of their clause."""
+        audios = getattr(iu, "audios", None)
+        if not audios:
+            return
+        if getattr(iu, "clauseIDs", None):
+            # clauses merged into one command, indexed under its clauseID (the last clause)
+            word_timings = WordTimings.from_audios(audios, getattr(iu, "timings", None))
+        else:
+            animations = getattr(iu, "animations", None)
+            duration = animations[0].get("duration") if animations else None
+            word_timings = WordTimings.from_audio(audios[0], getattr(iu, "timings", None), duration)
+        clauses = session.word_timings_each_turn.setdefault(iu.turnID, dict())
+        if audios[0].get("chunkIndex", 0) > 0 and iu.clauseID in clauses:
+            clauses[iu.clauseID].append_chunk(word_timings)
+        else:
+            clauses[iu.clauseID] = word_timings
+
+    def spoken_index(self, session, word_timings, unity_iu):
+        """Index, in the word timing table of a command, of the word Unity was playing : the timingIndex of an
+        "interrupted" response or, if Unity doesn't send it, the word at the time elapsed between the start and
+        the end of the command. For a command that is still playing (its "start" response, when the DM interrupts
+        the agent before Unity answers), the word at the time elapsed since it started. The timingIndex and times
+        of a streamed clause are relative to the sub-chunk being played."""
+        chunk = self.playing_chunk(session, unity_iu.turnID, unity_iu.clauseID)
+        if unity_iu.status == "start":
+            if unity_iu.start_time is None:
+                return None
+            return word_timings.index_at(self.clock() - unity_iu.start_time, chunk)
+        if unity_iu.timingIndex is not None:
+            return word_timings.chunk_index(chunk, unity_iu.timingIndex)
+        if unity_iu.start_time is None or unity_iu.end_time is None:
+            return None
+        return word_timings.index_at(unity_iu.end_time - unity_iu.start_time, chunk)
+
+    def word_alignment(self, session, unity_iu):
+        """Resolve a Unity response to the word that was being spoken (see `spoken_index`), returns the
+        grounded_word, word_id and char_id to add to the SpeakerAlignementIU (empty if unknown)."""
+        word_timings = session.word_timings_each_turn.get(unity_iu.turnID, dict()).get(unity_iu.clauseID)
+        if word_timings is None:
+            return dict()
+        word = word_timings.word_at(self.spoken_index(session, word_timings, unity_iu))
+        if word is None:
+            return dict()
+        grounded_word, word_id, char_id = word
+        return dict(grounded_word=grounded_word, word_id=word_id, char_id=char_id)
+
+    def interrupted_clause(self, session, unity_iu):
+        """Clause being spoken when a command was interrupted : the clause of the command, or, for merged clauses,
+        the clause of the word being spoken."""
+        word_timings = session.word_timings_each_turn.get(unity_iu.turnID, dict()).get(unity_iu.clauseID)
+        clause_id = None
+        if word_timings is not None:
+            clause_id = word_timings.clause_at(self.spoken_index(session, word_timings, unity_iu))
+        return clause_id if clause_id is not None else unity_iu.clauseID
+
+    def stamp(self, session, stage, turn_id, clause_id):
+        if self.latency_tracker is not None and turn_id is not None:
+            self.latency_tracker.stamp(stage, latency.turn_key(turn_id, session.session_id), clause_id)
+
+    def create_speaker_alignement_iu(self, session, clause_id, turn_id, event, final=True, **alignment):
+        self.stamp(session, latency.ALIGNMENT_EMIT, turn_id, clause_id)
+        output_iu = SpeakerAlignementIU(
             creator=self,
             iuid=f"{hash(self)}:{self.iu_counter}",
             previous_iu=self._previous_iu,
@@ -304,28 +661,46 @@ class UnityCommunicatorModule(retico_core.abstract.AbstractModule):
             turn_id=turn_id,
             event=event,
             final=final,
+            **alignment,
         )
+        # tells the modules of each avatar which alignments are theirs
+        output_iu.sessionID = session.session_id
+        return output_iu
 
     def run_process(self):
+        # each worker serves one ready session at a time, sending one of its GestureIUs before handing it back
         while self._thread_active:
-            if len(self.current_input) == 0:
-                time.sleep(0.1)
-            else:
-                output_iu = self.current_input.pop(0)
-                if hasattr(output_iu, "final") and output_iu.final:
-                    self.terminal_logger.info("agent_EOT")
-                    self.file_logger.info("EOT")
-                else:
-                    self.terminal_logger.info("EOC")
-                    if self.first_clause:
-                        self.terminal_logger.info("start_answer_generation")
-                        self.file_logger.info("start_answer_generation")
-                        self.first_clause = False
-                    self.current_turn_id = output_iu.turnID
-
-                um = retico_core.UpdateMessage()
-                um.add_iu(output_iu, retico_core.UpdateType.ADD)
-                self.append(um)
+            session = self._ready_sessions.get()
+            if session is None:
+                continue
+            output_iu = session.gesture_inbox.get(timeout=0)
+            if output_iu is not None:
+                self.send_gesture(session, output_iu)
+            with session.lock:
+                session.scheduled = len(session.gesture_inbox) > 0
+            if session.scheduled:
+                self._ready_sessions.put(session)
+
+    def send_gesture(self, session, output_iu):
+        if hasattr(output_iu, "final") and output_iu.final:
+            self.hot_logger.info("agent_EOT")
+            self.file_logger.info("EOT")
+        elif output_iu.turnID == FILLER_TURN_ID:
+            self.hot_logger.info("filler")
+        else:
+            self.hot_logger.info("EOC")
+            if session.first_clause:
+                self.terminal_logger.info("start_answer_generation")
+                self.file_logger.info("start_answer_generation")
+                session.first_clause = False
+            session.current_turn_id = output_iu.turnID
+            self.register_command(session, output_iu)
+            for clause_id in getattr(output_iu, "clauseIDs", None) or [output_iu.clauseID]:
+                self.stamp(session, latency.AMQ_SEND, output_iu.turnID, clause_id)
+
+        um = retico_core.UpdateMessage()
+        um.add_iu(output_iu, retico_core.UpdateType.ADD)
+        self.append(um)
 
 
 """
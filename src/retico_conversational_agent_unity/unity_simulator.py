@@ -0,0 +1,326 @@
+"""
+Unity simulator
+===============
+
+Synthetic Unity clients, to load-test the UnityCommunicator and
+NonverbalGenerator modules without running Unity. Every simulated avatar
+is an asyncio STOMP client that consumes the commands (GestureIUs) sent by
+retico on its destination, plays them one after the other in simulated
+real time, and replies with the `Response` messages documented at the
+bottom of `unity_communicator.py` : `start` when a command starts playing,
+then `completed`, or `interrupted` (with the `timingIndex` of the word
+being spoken) when the simulated user interrupts the avatar. The
+remaining commands of an interrupted turn are answered with `aborted`.
+
+Dozens of avatars run in a single process and event loop. The destinations
+can contain an `{avatar}` field, to give each avatar its own topics, or
+the avatars can share the topics of a multi-session UnityCommunicatorModule
+(`sessions=True`) : each avatar then only plays the commands of its own
+sessionID (its avatar ID), and every response carries the sessionID of its
+command.
+
+    simulator = UnitySimulator(
+        nb_avatars=32,
+        port=61613,
+        destination_in="/topic/retico_out_{avatar}",
+        destination_out="/topic/unity_out_{avatar}",
+        jitter=0.02,
+        interruption_probability=0.05,
+    )
+    simulator.start()  # in a background thread, or `await simulator.run()`
+    ...
+    simulator.stop()
+    print(simulator.stats())
+
+Also usable from the command line :
+
+    python -m retico_conversational_agent_unity.unity_simulator --avatars 32 --port 61613
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import random
+import threading
+import time
+
+import msgpack
+
+from .local_broker import FrameReader, encode_frame
+
+
+def decode_message(body):
+    """Decode a command sent by the AMQWriter, as msgpack or JSON."""
+    try:
+        return msgpack.unpackb(body)
+    except Exception:
+        return json.loads(body)
+
+
+def command_delay(command):
+    """Delay in seconds after which a command starts once received : the smallest delay of its audios and
+    animations (set by the NonverbalGenerator's playback scheduler)."""
+    actions = (command.get("audios") or []) + (command.get("animations") or [])
+    return min((a.get("delay", 0) or 0 for a in actions), default=0)
+
+
+def playback_duration(command):
+    """Duration of a command in seconds, once started : the duration of its animations if set, else the length
+    of its WAV audio."""
+    delay = command_delay(command)
+    duration = max((a.get("duration", 0) + a.get("delay", 0) for a in command.get("animations") or []), default=0)
+    if duration:
+        return duration - delay
+    for audio in command.get("audios") or []:
+        data = audio.get("bytes")
+        codec = audio.get("codec") or {}
+        if isinstance(data, (bytes, bytearray)) and len(data) > 44 and codec.get("name", "wav").startswith("wav"):
+            rate = int.from_bytes(data[28:32], "little")  # byte rate of the WAV header
+            duration += (len(data) - 44) / rate if rate else 0
+    return duration
+
+
+class SimulatedAvatar:
+    """A simulated Unity avatar, connected to the broker with its own STOMP connection.
+
+    Args:
+        avatar_id (int): ID of the avatar, used in its destinations and request IDs.
+        host (str): broker host.
+        port (int): broker STOMP port.
+        destination_in (str): destination of the commands sent by retico.
+        destination_out (str): destination of the responses sent to retico.
+        speed (float): playback speed factor, 2 plays the commands twice faster than real time.
+        jitter (float): maximum random delay, in seconds, added before each command starts and to its playback.
+        interruption_probability (float): probability for each command to be interrupted during its playback.
+        message_is_bytes (bool): send the responses as msgpack if True, as JSON otherwise.
+        rng (random.Random, optional): random generator, for reproducible simulations.
+        session_id (optional): if set, the avatar only plays the commands with this sessionID.
+    """
+
+    def __init__(
+        self,
+        avatar_id,
+        host="127.0.0.1",
+        port=61613,
+        destination_in="/topic/retico_out",
+        destination_out="/topic/unity_out",
+        speed=1.0,
+        jitter=0.0,
+        interruption_probability=0.0,
+        message_is_bytes=True,
+        rng=None,
+        session_id=None,
+    ):
+        self.avatar_id = avatar_id
+        self.host = host
+        self.port = port
+        self.destination_in = destination_in.format(avatar=avatar_id)
+        self.destination_out = destination_out.format(avatar=avatar_id)
+        self.speed = speed
+        self.jitter = jitter
+        self.interruption_probability = interruption_probability
+        self.message_is_bytes = message_is_bytes
+        self.rng = rng or random.Random(avatar_id)
+        self.session_id = session_id
+        self.counts = collections.Counter()
+        self.start_delays = []
+        self._commands = None
+        self._writer = None
+        self._nb_requests = 0
+        self._interrupted_turn = None
+
+    async def run(self, connected=None):
+        """Connect, subscribe and play the received commands until cancelled, `connected` is called once the
+        subscription is acknowledged by the broker."""
+        self._commands = asyncio.Queue()
+        reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._send_frame("CONNECT", {"accept-version": "1.1,1.2", "host": self.host, "heart-beat": "0,0"})
+        self._send_frame(
+            "SUBSCRIBE",
+            {"destination": self.destination_in, "id": self.avatar_id, "ack": "auto", "receipt": "subscribed"},
+        )
+        await self._writer.drain()
+        player = asyncio.create_task(self._play())
+        frames = FrameReader()
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                frames.feed(data)
+                for command, _, body in frames.frames():
+                    if command == "MESSAGE":
+                        message = decode_message(body)
+                        if self.session_id is None or message.get("sessionID") == self.session_id:
+                            self._commands.put_nowait((time.monotonic(), message))
+                    elif command == "RECEIPT" and connected is not None:
+                        connected()
+        finally:
+            player.cancel()
+            self._writer.close()
+
+    async def _play(self):
+        while True:
+            received, command = await self._commands.get()
+            if not command.get("audios") and not command.get("animations"):
+                continue  # end of turn marker, nothing to play
+            self._nb_requests += 1
+            request_id = f"sim{self.avatar_id}:{self._nb_requests}"
+            if self._interrupted_turn is not None and command.get("turnID") == self._interrupted_turn:
+                await self._respond(command, request_id, "aborted")
+                continue
+            self._interrupted_turn = None
+
+            # scheduled commands start `delay` seconds after their reception, if the previous one has ended
+            wait = received + command_delay(command) / self.speed - time.monotonic()
+            await asyncio.sleep(max(wait, 0) + self.rng.uniform(0, self.jitter))
+            self.start_delays.append(time.monotonic() - received)
+            time_start = time.time()
+            await self._respond(command, request_id, "start", time_start=time_start)
+
+            duration = (playback_duration(command) + self.rng.uniform(0, self.jitter)) / self.speed
+            timings = command.get("timings") or [0]
+            if self.rng.random() < self.interruption_probability:
+                elapsed = self.rng.uniform(0, duration)
+                await asyncio.sleep(elapsed)
+                # index of the word being spoken, in the clause timings (in seconds of audio)
+                position = elapsed * self.speed
+                timing_index = max(sum(1 for t in timings if t <= position) - 1, 0)
+                self._interrupted_turn = command.get("turnID")
+                await self._respond(
+                    command, request_id, "interrupted", time_start, time.time(), timing_index=timing_index
+                )
+            else:
+                await asyncio.sleep(duration)
+                await self._respond(
+                    command, request_id, "completed", time_start, time.time(), timing_index=len(timings) - 1
+                )
+
+    async def _respond(self, command, request_id, status, time_start=None, time_end=None, timing_index=0):
+        response = {
+            "timestamp": time.strftime("%H:%M:%S"),
+            "requestID": request_id,
+            "turnID": command.get("turnID"),
+            "clauseID": command.get("clauseID"),
+            "status": status,
+            "timeStart": time_start,
+            "timeEnd": time_end,
+            "timingIndex": timing_index,
+            "sessionID": command.get("sessionID"),
+        }
+        body = msgpack.packb(response) if self.message_is_bytes else json.dumps(response)
+        self._send_frame("SEND", {"destination": self.destination_out}, body)
+        await self._writer.drain()
+        self.counts[status] += 1
+
+    def _send_frame(self, command, headers, body=b""):
+        self._writer.write(encode_frame(command, headers, body))
+
+
+class UnitySimulator:
+    """Runs `nb_avatars` simulated avatars in one event loop, the other arguments are passed to every
+    `SimulatedAvatar` (each avatar gets its own random generator, seeded with `seed` + its ID). If `sessions` is
+    True, the session ID of each avatar is its avatar ID."""
+
+    def __init__(self, nb_avatars=1, seed=0, sessions=False, **avatar_kwargs):
+        self.avatars = [
+            SimulatedAvatar(
+                avatar_id,
+                rng=random.Random(seed + avatar_id),
+                session_id=avatar_id if sessions else None,
+                **avatar_kwargs,
+            )
+            for avatar_id in range(nb_avatars)
+        ]
+        self._loop = None
+        self._thread = None
+        self._connected = threading.Event()
+
+    async def run(self):
+        """Run every avatar until cancelled or disconnected."""
+        self._loop = asyncio.get_running_loop()
+        nb_connected = [0]
+
+        def connected():
+            nb_connected[0] += 1
+            if nb_connected[0] == len(self.avatars):
+                self._connected.set()
+
+        await asyncio.gather(*[avatar.run(connected) for avatar in self.avatars])
+
+    def start(self, timeout=10):
+        """Run the simulator in a background thread, returns once every avatar is subscribed."""
+
+        def target():
+            try:
+                asyncio.run(self.run())
+            except asyncio.CancelledError:
+                pass
+
+        self._thread = threading.Thread(target=target, daemon=True)
+        self._thread.start()
+        if not self._connected.wait(timeout):
+            raise TimeoutError(f"simulated avatars not connected after {timeout}s")
+        return self
+
+    def stop(self, timeout=5):
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._cancel)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _cancel(self):
+        for task in asyncio.all_tasks(self._loop):
+            task.cancel()
+
+    def stats(self):
+        """Number of responses of each status, and the delay between the reception of a command and its
+        start, over every avatar."""
+        counts = sum((avatar.counts for avatar in self.avatars), collections.Counter())
+        delays = sorted(d for avatar in self.avatars for d in avatar.start_delays)
+        percentile = lambda q: delays[min(int(q * len(delays)), len(delays) - 1)] if delays else None
+        return {
+            "responses": dict(counts),
+            "start_delay": {
+                "count": len(delays),
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+            },
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--avatars", type=int, default=1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=61613)
+    parser.add_argument("--destination-in", default="/topic/retico_out", help="may contain {avatar}.")
+    parser.add_argument("--destination-out", default="/topic/unity_out", help="may contain {avatar}.")
+    parser.add_argument("--speed", type=float, default=1.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--interruption-probability", type=float, default=0.0)
+    parser.add_argument("--amq-type", default="bytes", choices=["bytes", "json"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sessions", action="store_true", help="filter the commands by sessionID.")
+    args = parser.parse_args()
+
+    simulator = UnitySimulator(
+        nb_avatars=args.avatars,
+        seed=args.seed,
+        sessions=args.sessions,
+        host=args.host,
+        port=args.port,
+        destination_in=args.destination_in,
+        destination_out=args.destination_out,
+        speed=args.speed,
+        jitter=args.jitter,
+        interruption_probability=args.interruption_probability,
+        message_is_bytes=args.amq_type == "bytes",
+    )
+    try:
+        asyncio.run(simulator.run())
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(simulator.stats(), indent=2))
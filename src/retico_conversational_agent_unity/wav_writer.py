@@ -0,0 +1,169 @@
+"""
+WAV writer
+==========
+
+Writes the clause audio files of the `store_audio` mode from a pool of
+background threads, so that the NonverbalGenerator thread never blocks on
+the disk.
+
+Writes can complete in any order, but the `on_committed` callbacks are
+called in submission order, so the GestureIUs built from them reach Unity
+in the order of the clauses. They are called outside of the writer's lock,
+and can submit new writes. A failed write calls its `on_failed` callback
+instead, e.g. to send the audio inline. Files are named after the session,
+turn and clause, and a retention policy (maximum number of files and total
+size, bounded by default) removes the oldest files of the session.
+"""
+
+import collections
+import concurrent.futures
+import functools
+import os
+import pathlib
+import threading
+import time
+
+
+class WavFileWriter:
+    """Pool of background threads writing WAV files.
+
+    Args:
+        folder (str, optional): folder where the files are written,
+            defaults to the `wav_files` folder of the package.
+        session_id (str, optional): prefix of the filenames, defaults to
+            the date and time of creation.
+        max_workers (int): number of writing threads.
+        max_files (int, optional): maximum number of files kept for the
+            session, the oldest ones are deleted first. None keeps them
+            all.
+        max_bytes (int, optional): maximum total size of the files kept
+            for the session, the oldest ones are deleted first. None keeps
+            them all.
+    """
+
+    def __init__(self, folder=None, session_id=None, max_workers=2, max_files=1000, max_bytes=2**30):
+        if folder is None:
+            folder = pathlib.Path(__file__).parent.resolve() / "wav_files"
+        self.folder = os.path.abspath(folder)
+        os.makedirs(self.folder, exist_ok=True)
+        self.session_id = session_id if session_id is not None else time.strftime("%Y%m%d-%H%M%S")
+        self.max_workers = max_workers
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.nb_evicted = 0
+        self._executor = None
+        self._lock = threading.Lock()
+        self._next_seq = 0
+        self._next_commit = 0
+        self._finished = dict()
+        self._files = collections.deque()
+        self._total_bytes = 0
+        # callbacks of the committed writes, called in order by one thread at a time
+        self._callbacks = collections.deque()
+        self._calling = False
+
+    def start(self):
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="WavFileWriter"
+            )
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def path(self, turn_id, clause_id):
+        return os.path.join(self.folder, f"{self.session_id}_turn_{turn_id}_clause_{clause_id}.wav")
+
+    def write(self, data, turn_id, clause_id, on_committed=None, on_failed=None):
+        """Write `data` (a complete WAV buffer) in the background.
+
+        Args:
+            on_committed (Callable[[str], None], optional): called with the
+                path of the file once it is written, after the callbacks of
+                every previous submission.
+            on_failed (Callable[[Exception], None], optional): called with
+                the exception if the file can't be written, in the same
+                order.
+
+        Returns:
+            concurrent.futures.Future: resolved with the path of the file.
+        """
+        self.start()
+        path = self.path(turn_id, clause_id)
+        seq = self._reserve_seq()
+        return self._executor.submit(self._write, seq, path, data, on_committed, on_failed)
+
+    def call_in_order(self, callback):
+        """Call `callback` once every previously submitted write is committed."""
+        self._commit(self._reserve_seq(), None, 0, callback)
+
+    def _reserve_seq(self):
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            return seq
+
+    def _write(self, seq, path, data, on_committed, on_failed):
+        try:
+            with open(path, "wb") as f:
+                f.write(data)
+        except Exception as e:
+            # the file isn't retained, and the sequence number is released so that later callbacks are not blocked
+            self._commit(seq, None, 0, None if on_failed is None else functools.partial(on_failed, e))
+            raise
+        self._commit(seq, path, len(data), None if on_committed is None else lambda: on_committed(path))
+        return path
+
+    def _commit(self, seq, path, nb_bytes, callback):
+        with self._lock:
+            self._finished[seq] = (path, nb_bytes, callback)
+            while self._next_commit in self._finished:
+                path, nb_bytes, callback = self._finished.pop(self._next_commit)
+                self._next_commit += 1
+                if path is not None:
+                    self._files.append((path, nb_bytes))
+                    self._total_bytes += nb_bytes
+                if callback is not None:
+                    self._callbacks.append(callback)
+            evicted = self._evict()
+            call = not self._calling and len(self._callbacks) > 0
+            self._calling = self._calling or call
+        for path in evicted:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if call:
+            self._call_callbacks()
+
+    def _call_callbacks(self):
+        # outside of the lock : the thread finding the callbacks ready calls them, and the ones that become ready
+        # meanwhile, so that they are called in order
+        while True:
+            with self._lock:
+                if len(self._callbacks) == 0:
+                    self._calling = False
+                    return
+                callback = self._callbacks.popleft()
+            try:
+                callback()
+            except BaseException:
+                # the next callbacks are called by the next commit
+                with self._lock:
+                    self._calling = False
+                raise
+
+    def _evict(self):
+        """Forget the oldest files beyond the retention policy, returns their paths."""
+        evicted = []
+        while self._files and (
+            (self.max_files is not None and len(self._files) > self.max_files)
+            or (self.max_bytes is not None and self._total_bytes > self.max_bytes)
+        ):
+            path, nb_bytes = self._files.popleft()
+            self._total_bytes -= nb_bytes
+            self.nb_evicted += 1
+            evicted.append(path)
+        return evicted
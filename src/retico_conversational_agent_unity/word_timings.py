@@ -0,0 +1,159 @@
+"""
+Word timings
+============
+
+Compact timing table of the words of a clause, built from the sequence of
+TextAlignedAudioIUs received from the TTS. Each TTS IU carries a chunk of
+audio and the word it is aligned with, so the start and end offsets of a
+word in the clause audio are the cumulated durations of the chunks before
+its first and after its last IU.
+
+The table is sent to Unity with the clause (`timings` holds the start of
+each word, in seconds), and the `timingIndex` that Unity sends back in
+its responses is an index in this table, resolved back to the word in
+O(1) with `word_at`. Without a timingIndex (e.g. while Unity is still
+playing the clause), the word is found from the time elapsed since the
+start of the clause with `index_at`.
+
+The sub-chunks of a streamed clause are appended to the table of their
+clause (`append_chunk`). Unity counts its timingIndex from the start of
+each chunk, so the table keeps the index of the first word of each chunk
+(`chunk_offsets`) and its start in the clause (`chunk_starts`).
+"""
+
+import bisect
+
+
+class WordTimings:
+    """Start/end offsets, in seconds, of the words of a clause.
+
+    Args:
+        words (list[str]): the grounded words.
+        starts (list[float]): start offset of each word in the clause audio.
+        ends (list[float]): end offset of each word in the clause audio.
+        word_ids (list[int]): TTS word_id of each word.
+        char_ids (list[int]): TTS char_id of each word.
+        clause_ids (list[int], optional): clause of each word, for the GestureIUs merging several clauses (see
+            ClauseBatcher).
+        duration (float, optional): duration of the audio, in seconds.
+    """
+
+    def __init__(
+        self, words=None, starts=None, ends=None, word_ids=None, char_ids=None, clause_ids=None, duration=None
+    ):
+        self.words = words if words is not None else []
+        self.starts = starts if starts is not None else []
+        self.ends = ends if ends is not None else []
+        self.word_ids = word_ids if word_ids is not None else [None] * len(self.words)
+        self.char_ids = char_ids if char_ids is not None else [None] * len(self.words)
+        self.clause_ids = clause_ids
+        self.duration = duration
+        self.chunk_offsets = [0]
+        self.chunk_starts = [0.0]
+
+    def __len__(self):
+        return len(self.words)
+
+    @classmethod
+    def from_ius(cls, clause_ius, bytes_per_second):
+        """Build the table from the TextAlignedAudioIUs of a clause.
+
+        A new word starts every time the IU's `word_id` changes (or its
+        `grounded_word`, if the TTS does not provide word ids).
+        """
+        timings = cls()
+        offset = 0
+        previous_key = None
+        for iu in clause_ius:
+            word_id = getattr(iu, "word_id", None)
+            key = word_id if word_id is not None else iu.grounded_word
+            start = offset / bytes_per_second
+            offset += memoryview(iu.raw_audio).nbytes
+            end = offset / bytes_per_second
+            if len(timings) == 0 or key != previous_key:
+                timings.words.append(iu.grounded_word)
+                timings.starts.append(round(start, 4))
+                timings.ends.append(round(end, 4))
+                timings.word_ids.append(word_id)
+                timings.char_ids.append(getattr(iu, "char_id", None))
+                previous_key = key
+            else:
+                timings.ends[-1] = round(end, 4)
+        return timings
+
+    @classmethod
+    def from_audio(cls, audio, timings, duration=None):
+        """Rebuild the table from an audio action and the `timings` of a GestureIU."""
+        words = audio.get("words", [])
+        return cls(
+            words=words,
+            starts=list(timings) if timings is not None else [],
+            word_ids=audio.get("wordIDs"),
+            char_ids=audio.get("charIDs"),
+            duration=duration,
+        )
+
+    @classmethod
+    def from_audios(cls, audios, timings):
+        """Rebuild the table of a GestureIU merging several clauses, from its audio actions (one per clause, with
+        their `clauseID`) and its `timings`."""
+        timings_table = cls(starts=list(timings) if timings is not None else [], word_ids=[], char_ids=[])
+        timings_table.clause_ids = []
+        for audio in audios:
+            words = audio.get("words", [])
+            timings_table.words.extend(words)
+            timings_table.word_ids.extend(audio.get("wordIDs") or [None] * len(words))
+            timings_table.char_ids.extend(audio.get("charIDs") or [None] * len(words))
+            timings_table.clause_ids.extend([audio.get("clauseID")] * len(words))
+        return timings_table
+
+    def append_chunk(self, chunk):
+        """Append the table of the next sub-chunk of the clause. A word whose audio spans the two chunks is kept
+        once, the timingIndex 0 of the chunk pointing to it."""
+        start = self.duration or 0.0
+        first = 0
+        if len(chunk) and len(self) and chunk.word_ids[0] is not None and chunk.word_ids[0] == self.word_ids[-1]:
+            first = 1
+        self.chunk_offsets.append(len(self) - first)
+        self.chunk_starts.append(start)
+        self.words.extend(chunk.words[first:])
+        self.starts.extend(round(chunk_start + start, 4) for chunk_start in chunk.starts[first:])
+        self.word_ids.extend(chunk.word_ids[first:])
+        self.char_ids.extend(chunk.char_ids[first:])
+        if self.duration is not None and chunk.duration is not None:
+            self.duration += chunk.duration
+        else:
+            self.duration = None
+
+    def chunk_index(self, chunk, timing_index):
+        """Index in the table of the word at `timing_index` in the sub-chunk `chunk`, None if unknown."""
+        if timing_index is None or not 0 <= chunk < len(self.chunk_offsets):
+            return None
+        return self.chunk_offsets[chunk] + timing_index
+
+    def clause_at(self, timing_index):
+        """Return the clause of the word at `timing_index` in a merged table, None if unknown."""
+        if self.clause_ids is None or timing_index is None or not 0 <= timing_index < len(self.clause_ids):
+            return None
+        return self.clause_ids[timing_index]
+
+    @property
+    def transcription(self):
+        return " ".join(w.strip() for w in self.words if w)
+
+    def word_at(self, timing_index):
+        """Return the (grounded_word, word_id, char_id) at `timing_index`, or None if out of range."""
+        if timing_index is None or not 0 <= timing_index < len(self.words):
+            return None
+        return self.words[timing_index], self.word_ids[timing_index], self.char_ids[timing_index]
+
+    def index_at(self, elapsed, chunk=0):
+        """Return the index of the word being spoken `elapsed` seconds after the start of the sub-chunk `chunk` of
+        the clause (the clause itself if it isn't streamed), or None if unknown."""
+        if not self.starts or not 0 <= chunk < len(self.chunk_starts):
+            return None
+        return max(bisect.bisect_right(self.starts, self.chunk_starts[chunk] + elapsed) - 1, 0)
+
+    def audio_fields(self):
+        """Fields added to the clause's audio action, so that the table can be rebuilt on the receiving side."""
+        return {"words": self.words, "wordIDs": self.word_ids, "charIDs": self.char_ids}
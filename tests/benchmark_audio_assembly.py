@@ -0,0 +1,51 @@
+"""Micro-benchmark of the clause audio assembly : repeated `bytes` concatenation
+followed by `convert_audio_PCM16_to_WAVPCM16` (previous implementation) against
+the preallocated buffer of `audio_utils.assemble_audio`."""
+
+import argparse
+import os
+import timeit
+
+import retico_core
+
+from retico_conversational_agent_unity import audio_utils
+
+
+def concatenate_then_convert(chunks, rate, sampwidth):
+    full_data = b""
+    for chunk in chunks:
+        full_data += bytes(chunk)
+    return retico_core.audio.convert_audio_PCM16_to_WAVPCM16(
+        raw_audio=full_data,
+        sample_rate=rate,
+        num_channels=1,
+        sampwidth=sampwidth,
+    )
+
+
+def preallocated(chunks, rate, sampwidth):
+    return audio_utils.assemble_audio(chunks, sample_rate=rate, num_channels=1, sampwidth=sampwidth)[0]
+
+
+def run(clause_duration, chunk_duration, rate, sampwidth, repeat):
+    chunk_size = int(chunk_duration * rate) * sampwidth
+    nb_chunks = int(clause_duration / chunk_duration)
+    chunks = [os.urandom(chunk_size) for _ in range(nb_chunks)]
+
+    assert bytes(preallocated(chunks, rate, sampwidth)) == bytes(concatenate_then_convert(chunks, rate, sampwidth))
+
+    for name, fun in [("concatenate + convert", concatenate_then_convert), ("preallocated", preallocated)]:
+        best = min(timeit.repeat(lambda: fun(chunks, rate, sampwidth), number=repeat, repeat=5)) / repeat
+        print(f"{name:<24} {nb_chunks:>4} chunks, {clause_duration:>5.1f}s clause : {best * 1e3:8.3f} ms per clause")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=int, default=48000)
+    parser.add_argument("--sampwidth", type=int, default=2)
+    parser.add_argument("--chunk-duration", type=float, default=0.02, help="duration of a TTS chunk in seconds.")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for clause_duration in [1, 5, 15]:
+        run(clause_duration, args.chunk_duration, args.rate, args.sampwidth, args.repeat)
@@ -0,0 +1,47 @@
+"""Benchmark of the clause audio codecs : bytes on the wire (size of the msgpack
+message carrying the clause) and encode time per clause, on the recorded
+speech of the `audios` folder."""
+
+import argparse
+import pathlib
+import timeit
+import wave
+
+import msgpack
+import numpy as np
+
+from retico_conversational_agent_unity import audio_codecs, audio_utils
+
+
+def load_mono_pcm(path):
+    with wave.open(path, "rb") as wav_file:
+        samples = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype=np.int16)
+        return samples.reshape(-1, wav_file.getnchannels())[:, 0].copy(), wav_file.getframerate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--downsample-rate", type=int, default=16000)
+    args = parser.parse_args()
+
+    codecs = [
+        audio_codecs.AudioCodec(),
+        audio_codecs.DownsampleCodec(sample_rate=args.downsample_rate),
+        audio_codecs.MuLawCodec(),
+        audio_codecs.DeltaZlibCodec(),
+    ]
+
+    for path in sorted(pathlib.Path(__file__).parent.resolve().glob("audios/*.wav")):
+        pcm, rate = load_mono_pcm(str(path))
+        wav, header_size = audio_utils.assemble_audio([pcm], sample_rate=rate)
+        duration = len(pcm) / rate
+        print(f"{path.name} ({duration:.2f}s, {rate} Hz)")
+        for codec in codecs:
+            payload, descriptor = codec.encode(wav, header_size, rate, 1, 2)
+            message = msgpack.packb({"audios": [{"bytes": payload, "codec": descriptor}]})
+            best = min(timeit.repeat(lambda: codec.encode(wav, header_size, rate, 1, 2), number=args.repeat, repeat=5))
+            print(
+                f"    {codec.name:<16} {len(message):>9} bytes on the wire"
+                f" ({len(message) / duration / 1000:6.1f} KB/s), encode {best / args.repeat * 1e3:7.3f} ms per clause"
+            )
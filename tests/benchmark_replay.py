@@ -0,0 +1,251 @@
+"""Offline replay benchmark of NonverbalGeneratorModule and UnityCommunicatorModule.
+
+Runs without an ActiveMQ install : an in-process `LocalStompBroker` stands
+in for ActiveMQ, and a synthetic Unity, listening on the broker, answers
+every command with `start` and `completed` responses after a simulated
+playback. Recorded TTS streams (TextAlignedAudioIUs) are replayed through
+the real modules and AMQ reader/writer, and the benchmark reports the
+throughput, the per-clause latencies of each stage (see `LatencyTracker`)
+and the memory used.
+
+A recording is a JSON file listing the turns, each turn being a list of
+clauses with the path of their audio (WAV PCM16) and their words :
+
+    {"turns": [[{"audio": "audios/hello16k.wav", "words": ["Hello,", "my", "name"]}, ...], ...]}
+
+Without recording, the WAV files of the `audios` folder are replayed.
+"""
+
+import argparse
+import heapq
+import json
+import pathlib
+import resource
+import threading
+import time
+import tracemalloc
+import wave
+
+import msgpack
+
+import retico_core
+import retico_amq as amq
+from retico_conversational_agent import TextAlignedAudioIU
+
+import retico_conversational_agent_unity as uagent
+from retico_conversational_agent_unity import audio_codecs
+from retico_conversational_agent_unity.local_broker import LocalStompBroker
+
+DESTINATION_RETICO_OUT = "/topic/retico_out"
+DESTINATION_UNITY_OUT = "/topic/unity_out"
+
+
+class ReplayTTSModule(retico_core.abstract.AbstractModule):
+    """Replays a recorded TTS stream, one update message per clause, like the TTS DM module."""
+
+    @staticmethod
+    def name():
+        return "ReplayTTS Module"
+
+    @staticmethod
+    def description():
+        return "A module replaying recorded TextAlignedAudioIUs."
+
+    @staticmethod
+    def input_ius():
+        return []
+
+    @staticmethod
+    def output_iu():
+        return TextAlignedAudioIU
+
+    def replay(self, turns, chunk_duration=0.2, realtime=False):
+        for turn_id, clauses in enumerate(turns):
+            char_id = 0
+            for clause_id, clause in enumerate(clauses):
+                pcm, rate = clause["pcm"], clause["rate"]
+                chunk_size = int(chunk_duration * rate) * 2
+                chunks = [pcm[i : i + chunk_size] for i in range(0, len(pcm), chunk_size)]
+                words = clause["words"]
+                ius = []
+                for i, chunk in enumerate(chunks):
+                    word_id = min(i * len(words) // len(chunks), len(words) - 1)
+                    ius.append(
+                        self.create_iu(
+                            raw_audio=chunk,
+                            rate=rate,
+                            sample_width=2,
+                            grounded_word=words[word_id],
+                            word_id=word_id,
+                            char_id=char_id + sum(len(w) + 1 for w in words[:word_id]),
+                            turn_id=turn_id,
+                            clause_id=clause_id,
+                        )
+                    )
+                char_id += sum(len(w) + 1 for w in words)
+                um = retico_core.UpdateMessage()
+                um.add_ius([(iu, retico_core.UpdateType.ADD) for iu in ius])
+                self.append(um)
+                if realtime:
+                    time.sleep(len(pcm) / (2 * rate))
+            um = retico_core.UpdateMessage()
+            um.add_iu(self.create_iu(turn_id=turn_id, final=True), retico_core.UpdateType.ADD)
+            self.append(um)
+
+
+class SyntheticUnity:
+    """Plays the commands received from the broker one after the other, in
+    simulated time (`speed` times faster than real time), and answers with
+    `start` and `completed` responses."""
+
+    def __init__(self, broker, speed=1.0):
+        self.broker = broker
+        self.speed = speed
+        self.busy_until = 0.0
+        self.nb_commands = 0
+        self._events = []
+        self._cond = threading.Condition()
+        self._running = True
+        broker.add_listener(DESTINATION_RETICO_OUT, self.on_command)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def on_command(self, body, headers):
+        command = msgpack.unpackb(body)
+        if not command.get("audios"):
+            return
+        duration = sum(a.get("duration", 0) for a in command.get("animations", [])) / self.speed
+        with self._cond:
+            self.nb_commands += 1
+            start = max(time.monotonic(), self.busy_until)
+            self.busy_until = start + duration
+            request_id = f"replay:{self.nb_commands}"
+            heapq.heappush(self._events, (start, self.nb_commands, "start", request_id, command))
+            heapq.heappush(self._events, (self.busy_until, self.nb_commands, "completed", request_id, command))
+            self._cond.notify()
+
+    def _run(self):
+        while self._running:
+            with self._cond:
+                while self._running and (not self._events or self._events[0][0] > time.monotonic()):
+                    self._cond.wait(None if not self._events else self._events[0][0] - time.monotonic())
+                if not self._running:
+                    return
+                _, _, status, request_id, command = heapq.heappop(self._events)
+            response = {
+                "timestamp": time.strftime("%H:%M:%S"),
+                "requestID": request_id,
+                "turnID": command.get("turnID"),
+                "clauseID": command.get("clauseID"),
+                "status": status,
+                "timeStart": time.time(),
+                "timeEnd": time.time() if status == "completed" else None,
+                "timingIndex": 0,
+            }
+            self.broker.publish(DESTINATION_UNITY_OUT, msgpack.packb(response))
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+
+def load_wav(path):
+    with wave.open(str(path), "rb") as wav_file:
+        if wav_file.getsampwidth() != 2:
+            raise ValueError(f"{path} is not a PCM16 file")
+        frames = wav_file.readframes(wav_file.getnframes())
+        channels = wav_file.getnchannels()
+        # keep the first channel
+        pcm = b"".join(frames[i : i + 2] for i in range(0, len(frames), 2 * channels)) if channels > 1 else frames
+        return pcm, wav_file.getframerate()
+
+
+def load_recording(path, nb_turns, nb_clauses):
+    folder = pathlib.Path(__file__).parent.resolve()
+    if path is None:
+        files = sorted(folder.glob("audios/*.wav"))
+        clauses = [{"audio": f, "words": ["replayed", "clause", "from", f.stem]} for f in files]
+        turns = [[clauses[(t + c) % len(clauses)] for c in range(nb_clauses)] for t in range(nb_turns)]
+    else:
+        with open(path) as f:
+            turns = json.load(f)["turns"]
+        folder = pathlib.Path(path).parent.resolve()
+    cache = dict()
+    for clauses in turns:
+        for clause in clauses:
+            audio = pathlib.Path(clause["audio"])
+            audio = audio if audio.is_absolute() else folder / audio
+            if audio not in cache:
+                cache[audio] = load_wav(audio)
+            clause["pcm"], clause["rate"] = cache[audio]
+    return turns
+
+
+def run(args):
+    turns = load_recording(args.recording, args.turns, args.clauses)
+    nb_clauses = sum(len(clauses) for clauses in turns)
+
+    tracemalloc.start()
+    tracker = uagent.LatencyTracker(max_clauses=nb_clauses + 1)
+    with LocalStompBroker() as broker:
+        unity = SyntheticUnity(broker, speed=args.speed)
+
+        tts = ReplayTTSModule()
+        nvg = uagent.NonverbalGeneratorModule(
+            stream_chunk_duration=args.stream_chunk_duration, codec=args.codec, latency_tracker=tracker
+        )
+        unity_comm = uagent.UnityCommunicatorModule(latency_tracker=tracker)
+        tts.subscribe(nvg)
+        nvg.subscribe(unity_comm)
+        amq.define_amq_network(
+            modules_out_dict=[{"module": unity_comm, "destination": DESTINATION_RETICO_OUT}],
+            modules_in_dict=[
+                {
+                    "destination": DESTINATION_UNITY_OUT,
+                    "iu_type": uagent.UnityMessageIU,
+                    "subscriber_modules": [unity_comm],
+                }
+            ],
+            ip="127.0.0.1",
+            port=broker.port,
+            message_out_is_bytes=True,
+            message_in_is_bytes=True,
+        )
+
+        retico_core.network.run(tts)
+        start = time.monotonic()
+        tts.replay(turns, realtime=args.realtime)
+        deadline = start + args.timeout
+        completed = 0
+        while completed < nb_clauses and time.monotonic() < deadline:
+            time.sleep(0.05)
+            completed = tracker.summary().get("tts_arrival->unity_completed", {}).get("count", 0)
+        duration = time.monotonic() - start
+        retico_core.network.stop(tts)
+        unity.stop()
+
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(
+            f"clauses completed      : {completed}/{nb_clauses} in {duration:.2f}s"
+            f" ({completed / duration:.1f} clauses/s)"
+        )
+        print(f"broker messages        : {broker.nb_messages} ({broker.nb_bytes / 1e6:.2f} MB)")
+        print(f"peak traced memory     : {peak_memory / 1e6:.2f} MB")
+        print(f"max resident set size  : {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3:.1f} MB")
+        print("latencies (seconds) :")
+        print(json.dumps(tracker.summary(), indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--recording", "-r", help="path of a JSON recording of TTS turns.", default=None)
+    parser.add_argument("--turns", type=int, default=10, help="number of turns, without recording.")
+    parser.add_argument("--clauses", type=int, default=5, help="number of clauses per turn, without recording.")
+    parser.add_argument("--speed", type=float, default=20.0, help="speed factor of the synthetic Unity playback.")
+    parser.add_argument("--realtime", action="store_true", help="replay the TTS stream in real time.")
+    parser.add_argument("--stream-chunk-duration", type=float, default=None)
+    parser.add_argument("--codec", default=None, choices=list(audio_codecs.CODECS))
+    parser.add_argument("--timeout", type=float, default=120.0)
+    run(parser.parse_args())
@@ -0,0 +1,65 @@
+"""Benchmark of the clause audio transport : audio bytes embedded in the msgpack
+message (current bytes path) against a reference to a `SharedAudioRing` segment.
+
+For each clause duration, reports the size of the serialized message and the
+time from the generator side (write + pack) to the reader side (unpack + read
+the audio). The broker hop itself is not included : it adds a cost
+proportional to the message size on top of these numbers."""
+
+import argparse
+import os
+import tempfile
+import timeit
+
+import msgpack
+
+from retico_conversational_agent_unity import audio_utils
+from retico_conversational_agent_unity.shared_audio import SharedAudioRing
+
+
+def command(audio):
+    return {
+        "turnID": 0,
+        "clauseID": 0,
+        "interrupt": 2,
+        "audios": [dict({"transcription": "TEST DEMO", "volume": 1}, **audio)],
+        "animations": [{"animation": "talking_4", "duration": 1.0, "delay": 0.0}],
+    }
+
+
+def bytes_path(wav):
+    message = msgpack.packb(command({"bytes": wav}))
+    return msgpack.unpackb(message)["audios"][0]["bytes"], len(message)
+
+
+def shared_path(wav, writer, reader):
+    message = msgpack.packb(command({"shm": writer.write(wav)}))
+    return reader.read(msgpack.unpackb(message)["audios"][0]["shm"]), len(message)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=int, default=48000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.gettempdir(), "benchmark_audio_ring.bin")
+    writer = SharedAudioRing(path=path, capacity=64 * 1024 * 1024)
+    reader = SharedAudioRing.open(path)
+
+    for clause_duration in [0.5, 2, 5, 10]:
+        pcm = os.urandom(int(clause_duration * args.rate) * 2)
+        wav = audio_utils.assemble_audio([pcm], sample_rate=args.rate)[0]
+        for name, fun in [
+            ("bytes", lambda: bytes_path(wav)),
+            ("shared memory", lambda: shared_path(wav, writer, reader)),
+        ]:
+            received, size = fun()
+            assert bytes(received) == bytes(wav)
+            best = min(timeit.repeat(fun, number=args.repeat, repeat=5)) / args.repeat
+            print(
+                f"{clause_duration:>4}s clause, {name:<14} : message {size:>9} bytes, {best * 1e3:7.3f} ms end to end"
+            )
+
+    reader.close()
+    writer.close(unlink=True)
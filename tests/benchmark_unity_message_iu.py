@@ -0,0 +1,78 @@
+"""Benchmark of the creation of UnityMessageIUs from decoded AMQ messages : construction rate and memory per
+instance of the UnityMessageIU (through its constructor and `from_message`), compared with an IU storing its fields
+in slots.
+
+Slots barely make the IU smaller, as `IncrementalUnit` keeps an instance dict, and don't make it faster to create.
+On 100000 messages (CPython 3.11) :
+
+    dict attributes, **kwargs            134146 IUs/s,     636 bytes per IU
+    dict attributes, from_message        165378 IUs/s,     636 bytes per IU
+    slots, **kwargs                      132264 IUs/s,     620 bytes per IU
+    slots, from_message                  167857 IUs/s,     620 bytes per IU
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import msgpack
+
+from retico_conversational_agent_unity import UnityCommunicatorModule, UnityMessageIU
+
+
+class SlottedUnityMessageIU(UnityMessageIU):
+    """UnityMessageIU storing its fields in slots."""
+
+    __slots__ = UnityMessageIU.FIELDS + ("sent_time", "start_time", "end_time")
+
+
+def messages(n):
+    now = time.time()
+    return [
+        msgpack.unpackb(
+            msgpack.packb(
+                {
+                    "timestamp": time.strftime("%H:%M:%S"),
+                    "requestID": f"152702025787:{i}",
+                    "turnID": i // 10,
+                    "clauseID": i % 10,
+                    "status": "completed",
+                    "timeStart": now + i,
+                    "timeEnd": now + i + 1.5,
+                    "timingIndex": 3,
+                }
+            )
+        )
+        for i in range(n)
+    ]
+
+
+def measure(name, create, decoded):
+    start = time.perf_counter()
+    for i, message in enumerate(decoded):
+        create(message, i)
+    duration = time.perf_counter() - start
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    ius = [create(message, i) for i, message in enumerate(decoded)]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<32} {len(decoded) / duration:>10.0f} IUs/s, {(after - before) / len(ius):>7.0f} bytes per IU")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nb-messages", type=int, default=100000)
+    args = parser.parse_args()
+
+    creator = UnityCommunicatorModule()
+    decoded = messages(args.nb_messages)
+    measure("dict attributes, **kwargs", lambda m, i: UnityMessageIU(creator=creator, iuid=i, **m), decoded)
+    measure(
+        "dict attributes, from_message",
+        lambda m, i: UnityMessageIU.from_message(m, creator=creator, iuid=i),
+        decoded,
+    )
+    measure("slots, **kwargs", lambda m, i: SlottedUnityMessageIU(creator=creator, iuid=i, **m), decoded)
+    measure("slots, from_message", lambda m, i: SlottedUnityMessageIU.from_message(m, creator=creator, iuid=i), decoded)
@@ -0,0 +1,73 @@
+"""Shared fixtures : factories of the TTS IUs of a clause, of Unity responses, and of NonverbalGenerator and
+UnityCommunicator modules whose outputs are captured instead of being sent to the next modules."""
+
+import types
+
+import pytest
+
+from retico_conversational_agent_unity.additional_IUs import UnityMessageIU
+from retico_conversational_agent_unity.nonverbal_generator import NonverbalGeneratorModule
+from retico_conversational_agent_unity.unity_communicator import UnityCommunicatorModule
+
+
+@pytest.fixture
+def tts_ius():
+    """`tts_ius(words, turn_id, clause_id)` : TextAlignedAudioIU-like objects of a clause, one per word, holding
+    `word_duration` seconds of audio each."""
+
+    def make(words=("so", "yes"), turn_id=0, clause_id=0, word_duration=0.01, rate=48000, final=False):
+        return [
+            types.SimpleNamespace(
+                raw_audio=b"\x01\x00" * int(rate * word_duration),
+                rate=rate,
+                sample_width=2,
+                grounded_word=word,
+                word_id=i,
+                char_id=None,
+                turn_id=turn_id,
+                clause_id=clause_id,
+                final=final,
+            )
+            for i, word in enumerate(words)
+        ]
+
+    return make
+
+
+@pytest.fixture
+def make_nvg():
+    """`make_nvg(**kwargs)` : a NonverbalGeneratorModule whose GestureIUs are SimpleNamespaces, not final unless
+    created with final=True."""
+
+    def make(**kwargs):
+        nvg = NonverbalGeneratorModule(**kwargs)
+        nvg.create_iu = lambda **fields: types.SimpleNamespace(**{"final": False, **fields})
+        return nvg
+
+    return make
+
+
+@pytest.fixture
+def make_unity_comm():
+    """`make_unity_comm(**kwargs)` : a UnityCommunicatorModule collecting the alignments it emits in its `emitted`
+    list, instead of creating SpeakerAlignementIUs."""
+
+    def make(**kwargs):
+        unity_comm = UnityCommunicatorModule(**kwargs)
+        unity_comm.emitted = []
+        unity_comm.emit_alignments = lambda session, alignments: unity_comm.emitted.extend(alignments)
+        return unity_comm
+
+    return make
+
+
+@pytest.fixture
+def unity_response():
+    """`unity_response(unity_comm, turn_id, clause_id, status, **fields)` : the UnityMessageIU of a response of
+    Unity to the command of a clause."""
+
+    def make(unity_comm, turn_id, clause_id, status, **fields):
+        fields.setdefault("requestID", f"req:{turn_id}:{clause_id}")
+        return UnityMessageIU(creator=unity_comm, iuid=0, turnID=turn_id, clauseID=clause_id, status=status, **fields)
+
+    return make
@@ -0,0 +1,75 @@
+import struct
+
+import numpy as np
+import pytest
+
+from retico_conversational_agent_unity import audio_codecs, audio_utils
+
+
+def wav(samples, sample_rate=48000, channels=1):
+    """WAV buffer of PCM16 samples, and the size of its header."""
+    return audio_utils.assemble_audio(
+        [np.asarray(samples, dtype=np.int16)], sample_rate=sample_rate, num_channels=channels
+    )
+
+
+def speech_like(nb_samples, channels=1, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(nb_samples)[:, None]
+    signal = 8000 * np.sin(2 * np.pi * 220 * t / 48000) + rng.normal(0, 500, (nb_samples, channels))
+    return np.clip(signal, -32768, 32767).astype(np.int16)
+
+
+def test_delta_zlib_is_lossless():
+    codec = audio_codecs.get_codec("delta_zlib")
+    samples = speech_like(4800, channels=2)
+    samples[:4] = [[32767, -32768], [-32768, 32767], [0, 0], [32767, 32767]]  # wrapping differences
+    data, header_size = wav(samples.ravel(), channels=2)
+    payload, descriptor = codec.encode(data, header_size, 48000, 2, 2)
+    assert descriptor == {"name": "delta_zlib", "sampleRate": 48000, "channels": 2, "sampleWidth": 2}
+    assert codec.decode(payload, descriptor) == samples.tobytes()
+    assert len(payload) < len(data)
+
+
+def test_ulaw_halves_the_size_within_the_quantization_error():
+    codec = audio_codecs.MuLawCodec()
+    samples = speech_like(4800).ravel()
+    data, header_size = wav(samples)
+    payload, descriptor = codec.encode(data, header_size, 48000, 1, 2)
+    assert len(payload) == len(samples)
+    decoded = np.frombuffer(codec.decode(payload, descriptor), dtype=np.int16).astype(np.int32)
+    # 4 bits of mantissa per exponent segment
+    assert np.all(np.abs(decoded - samples) <= np.maximum(np.abs(samples) / 16, 8) + 8)
+    silence, _ = codec.encode(*wav([0, 0]), 48000, 1, 2)
+    assert silence == b"\xff\xff"
+
+
+@pytest.mark.parametrize("sample_rate", [48000, 44100])
+def test_downsample_resamples_to_a_playable_wav(sample_rate):
+    codec = audio_codecs.get_codec("wav_downsample")
+    samples = np.full(sample_rate // 10, 1000, dtype=np.int16)
+    payload, descriptor = codec.encode(*wav(samples, sample_rate), sample_rate, 1, 2)
+    assert descriptor["sampleRate"] == 16000
+    assert payload[:4] == b"RIFF" and struct.unpack_from("<I", payload, 24)[0] == 16000
+    decoded = np.frombuffer(codec.decode(payload, descriptor), dtype=np.int16)
+    assert abs(len(decoded) - 1600) <= 1 and np.all(decoded == 1000)
+    # audio already at or below the target rate is sent as is
+    data, header_size = wav(samples[:160], 16000)
+    assert codec.encode(data, header_size, 16000, 1, 2)[0] is data
+
+
+def test_codecs_are_looked_up_by_name():
+    codec = audio_codecs.DeltaZlibCodec(level=6)
+    assert audio_codecs.get_codec(codec) is codec and audio_codecs.get_codec(None) is None
+    assert isinstance(audio_codecs.get_codec("wav"), audio_codecs.AudioCodec)
+    with pytest.raises(ValueError):
+        audio_codecs.get_codec("mp3")
+    with pytest.raises(ValueError):
+        audio_codecs.MuLawCodec().encode(bytearray(48), 44, 48000, 1, 4)
+
+
+def test_nonverbal_generator_sends_the_encoded_audio(tts_ius, make_nvg):
+    nvg = make_nvg(codec="ulaw")
+    iu = nvg.generate_nonverbal_one_clause_audio_bytes(tts_ius(["so", "yes"]))
+    audio = iu.audios[0]
+    assert audio["codec"]["name"] == "ulaw" and len(audio["bytes"]) == 2 * 480
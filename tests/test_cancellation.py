@@ -0,0 +1,54 @@
+import threading
+
+import pytest
+
+from retico_conversational_agent_unity import audio_utils
+from retico_conversational_agent_unity.cancellation import ClauseCancelled, TurnCancellations
+
+
+def test_cancelled_token_aborts_the_assembly():
+    cancellations = TurnCancellations()
+    token = cancellations.token(3)
+    assert audio_utils.assemble_audio([b"\x00\x00"] * 3, 48000, token=token)[0][-6:] == b"\x00" * 6
+    cancellations.cancel(3)
+    assert cancellations.cancelled(3) and not cancellations.cancelled(4)
+    with pytest.raises(ClauseCancelled):
+        audio_utils.assemble_audio([b"\x00\x00"] * 3, 48000, token=token)
+    # a resumed turn gets a new token
+    cancellations.renew(3)
+    assert not cancellations.token(3).cancelled and token.cancelled
+
+
+def test_interruption_during_encoding_never_reaches_unity(tts_ius, make_nvg):
+    nvg = make_nvg(lipsync=True)
+    clause_actions = nvg.clause_actions
+
+    def interrupted_clause_actions(*args, **kwargs):
+        # the user barges in while the mouth blendshapes are computed
+        nvg.cancellations.cancel(0)
+        return clause_actions(*args, **kwargs)
+
+    nvg.clause_actions = interrupted_clause_actions
+    with pytest.raises(ClauseCancelled):
+        nvg.process_clause(tts_ius(turn_id=0, word_duration=0.1))
+    assert len(nvg.output_buffer) == 0
+
+    # a clause encoded before the interruption is dropped by the sending thread
+    nvg.clause_actions = clause_actions
+    nvg.process_clause(tts_ius(turn_id=1, word_duration=0.1))
+    nvg.cancellations.cancel(1)
+    sent, next_turn_sent = [], threading.Event()
+
+    def send_iu(iu):
+        sent.append(iu)
+        next_turn_sent.set()
+
+    nvg.send_iu = send_iu
+    nvg.prepare_run()
+    try:
+        nvg.enqueue_clause(tts_ius(turn_id=2, word_duration=0.1))
+        assert next_turn_sent.wait(timeout=5)
+    finally:
+        nvg.shutdown()
+    assert [iu.turnID for iu in sent] == [2]
+    assert nvg.nb_cancelled_clauses == 1
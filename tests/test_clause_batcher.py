@@ -0,0 +1,92 @@
+import types
+
+import pytest
+
+from retico_conversational_agent_unity import unity_communicator as uc
+from retico_conversational_agent_unity.clause_batcher import ClauseBatcher
+from retico_conversational_agent_unity.shared_audio import SharedAudioRing
+
+
+def clause_actions(words, duration):
+    return {
+        "audios": [{"words": words, "wordIDs": list(range(len(words))), "bytes": b"x", "delay": 0.0}],
+        "animations": [{"animation": "talking_4", "duration": duration, "delay": 0.0}],
+        "timings": [0.1 * i for i in range(len(words))],
+        "blendshapes": [{"id": "jawOpen", "value": 0.3, "duration": 0.1, "delay": 0.05}],
+    }
+
+
+def test_merge_offsets_the_actions_of_each_clause():
+    batcher = ClauseBatcher()
+    merged = batcher.merge([(3, clause_actions(["okay"], 0.4), 0.4), (4, clause_actions(["so", "yes"], 0.6), 0.6)])
+    assert merged["clauseIDs"] == [3, 4]
+    assert [(a["clauseID"], a["delay"], a["timingOffset"]) for a in merged["audios"]] == [(3, 0.0, 0), (4, 0.4, 1)]
+    assert merged["timings"] == pytest.approx([0.0, 0.4, 0.5])
+    assert merged["animations"] == [{"animation": "talking_4", "duration": 1.0, "delay": 0.0}]
+    assert [b["delay"] for b in merged["blendshapes"]] == pytest.approx([0.05, 0.45])
+    assert batcher.accepts([0.4, 0.6], 2.0) and not batcher.accepts([0.4, 0.6], 3.5)
+    assert batcher.metrics() == {"clauses": 2, "batches": 1, "clauses_per_batch": 2.0}
+
+
+def test_nonverbal_generator_coalesces_the_short_clauses_of_a_turn(tts_ius, make_nvg):
+    nvg = make_nvg(clause_batcher=ClauseBatcher(window=0.05))
+    nvg._thread_active = True
+    nvg.clause_ius_buffer.put(tts_ius(["so"], clause_id=1))
+    nvg.clause_ius_buffer.put(tts_ius(["yes", "indeed"], clause_id=2))
+    next_turn = tts_ius(["hello"], turn_id=1, clause_id=0)
+    nvg.clause_ius_buffer.put(next_turn)
+
+    [merged] = nvg.generate_nonverbal_coalesced_clauses(tts_ius(["okay"]))
+    assert (merged.turnID, merged.clauseID, merged.clauseIDs) == (0, 2, [0, 1, 2])
+    assert [a["words"] for a in merged.audios] == [["okay"], ["so"], ["yes", "indeed"]]
+    assert all(a["bytes"][:4] == b"RIFF" for a in merged.audios)
+    assert len(merged.timings) == 4
+    # the clause of the next turn isn't merged, it is processed next, unless the agent is interrupted meanwhile
+    assert nvg._next_clause_ius is next_turn
+    nvg.clear_audio()
+    assert nvg._next_clause_ius is None
+
+
+def test_clauses_that_cant_join_the_batch_are_encoded_once(tmp_path, tts_ius, make_nvg):
+    ring = SharedAudioRing(path=tmp_path / "ring.bin", capacity=2**20)
+    nvg = make_nvg(clause_batcher=ClauseBatcher(window=0.05), shared_audio_ring=ring)
+    encoded, encode_clause = [], nvg.encode_clause
+
+    def counted_encode_clause(clause_ius, *args):
+        encoded.append(clause_ius[-1].clause_id)
+        return encode_clause(clause_ius, *args)
+
+    nvg.encode_clause = counted_encode_clause
+    nvg._thread_active = True
+    long_clause = tts_ius(["a", "long", "clause"], clause_id=1, word_duration=0.5)
+    nvg.clause_ius_buffer.put(long_clause)
+
+    [short] = nvg.generate_nonverbal_coalesced_clauses(tts_ius(["okay"]))
+    assert short.clauseID == 0 and nvg._next_clause_ius is long_clause
+    # the long clause wasn't encoded, nor written in the shared audio ring, to be rejected
+    assert encoded == [0] and ring.write(b"x")["offset"] == short.audios[0]["shm"]["length"]
+    nvg.process_clause(long_clause)
+    assert encoded == [0, 1]
+    ring.close()
+
+
+def test_unity_communicator_resolves_the_clauses_of_a_merged_command(make_unity_comm, unity_response):
+    unity_comm = make_unity_comm()
+    emitted = unity_comm.emitted
+    session = unity_comm.session()
+    clauses = [(0, clause_actions(["okay"], 0.4), 0.4), (1, clause_actions(["so", "yes"], 0.6), 0.6)]
+    merged = types.SimpleNamespace(turnID=0, clauseID=1, final=False, sessionID=None, **ClauseBatcher().merge(clauses))
+    unity_comm.handle_event(session, uc.GESTURE_EVENT, merged)
+    unity_comm.handle_event(session, uc.GESTURE_EVENT, types.SimpleNamespace(turnID=0, clauseID=None, final=True))
+
+    def response(status, timing_index=None):
+        return unity_response(unity_comm, 0, 1, status, timingIndex=timing_index)
+
+    word_timings = session.word_timings_each_turn[0][1]
+    assert word_timings.words == ["okay", "so", "yes"] and word_timings.clause_at(0) == 0
+    assert unity_comm.interrupted_clause(session, response("interrupted", timing_index=0)) == 0
+    assert unity_comm.interrupted_clause(session, response("interrupted", timing_index=2)) == 1
+    # the end of turn is detected on the completion of the merged command, whose clauseID is the last clause
+    unity_comm.handle_event(session, uc.UNITY_EVENT, response("start"))
+    unity_comm.handle_event(session, uc.UNITY_EVENT, response("completed"))
+    assert [a["event"] for a in emitted][-1] == "agent_EOT"
@@ -0,0 +1,92 @@
+import types
+
+from retico_conversational_agent_unity import unity_communicator as uc
+from retico_conversational_agent_unity.filler_cache import FILLER_TURN_ID, FillerAudioCache, normalize_text
+
+
+def actions(text):
+    return {"audios": [{"transcription": text, "volume": 1, "bytes": b"x"}], "timings": [0.0]}
+
+
+def test_cache_keys_on_normalized_text_and_evicts_least_recently_used():
+    assert normalize_text("  Okay,   I SEE! ") == "okay, i see"
+    cache = FillerAudioCache(max_entries=2, max_bytes=10)
+    cache.put("Okay.", "jenny", 48000, actions("okay"), b"1234")
+    cache.put("Hmm", "jenny", 48000, actions("hmm"), b"1234")
+    assert cache.get("okay", "jenny", 48000) is not None
+    assert cache.get("okay", "vctk", 48000) is None
+    # over the byte budget : "hmm" is the least recently used
+    cache.put("I see", "jenny", 48000, actions("i see"), b"12345")
+    assert ("hmm", "jenny", 48000) not in cache and len(cache) == 2
+    # over the entry budget
+    cache.put("Right", "jenny", 48000, actions("right"), b"1")
+    assert ("okay", "jenny", 48000) not in cache
+    entry = cache.get("i see", "jenny", 48000)
+    assert entry.payload == b"12345" and "bytes" not in entry.actions["audios"][0]
+    assert cache.metrics() == {"size": 2, "bytes": 6, "hits": 2, "misses": 1, "evicted": 2}
+
+
+def test_cache_persists_between_runs(tmp_path):
+    path = str(tmp_path / "cache" / "fillers.msgpack")
+    cache = FillerAudioCache(phrases=["Okay", "Hmm"], path=path)
+    cache.warm(lambda text: (actions(text), text.encode()), "jenny", 48000)
+    cache.save()
+    reloaded = FillerAudioCache(path=path)
+    assert reloaded.get("OKAY!", "jenny", 48000).payload == b"okay"
+    assert len(reloaded) == 2
+
+
+def test_nonverbal_generator_caches_and_sends_fillers(tts_ius, make_nvg):
+    cache = FillerAudioCache(phrases=["okay"])
+    nvg = make_nvg(filler_cache=cache, voice="jenny")
+
+    assert not nvg.send_filler("Okay!")
+    # cached under the module's tts_framerate, the key of the lookups, whatever the rate of the TTS IUs
+    nvg.generate_nonverbal_one_clause_audio_bytes(tts_ius(["Okay"], rate=24000, word_duration=0.02))
+    nvg.generate_nonverbal_one_clause_audio_bytes(tts_ius(["Sure", "thing"]))
+    assert len(cache) == 1
+
+    assert nvg.send_filler("Okay!")
+    assert nvg.send_filler("okay")
+    sent = nvg.output_buffer.drain()
+    assert [(iu.turnID, iu.clauseID) for iu in sent] == [(FILLER_TURN_ID, 1), (FILLER_TURN_ID, 2)]
+    assert sent[0].audios[0]["bytes"][:4] == b"RIFF" and sent[0].timings == [0.0]
+    # the cached entry isn't modified by the sent clauses
+    assert "bytes" not in cache.get("okay", "jenny", 48000).actions["audios"][0]
+
+
+def test_fillers_are_dropped_but_not_cancelled_by_interruptions(tts_ius, make_nvg):
+    nvg = make_nvg(filler_cache=FillerAudioCache(phrases=["okay"]), voice="jenny")
+    nvg.generate_nonverbal_one_clause_audio_bytes(tts_ius(["Okay"]))
+    nvg.send_filler("okay")
+    # interrupted before the first generated turn, whose current turn is the filler turn
+    nvg.cancel_turn(nvg.current_turn_id)
+    nvg.clear_audio()
+    assert len(nvg.output_buffer) == 0 and not nvg.cancellations.cancelled(FILLER_TURN_ID)
+    nvg.send_filler("okay")
+    assert len(nvg.output_buffer) == 1
+
+
+def test_fillers_are_played_outside_of_the_turns(make_unity_comm, unity_response):
+    unity_comm = make_unity_comm()
+    emitted = unity_comm.emitted
+    session = unity_comm.session()
+    filler = types.SimpleNamespace(turnID=FILLER_TURN_ID, clauseID=1, final=False, audios=[{"words": ["okay"]}])
+
+    def response(turn_id, clause_id, status):
+        return unity_response(unity_comm, turn_id, clause_id, status)
+
+    unity_comm.handle_event(session, uc.GESTURE_EVENT, filler)
+    unity_comm.handle_event(session, uc.UNITY_EVENT, response(FILLER_TURN_ID, 1, "start"))
+    assert len(session.gesture_inbox) == 1 and session.last_command_started_but_not_ended is None
+    unity_comm.handle_event(session, uc.UNITY_EVENT, response(FILLER_TURN_ID, 1, "interrupted"))
+    unity_comm.handle_event(session, uc.UNITY_EVENT, response(FILLER_TURN_ID, 1, "completed"))
+    assert emitted == [] and FILLER_TURN_ID not in session.word_timings_each_turn
+
+    # a filler played during a hard interruption doesn't resume the interrupted turn
+    unity_comm.handle_event(session, uc.UNITY_EVENT, response(0, 0, "start"))
+    hard = types.SimpleNamespace(action="hard_interruption", event=None, turn_id=0, final=False)
+    unity_comm.handle_event(session, uc.DM_EVENT, hard)
+    unity_comm.handle_event(session, uc.GESTURE_EVENT, filler)
+    assert session.state == uc.HARD_INTERRUPTED and len(session.gesture_inbox) == 1
+    assert [(a["event"], a["turn_id"]) for a in emitted] == [("agent_BOT", 0), ("interruption", 0)]
@@ -0,0 +1,55 @@
+import time
+
+import pytest
+
+from retico_conversational_agent_unity import hot_logging
+from retico_conversational_agent_unity.hot_logging import HotPathLogger
+
+
+class RecordingLogger:
+    def __init__(self):
+        self.records = []
+
+    def info(self, event, **kwargs):
+        self.records.append((event, kwargs))
+
+
+@pytest.fixture(autouse=True)
+def reset_configuration():
+    yield
+    hot_logging.configure()
+
+
+def test_dropped_records_are_not_built():
+    structlog = pytest.importorskip("structlog")
+
+    def only_warnings(_, level, event_dict):
+        if event_dict["level"] != "warning" and event_dict["module"] != "Logged Module":
+            raise structlog.DropEvent
+        return event_dict
+
+    hot_logging.configure(filters=[only_warnings], background=False)
+    logger = RecordingLogger()
+    hot_logger = HotPathLogger(logger, module="Other Module")
+
+    def expensive():
+        raise AssertionError("built for a dropped record")
+
+    hot_logger.info("process_update", expensive)
+    assert not hot_logger.enabled("process_update")
+    assert logger.records == []
+    assert HotPathLogger(logger, module="Logged Module").enabled("process_update")
+
+
+def test_sampling_and_background_delivery():
+    hot_logging.configure(sampling={"process_update": 10}, flush_interval=0.001)
+    logger = RecordingLogger()
+    hot_logger = HotPathLogger(logger, module="Logged Module")
+    for i in range(100):
+        hot_logger.info("process_update", lambda i=i: dict(i=i))
+    hot_logger.info("EOC", turn=1)
+
+    deadline = time.monotonic() + 2
+    while len(logger.records) < 11 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert logger.records == [("process_update", {"i": i}) for i in range(0, 100, 10)] + [("EOC", {"turn": 1})]
@@ -0,0 +1,98 @@
+import statistics
+import threading
+import time
+
+import pytest
+
+from retico_conversational_agent_unity.inbox import Inbox, PriorityInbox
+
+
+def test_inbox_fifo():
+    inbox = Inbox()
+    for i in range(5):
+        inbox.put(i)
+    assert len(inbox) == 5
+    assert [inbox.get(timeout=0) for _ in range(5)] == list(range(5))
+    assert inbox.get(timeout=0) is None
+
+
+def test_inbox_close_wakes_consumer():
+    inbox = Inbox()
+    result = []
+    consumer = threading.Thread(target=lambda: result.append(inbox.get()))
+    consumer.start()
+    time.sleep(0.05)
+    inbox.close()
+    consumer.join(timeout=1)
+    assert not consumer.is_alive()
+    assert result == [None]
+
+
+@pytest.mark.parametrize("inbox_class", [Inbox, PriorityInbox])
+def test_inbox_handoff_latency(inbox_class):
+    """The consumer must be woken up by `put`, not by a polling period."""
+    inbox = inbox_class()
+    nb_items = 200
+    latencies = []
+
+    def consumer():
+        for _ in range(nb_items):
+            sent_at = inbox.get(timeout=1)
+            latencies.append(time.perf_counter() - sent_at)
+
+    thread = threading.Thread(target=consumer)
+    thread.start()
+    for _ in range(nb_items):
+        inbox.put(time.perf_counter())
+        time.sleep(0.002)
+    thread.join(timeout=5)
+
+    assert len(latencies) == nb_items
+    assert statistics.median(latencies) < 0.001
+    # a polling consumer would wait up to its period, e.g. the 0.1s of a queue.get timeout
+    assert max(latencies) < 0.05
+
+
+def test_inbox_drop_policies():
+    oldest = Inbox(maxsize=2, policy="drop_oldest")
+    newest = Inbox(maxsize=2, policy="drop_newest")
+    for i in range(4):
+        oldest.put(i)
+        newest.put(i)
+    assert oldest.drain() == [2, 3]
+    assert newest.drain() == [0, 1]
+    assert oldest.nb_dropped == newest.nb_dropped == 2
+
+
+def test_inbox_block_policy_applies_backpressure():
+    inbox = Inbox(maxsize=1, policy="block")
+    inbox.put(0)
+    assert not inbox.put(1, timeout=0.01)
+    threading.Timer(0.05, inbox.get).start()
+    assert inbox.put(2, timeout=1)
+    assert inbox.drain() == [2]
+
+
+def test_inbox_drain_and_replace():
+    inbox = Inbox()
+    for i in range(3):
+        inbox.put(i)
+    drained = inbox.drain()
+    assert len(inbox) == 0
+    inbox.replace(drained)
+    assert inbox.get(timeout=0) == 0
+    assert len(inbox) == 2
+
+
+def test_priority_inbox_serves_the_most_urgent_lane_first():
+    inbox = PriorityInbox(nb_lanes=2, maxsize=2, policy="drop_newest")
+    inbox.put("audio 0")
+    inbox.put("audio 1")
+    assert not inbox.put("audio 2")
+    # the control lane isn't bounded
+    assert inbox.put("control", lane=0)
+    assert inbox.get(timeout=0) == "control"
+    assert inbox.get(timeout=0) == "audio 0"
+    inbox.put("control", lane=0)
+    inbox.clear(lane=1)
+    assert inbox.drain() == ["control"]
@@ -0,0 +1,85 @@
+import json
+import types
+
+import pytest
+
+from retico_conversational_agent_unity import latency_tracker as latency
+from retico_conversational_agent_unity import unity_communicator as uc
+from retico_conversational_agent_unity.additional_IUs import UnityMessageIU
+
+
+def test_stamps_record_the_time_between_consecutive_stages():
+    clock = types.SimpleNamespace(now=10.0)
+    tracker = latency.LatencyTracker(clock=lambda: clock.now)
+    tracker.stamp(latency.TTS_ARRIVAL, 0, 0)
+    clock.now = 10.02
+    tracker.stamp(latency.GESTURE_EMIT, 0, 0)
+    # only the first stamp of a stage counts (e.g. the first sub-chunk of a streamed clause)
+    tracker.stamp(latency.GESTURE_EMIT, 0, 0, t=11.0)
+    tracker.stamp(latency.UNITY_START, 0, 0, t=10.5)
+    summary = tracker.summary()
+    assert sorted(summary) == [
+        "gesture_emit->unity_start",
+        "tts_arrival->gesture_emit",
+        "tts_arrival->unity_start",
+    ]
+    assert summary["tts_arrival->gesture_emit"]["count"] == 1
+    assert summary["tts_arrival->gesture_emit"]["mean"] == pytest.approx(0.02)
+    assert summary["tts_arrival->unity_start"]["max"] == pytest.approx(0.5)
+    assert json.loads(tracker.to_json()) == summary
+
+
+def test_percentiles_are_bounded_by_the_bucket_width():
+    histogram = latency.LatencyHistogram(buckets_per_decade=20)
+    for i in range(1, 101):
+        histogram.record(i / 1000)
+    # upper bound of the bucket : at most 10^(1/20) (12%) above the exact percentile
+    assert 0.050 <= histogram.percentile(0.5) <= 0.050 * 1.13
+    assert 0.099 <= histogram.percentile(0.99) <= 0.1
+    assert latency.LatencyHistogram().percentile(0.5) is None
+
+
+def test_only_the_stamps_of_the_latest_clauses_are_kept():
+    tracker = latency.LatencyTracker(max_clauses=2)
+    for clause_id in range(3):
+        tracker.stamp(latency.TTS_ARRIVAL, 0, clause_id, t=0.0)
+    tracker.stamp(latency.GESTURE_EMIT, 0, 0, t=1.0)
+    tracker.stamp(latency.GESTURE_EMIT, 0, 2, t=1.0)
+    # the arrival of clause 0 was forgotten
+    assert tracker.summary()["tts_arrival->gesture_emit"]["count"] == 1
+
+
+def test_prometheus_export():
+    tracker = latency.LatencyTracker()
+    tracker.record(latency.UNITY_PLAYBACK, 1.5)
+    lines = tracker.to_prometheus(prefix="lat").splitlines()
+    assert lines[0] == "# TYPE lat summary"
+    assert 'lat{path="unity_playback",quantile="0.5"} 1.5' in lines
+    assert lines[-2:] == ['lat_sum{path="unity_playback"} 1.5', 'lat_count{path="unity_playback"} 1']
+
+
+def test_unity_timestamps_are_converted_to_the_monotonic_clock():
+    assert latency.parse_timestamp(12.5) == 12.5
+    assert latency.parse_timestamp("01:02:03.5") == 3723.5
+    assert latency.parse_timestamp("2026-01-01T00:00:00+00:00") == 1767225600.0
+    assert latency.parse_timestamp("soon") is None and latency.parse_timestamp("") is None
+    start, end, unknown = latency.to_monotonic("10:00:00", "10:00:01.25", None)
+    assert end - start == pytest.approx(1.25) and unknown is None
+    assert latency.turn_key(3) == 3 and latency.turn_key(3, "avatar") == ("avatar", 3)
+
+
+def test_unity_message_built_from_a_decoded_message_parses_its_times(make_unity_comm):
+    unity_comm = make_unity_comm()
+    fields = {"turnID": 0, "clauseID": 0, "status": "completed", "timeStart": "10:00:00", "timeEnd": "10:00:02"}
+    iu = UnityMessageIU.from_message({**fields, "unknown": 1}, creator=unity_comm)
+    assert iu.to_dict() == UnityMessageIU(creator=unity_comm, iuid=0, **fields).to_dict()
+    assert iu.end_time - iu.start_time == pytest.approx(2.0) and iu.sent_time is None
+
+
+def test_unity_communicator_records_the_playback_duration(make_unity_comm, unity_response):
+    tracker = latency.LatencyTracker()
+    unity_comm = make_unity_comm(latency_tracker=tracker)
+    session = unity_comm.session()
+    completed = unity_response(unity_comm, 0, 0, "completed", timeStart="10:00:00", timeEnd="10:00:02")
+    unity_comm.handle_event(session, uc.UNITY_EVENT, completed)
+    assert tracker.summary()[latency.UNITY_PLAYBACK]["mean"] == pytest.approx(2.0)
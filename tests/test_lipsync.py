@@ -0,0 +1,46 @@
+import numpy as np
+
+from retico_conversational_agent_unity import lipsync
+
+RATE = 16000
+
+
+def tone(frequency, duration, amplitude=0.5):
+    t = np.arange(int(RATE * duration)) / RATE
+    return amplitude * np.sin(2 * np.pi * frequency * t)
+
+
+def pcm(*segments):
+    return (np.concatenate(segments) * 32767).astype(np.int16).tobytes()
+
+
+def test_jaw_opens_on_the_voiced_frames_only():
+    audio = pcm(np.zeros(int(RATE * 0.4)), tone(200, 0.4), np.zeros(int(RATE * 0.4)))
+    blendshapes = lipsync.compute_mouth_blendshapes(audio, RATE)
+    assert blendshapes and {b["id"] for b in blendshapes} == {lipsync.JAW_OPEN}
+    # frames merged into a few actions, starting and ending around the tone (smoothing spreads it by a frame)
+    assert len(blendshapes) < 10
+    assert 0.32 <= blendshapes[0]["delay"] <= 0.4
+    end = blendshapes[-1]["delay"] + blendshapes[-1]["duration"]
+    assert 0.8 <= end <= 0.88
+    assert max(b["value"] for b in blendshapes) == 1.0
+    assert lipsync.compute_mouth_blendshapes(pcm(np.zeros(RATE)), RATE) == []
+
+
+def test_visemes_tell_fricatives_from_rounded_vowels():
+    audio = pcm(tone(100, 0.4), tone(6000, 0.4))
+    blendshapes = lipsync.compute_mouth_blendshapes(audio, RATE, visemes=True)
+    delays = {
+        viseme: [b["delay"] for b in blendshapes if b["id"] == blendshape_id]
+        for viseme, blendshape_id in lipsync.VISEME_BLENDSHAPES.items()
+    }
+    assert delays["round"] and max(delays["round"]) < 0.4
+    assert delays["wide"] and min(delays["wide"]) >= 0.36
+
+
+def test_stereo_and_32_bit_audio_are_downmixed():
+    mono = (tone(200, 0.2) * 2**31 * 0.99).astype(np.int32)
+    stereo = np.repeat(mono, 2).tobytes()
+    rms, zcr = lipsync.frame_features(stereo, RATE, sampwidth=4, channels=2)
+    assert len(rms) == 5 and np.allclose(rms, 0.5 * 0.99 / np.sqrt(2), rtol=0.01)
+    assert np.allclose(zcr, 2 * 200 / RATE, atol=0.005)
@@ -0,0 +1,97 @@
+"""The ends of turns are sent ahead of the audio clauses queued in the NonverbalGenerator, and the
+UnityCommunicatorModule still detects the end of turn when it receives them before the last clauses."""
+
+import statistics
+import threading
+import time
+import types
+
+from retico_conversational_agent_unity import unity_communicator as uc
+
+
+def test_end_of_turn_latency_under_audio_load(tts_ius, make_nvg):
+    nvg = make_nvg(lipsync=True)
+    words = [f"word{i}" for i in range(4)]
+    sent, all_sent = [], threading.Event()
+    nb_turns, nb_clauses = 5, 8
+
+    def send_iu(iu):
+        if not iu.final:
+            time.sleep(0.01)  # hand-off of a multi-second audio payload to the broker
+        sent.append((time.perf_counter(), iu))
+        if len(sent) == nb_turns * (nb_clauses + 1):
+            all_sent.set()
+
+    nvg.send_iu = send_iu
+    nvg.prepare_run()
+    try:
+        eot_queued = dict()
+        for turn_id in range(nb_turns):
+            # a turn of 2s clauses, whose end arrives while its clauses are still being encoded and sent
+            for clause_id in range(nb_clauses):
+                nvg.enqueue_clause(tts_ius(words, turn_id, clause_id, word_duration=0.5))
+            eot_queued[turn_id] = time.perf_counter()
+            nvg.enqueue_clause(tts_ius(words[:1], turn_id, None, word_duration=0.5, final=True))
+            time.sleep(0.02)
+        assert all_sent.wait(timeout=30)
+    finally:
+        nvg.shutdown()
+
+    eots = [(sent_at, iu) for sent_at, iu in sent if iu.final]
+    latencies = [sent_at - eot_queued[iu.turnID] for sent_at, iu in eots]
+    last_clauses = {iu.turnID: sent_at for sent_at, iu in sent if not iu.final}
+    assert [iu.clauseID for _, iu in eots] == [nb_clauses - 1] * nb_turns
+    # the ends of turns don't wait for the audio clauses queued before them
+    assert all(sent_at < last_clauses[iu.turnID] for sent_at, iu in eots)
+    assert statistics.median(latencies) < 0.05
+
+
+def test_unity_communicator_ends_the_turn_when_the_final_iu_overtakes_its_clauses(make_unity_comm, unity_response):
+    unity_comm = make_unity_comm()
+    emitted = unity_comm.emitted
+    session = unity_comm.session()
+
+    def clause(clause_id):
+        return types.SimpleNamespace(turnID=0, clauseID=clause_id, final=False, sessionID=None, audios=[{}])
+
+    def completed(clause_id):
+        return unity_response(unity_comm, 0, clause_id, "completed")
+
+    unity_comm.handle_event(session, uc.GESTURE_EVENT, clause(0))
+    unity_comm.handle_event(session, uc.GESTURE_EVENT, types.SimpleNamespace(turnID=0, clauseID=1, final=True))
+    unity_comm.handle_event(session, uc.GESTURE_EVENT, clause(1))
+    unity_comm.handle_event(session, uc.UNITY_EVENT, completed(0))
+    assert emitted == []
+    unity_comm.handle_event(session, uc.UNITY_EVENT, completed(1))
+    assert [a["event"] for a in emitted] == ["ius_from_last_turn", "agent_EOT"]
+
+
+def test_final_iu_of_a_new_turn_overtaking_its_clauses_during_a_hard_interruption(make_unity_comm, unity_response):
+    unity_comm = make_unity_comm()
+    emitted = unity_comm.emitted
+    session = unity_comm.session()
+
+    def clause(turn_id):
+        return types.SimpleNamespace(turnID=turn_id, clauseID=0, final=False, sessionID=None, audios=[{}])
+
+    def response(turn_id, status):
+        return unity_response(unity_comm, turn_id, 0, status)
+
+    unity_comm.handle_event(session, uc.GESTURE_EVENT, clause(0))
+    unity_comm.handle_event(session, uc.UNITY_EVENT, response(0, "start"))
+    hard = types.SimpleNamespace(action="hard_interruption", event=None, turn_id=0, final=False)
+    unity_comm.handle_event(session, uc.DM_EVENT, hard)
+    assert session.state == uc.HARD_INTERRUPTED
+    # the end of turn 1 reaches the UnityCommunicator before the clause of turn 1
+    unity_comm.handle_event(session, uc.GESTURE_EVENT, types.SimpleNamespace(turnID=1, clauseID=0, final=True))
+    unity_comm.handle_event(session, uc.GESTURE_EVENT, clause(1))
+    assert session.state == uc.SPEAKING
+    unity_comm.handle_event(session, uc.UNITY_EVENT, response(1, "start"))
+    unity_comm.handle_event(session, uc.UNITY_EVENT, response(1, "completed"))
+    assert [a["event"] for a in emitted] == [
+        "agent_BOT",
+        "interruption",
+        "agent_BOT",
+        "ius_from_last_turn",
+        "agent_EOT",
+    ]
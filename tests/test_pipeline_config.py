@@ -0,0 +1,94 @@
+import os
+import sys
+
+import pytest
+
+from retico_conversational_agent_unity.pipeline_config import PipelineConfigError, load_config, validate_config
+
+CONFIGS = os.path.join(os.path.dirname(__file__), "..", "src", "retico_conversational_agent_unity", "configs")
+
+
+class TextIU:
+    pass
+
+
+class AudioIU:
+    pass
+
+
+class TextModule:
+    def __init__(self, rate=16000, **kwargs):
+        self.rate = rate
+
+    @staticmethod
+    def input_ius():
+        return [AudioIU]
+
+    @staticmethod
+    def output_iu():
+        return TextIU
+
+    def add_policy(self):
+        pass
+
+
+def spec(**kwargs):
+    return {"class": f"{__name__}.TextModule", **kwargs}
+
+
+def test_validation_lists_every_error():
+    config = {
+        "unknown_section": {},
+        "modules": {
+            "a": spec(args={"rate": "$device"}, calls=["add_policy", "missing_method"]),
+            "b": spec(positional=[1, 2]),
+            "c": spec(args={"history": "$dialogue_history"}),
+            "d": {"class": "retico_conversational_agent_unity.missing.Module"},
+            "nvg": {
+                "class": "retico_conversational_agent_unity.nonverbal_generator.NonverbalGeneratorModule",
+                "args": {"store_audio": True, "stream_chunk_duration": 0.2, "codec": "mp3"},
+            },
+        },
+        "connections": [["a", "e"]],
+        "amq": {"out": [{"module": "e", "destination": "/topic/out"}]},
+    }
+    with pytest.raises(PipelineConfigError) as error:
+        validate_config(config)
+    messages = "\n".join(error.value.errors)
+    for expected in [
+        "unknown section unknown_section",
+        "TextModule has no method missing_method",
+        "modules.b : invalid arguments",
+        "unknown reference $dialogue_history",
+        "modules.d : can't import",
+        "stream_chunk_duration is only available when store_audio is false",
+        "unknown codec mp3",
+        "connections[0] : unknown modules ['e']",
+        "amq.out[0]",
+    ]:
+        assert expected in messages
+    # built-in references and existing methods are valid
+    assert "$device" not in messages and "no method add_policy" not in messages
+
+
+def test_validation_warns_about_incompatible_ius():
+    config = {"modules": {"a": spec(), "b": spec()}, "connections": [["a", "b"]]}
+    assert validate_config(config) == ["connections[0] : b doesn't take the TextIUs of a"]
+
+
+def test_validation_doesnt_import_the_modules(tmp_path, monkeypatch):
+    (tmp_path / "slow_to_import.py").write_text("raise RuntimeError('imported')\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    config = {
+        "modules": {"a": {"class": "slow_to_import.Module", "args": {"any": 1}}, "b": spec()},
+        "connections": [["a", "b"]],
+    }
+    assert validate_config(config) == []
+    assert "slow_to_import" not in sys.modules
+
+
+def test_shipped_config_is_valid():
+    pytest.importorskip("retico_conversational_agent")
+    pytest.importorskip("retico_wozmic")
+    config = load_config(os.path.join(CONFIGS, "pipeline_DM_unity.json"))
+    assert {"asr", "llm", "tts"} == {name for name, m in config["modules"].items() if m.get("background")}
@@ -0,0 +1,66 @@
+import types
+
+import pytest
+
+from retico_conversational_agent_unity.nonverbal_generator import NonverbalGeneratorModule
+from retico_conversational_agent_unity.playback_scheduler import QUEUED_INTERRUPT, PlaybackScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_clauses_are_scheduled_back_to_back_and_gaps_measured():
+    clock = FakeClock()
+    scheduler = PlaybackScheduler(interrupt=0, transport_smoothing=1.0, clock=clock)
+    assert scheduler.schedule(0, 0, duration=2.0) == 0.0
+    clock.now += 0.5
+    # clause 0 ends at 102, clause 1 is ready at 100.5
+    assert scheduler.schedule(0, 1, duration=1.0) == 1.5
+    # Unity started clause 0 after 0.1s of transport : the next delays account for it
+    scheduler.on_start(0, 0, start_time=100.1)
+    assert scheduler.transport == pytest.approx(0.1)
+    clock.now += 0.5
+    assert scheduler.schedule(0, 2, duration=1.0) == pytest.approx(1.9)  # 103 - (101 + 0.1)
+
+    scheduler.on_start(0, 1, start_time=102.15)  # 0.05s late
+    scheduler.on_start(0, 2, start_time=103.1)  # 0.05s early
+    metrics = scheduler.metrics()
+    assert metrics["pending"] == 0
+    assert metrics["inter_clause_gap"]["count"] == 1 and metrics["inter_clause_gap"]["max"] == pytest.approx(0.05)
+    assert metrics["inter_clause_overlap"]["count"] == 1
+    # the timeline is realigned on the start of the last clause
+    assert scheduler.expected_end == pytest.approx(104.1)
+
+    scheduler.reset()
+    assert scheduler.schedule(1, 0, duration=1.0) == 0.0
+
+
+def test_nonverbal_generator_delays_every_action_of_a_clause():
+    # Unity would add the delays to the time the clauses wait in its queue
+    with pytest.raises(ValueError):
+        PlaybackScheduler(interrupt=QUEUED_INTERRUPT)
+    clock = FakeClock()
+    scheduler = PlaybackScheduler(interrupt=0, clock=clock)
+    nvg = NonverbalGeneratorModule(playback_scheduler=scheduler)
+
+    def clause(clause_id):
+        return types.SimpleNamespace(
+            turnID=0,
+            clauseID=clause_id,
+            interrupt=2,
+            audios=[{"bytes": b""}],
+            animations=[{"animation": "talking_4", "duration": 1.5, "delay": 0.0}],
+            blendshapes=[{"id": "jawOpen", "value": 0.3, "duration": 0.1, "delay": 0.2}],
+        )
+
+    first, second = clause(0), clause(1)
+    nvg.schedule_playback(first)
+    nvg.schedule_playback(second)
+    assert first.audios[0]["delay"] == 0.0 and first.interrupt == 0
+    assert second.audios[0]["delay"] == 1.5 and second.animations[0]["delay"] == 1.5
+    assert second.blendshapes[0]["delay"] == pytest.approx(1.7)
@@ -0,0 +1,39 @@
+import os
+
+import pytest
+
+from retico_conversational_agent_unity.shared_audio import SharedAudioRing, StaleSegmentError
+
+
+def test_reader_copies_the_segments_written_in_the_ring(tmp_path):
+    with SharedAudioRing(path=tmp_path / "ring.bin", capacity=100) as writer:
+        ref = writer.write(b"RIFF" + b"\x01" * 36)
+        assert ref == {"path": str(tmp_path / "ring.bin"), "offset": 0, "length": 40, "generation": 0}
+        with SharedAudioRing.open(ref["path"]) as reader:
+            assert reader.capacity == 100
+            assert reader.read(ref) == b"RIFF" + b"\x01" * 36
+        with pytest.raises(ValueError):
+            writer.write(b"\x00" * 101)
+
+
+def test_segments_overwritten_by_the_writer_are_stale(tmp_path):
+    with SharedAudioRing(path=tmp_path / "ring.bin", capacity=100) as ring:
+        first = ring.write(b"\x01" * 40)
+        second = ring.write(b"\x02" * 40)
+        # wraps around : the region of the first segment is claimed again
+        third = ring.write(b"\x03" * 30)
+        assert third["generation"] == 1 and third["offset"] == 0
+        with pytest.raises(StaleSegmentError):
+            ring.read(first)
+        # the previous generation is still valid after the write offset
+        assert ring.read(second) == b"\x02" * 40 and ring.read(third) == b"\x03" * 30
+
+
+def test_the_nonverbal_generator_removes_its_ring_on_shutdown(tmp_path, tts_ius, make_nvg):
+    ring = SharedAudioRing(path=tmp_path / "ring.bin", capacity=2**20)
+    nvg = make_nvg(shared_audio_ring=ring)
+    iu = nvg.generate_nonverbal_one_clause_audio_bytes(tts_ius())
+    assert "bytes" not in iu.audios[0] and ring.read(iu.audios[0]["shm"])[:4] == b"RIFF"
+    nvg.prepare_run()
+    nvg.shutdown()
+    assert not os.path.exists(ring.path)
@@ -0,0 +1,47 @@
+import time
+
+import pytest
+
+from retico_conversational_agent_unity.startup import ParallelLoader, StartupTimer, run_modules
+
+
+class SlowModule:
+    def __init__(self, load_duration=0.0):
+        time.sleep(load_duration)
+        self.nb_setups = 0
+        self.nb_runs = 0
+
+    def setup(self):
+        self.nb_setups += 1
+
+    def run(self, run_setup=True):
+        assert not run_setup
+        self.nb_runs += 1
+
+
+def test_models_load_in_parallel_and_are_set_up_once():
+    timer = StartupTimer()
+    loader = ParallelLoader(timer)
+    for name in ("asr", "llm", "tts"):
+        loader.load(name, lambda: SlowModule(load_duration=0.2))
+    light = SlowModule()
+    loaded = loader.modules()
+    loader.shutdown()
+    run_modules(loaded + [light], timer, already_setup=loaded)
+
+    assert timer.total() < 0.5
+    assert [m.nb_setups for m in loaded + [light]] == [1, 1, 1, 1]
+    assert [m.nb_runs for m in loaded + [light]] == [1, 1, 1, 1]
+    assert set(timer.breakdown()) == {"asr", "llm", "tts", "setup", "run"}
+    assert "total" in timer.report()
+
+
+def test_sequential_loader_raises_load_errors():
+    loader = ParallelLoader(parallel=False)
+
+    def failing():
+        raise RuntimeError("model not found")
+
+    loader.load("llm", failing)
+    with pytest.raises(RuntimeError, match="model not found"):
+        loader.result("llm")
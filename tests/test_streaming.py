@@ -0,0 +1,90 @@
+"""Clauses streamed to Unity in sub-chunks : the end of a clause is the completion of its chunk flagged
+`lastChunk`."""
+
+import types
+
+from retico_conversational_agent_unity import unity_communicator as uc
+
+
+def chunk(turn_id, clause_id, chunk_index, last_chunk, words=("a",), word_ids=None, timings=(0.0,), duration=0.5):
+    audio = {
+        "words": list(words),
+        "wordIDs": list(word_ids) if word_ids is not None else [chunk_index],
+        "chunkIndex": chunk_index,
+        "lastChunk": last_chunk,
+    }
+    return types.SimpleNamespace(
+        turnID=turn_id,
+        clauseID=clause_id,
+        final=False,
+        sessionID=None,
+        audios=[audio],
+        timings=list(timings),
+        animations=[{"animation": "talking_4", "duration": duration, "delay": 0.0}],
+    )
+
+
+def send(unity_comm, session, iu):
+    """Receive a GestureIU from the NonverbalGenerator, and send it to Unity as a worker would."""
+    unity_comm.handle_event(session, uc.GESTURE_EVENT, iu)
+    unity_comm.register_command(session, session.gesture_inbox.get(timeout=0))
+
+
+def test_end_of_turn_waits_for_the_last_chunk(make_unity_comm, unity_response):
+    unity_comm = make_unity_comm()
+    emitted = unity_comm.emitted
+    session = unity_comm.session()
+
+    send(unity_comm, session, chunk(0, 0, 0, last_chunk=False))
+    unity_comm.handle_event(session, uc.GESTURE_EVENT, types.SimpleNamespace(turnID=0, clauseID=0, final=True))
+    session.gesture_inbox.clear()
+    unity_comm.handle_event(session, uc.UNITY_EVENT, unity_response(unity_comm, 0, 0, "start"))
+    # Unity completes the first chunk before the second one is sent : the clause isn't over
+    unity_comm.handle_event(session, uc.UNITY_EVENT, unity_response(unity_comm, 0, 0, "completed"))
+    assert "agent_EOT" not in [a["event"] for a in emitted]
+    send(unity_comm, session, chunk(0, 0, 1, last_chunk=True))
+    unity_comm.handle_event(session, uc.UNITY_EVENT, unity_response(unity_comm, 0, 0, "completed"))
+    assert [a["event"] for a in emitted][-1] == "agent_EOT"
+    assert session.commands_each_clause == {}
+
+
+def test_commands_that_will_never_complete_are_forgotten(make_unity_comm, unity_response):
+    unity_comm = make_unity_comm()
+    session = unity_comm.session()
+    for clause_id in range(3):
+        send(unity_comm, session, chunk(0, clause_id, 0, last_chunk=False))
+    unity_comm.handle_event(session, uc.UNITY_EVENT, unity_response(unity_comm, 0, 0, "interrupted"))
+    unity_comm.handle_event(session, uc.UNITY_EVENT, unity_response(unity_comm, 0, 1, "aborted"))
+    assert list(session.commands_each_clause) == [(0, 2)]
+    unity_comm.handle_event(session, uc.UNITY_EVENT, unity_response(unity_comm, 0, 2, "start"))
+    hard = types.SimpleNamespace(action="hard_interruption", event=None, turn_id=0, final=False)
+    unity_comm.handle_event(session, uc.DM_EVENT, hard)
+    assert session.commands_each_clause == {}
+
+
+def test_timing_index_is_relative_to_the_chunk_being_played(make_unity_comm, unity_response):
+    clock = types.SimpleNamespace(now=100.0)
+    unity_comm = make_unity_comm(clock=lambda: clock.now)
+    emitted = unity_comm.emitted
+    session = unity_comm.session()
+    # "big" spans the two chunks
+    send(unity_comm, session, chunk(0, 0, 0, False, words=["Hello", "big"], word_ids=[0, 1], timings=[0.0, 0.3]))
+    send(unity_comm, session, chunk(0, 0, 1, True, words=["big", "world"], word_ids=[1, 2], timings=[0.0, 0.2]))
+    word_timings = session.word_timings_each_turn[0][0]
+    assert word_timings.words == ["Hello", "big", "world"] and word_timings.starts == [0.0, 0.3, 0.7]
+
+    def interrupted(timing_index):
+        iu = unity_response(unity_comm, 0, 0, "interrupted")
+        iu.timingIndex = timing_index
+        return unity_comm.word_alignment(session, iu)["grounded_word"]
+
+    assert interrupted(1) == "big"
+    unity_comm.handle_event(session, uc.UNITY_EVENT, unity_response(unity_comm, 0, 0, "start"))
+    second_chunk = unity_response(unity_comm, 0, 0, "start")
+    second_chunk.start_time = 99.9
+    unity_comm.handle_event(session, uc.UNITY_EVENT, second_chunk)
+    assert interrupted(0) == "big" and interrupted(1) == "world"
+    # the DM interrupts the agent 0.1s after the second chunk started
+    hard = types.SimpleNamespace(action="hard_interruption", event=None, turn_id=0, final=False)
+    unity_comm.handle_event(session, uc.DM_EVENT, hard)
+    assert emitted[-1]["grounded_word"] == "big"
@@ -0,0 +1,49 @@
+from retico_conversational_agent_unity.turn_index import TurnIndex
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_turn_index_latest_is_last_updated_turn():
+    index = TurnIndex()
+    assert index.latest() is None
+    index[1] = 3
+    index[2] = 0
+    assert index.latest() == (2, 0)
+    index[1] = 4
+    assert index.latest() == (1, 4)
+    assert index.pop(1) == 4
+    assert index.latest() == (2, 0)
+    assert index.pop(1, None) is None
+    assert 2 in index and 1 not in index and len(index) == 1
+
+
+def test_turn_index_evicts_oldest_turns_by_count():
+    index = TurnIndex(max_turns=3)
+    for turn_id in range(10):
+        index[turn_id] = turn_id
+    assert list(index) == [7, 8, 9]
+    assert index.metrics() == {"size": 3, "evicted_by_count": 7, "evicted_by_age": 0}
+
+
+def test_turn_index_evicts_stale_turns_by_age():
+    clock = FakeClock()
+    index = TurnIndex(max_turns=None, max_age=10, clock=clock)
+    index[0] = 1
+    clock.now = 5
+    index[1] = 1
+    clock.now = 12
+    index[2] = 1
+    assert list(index) == [1, 2]
+    # updating a turn keeps it alive
+    clock.now = 15
+    index.setdefault(1, 0)
+    clock.now = 24
+    assert index.latest() == (1, 1)
+    assert list(index) == [1]
+    assert index.metrics() == {"size": 1, "evicted_by_count": 0, "evicted_by_age": 2}
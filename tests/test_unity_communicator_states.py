@@ -0,0 +1,162 @@
+"""Property tests of the UnityCommunicatorModule transition table : random sequences of GestureIUs, DMIUs and
+Unity messages are replayed against the module, checking its invariants after every event."""
+
+import random
+import types
+
+import pytest
+import retico_core
+from retico_conversational_agent import DMIU
+
+from retico_conversational_agent_unity import unity_communicator as uc
+from retico_conversational_agent_unity.additional_IUs import UnityMessageIU
+from retico_conversational_agent_unity.unity_communicator import UnityCommunicatorModule
+
+ALIGNMENT_EVENTS = {"agent_BOT", "agent_EOT", "ius_from_last_turn", "interruption", "continue"}
+
+
+class EventGenerator:
+    """Generates plausible but random events : clauses and ends of turns from the NonverbalGenerator, DM
+    decisions, and Unity responses to the clauses sent so far (or to manual commands)."""
+
+    def __init__(self, rng, creator):
+        self.rng = rng
+        self.creator = creator
+        self.turn_id = 0
+        self.clause_id = 0
+        self.sent = []
+        self.nb_requests = 0
+
+    def gesture(self):
+        if self.rng.random() < 0.2:
+            iu = types.SimpleNamespace(turnID=self.turn_id, clauseID=None, final=True)
+            self.turn_id += 1
+            self.clause_id = 0
+            return iu
+        iu = types.SimpleNamespace(
+            turnID=self.turn_id,
+            clauseID=self.clause_id,
+            final=False,
+            audios=[{"words": ["a", "b", "c"], "wordIDs": [0, 1, 2], "charIDs": [0, 2, 4]}],
+            timings=[0.0, 0.1, 0.2],
+            sessionID=None,
+        )
+        self.sent.append((self.turn_id, self.clause_id))
+        self.clause_id += 1
+        return iu
+
+    def dm(self):
+        action = self.rng.choice(["hard_interruption", "soft_interruption", "stop_turn_id", "continue", None])
+        event = self.rng.choice(["user_BOT_same_turn", "user_BOT", None])
+        return types.SimpleNamespace(action=action, event=event, turn_id=self.turn_id, final=self.rng.random() < 0.5)
+
+    def unity(self):
+        self.nb_requests += 1
+        turn_id, clause_id = self.rng.choice(self.sent) if self.sent else (None, None)
+        manual = self.rng.random() < 0.1
+        message = {
+            "requestID": f"{'billy' if manual else 'req'}:{self.nb_requests}",
+            "turnID": turn_id,
+            "clauseID": clause_id,
+            "status": self.rng.choice(["start", "completed", "interrupted", "aborted"]),
+            "timeStart": 0.0,
+            "timeEnd": 0.1,
+            "timingIndex": self.rng.randrange(4),
+        }
+        return UnityMessageIU(creator=self.creator, iuid=0, **message)
+
+    def next(self):
+        kind = self.rng.choices([uc.GESTURE_EVENT, uc.DM_EVENT, uc.UNITY_EVENT], weights=[5, 1, 4])[0]
+        return kind, {uc.GESTURE_EVENT: self.gesture, uc.DM_EVENT: self.dm, uc.UNITY_EVENT: self.unity}[kind]()
+
+
+def test_transition_table_has_no_duplicate_keys():
+    unity_comm = UnityCommunicatorModule()
+    assert len(unity_comm.transitions) == sum(len(states) for states, _, _, _ in uc.TRANSITIONS)
+    for state, kind, _ in unity_comm.transitions:
+        assert state in uc.STATES and kind in (uc.GESTURE_EVENT, uc.DM_EVENT, uc.UNITY_EVENT)
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_random_event_sequences_keep_invariants(seed, make_unity_comm):
+    rng = random.Random(seed)
+    unity_comm = make_unity_comm()
+    emitted = unity_comm.emitted
+    session = unity_comm.session()
+    events = EventGenerator(rng, unity_comm)
+    ended_turns = set()
+
+    for _ in range(300):
+        kind, iu = events.next()
+        state_before, queued_before = session.state, len(session.gesture_inbox)
+        nb_emitted = len(emitted)
+        unity_comm.handle_event(session, kind, iu)
+
+        assert session.state in uc.STATES
+        if session.state == uc.SPEAKING:
+            assert session.interrupted_turn_id is None
+        if session.state != uc.SOFT_INTERRUPTED:
+            assert session.interrupted_turn_iu_buffer == []
+        # nothing of a hard interrupted turn is queued for Unity
+        if state_before == uc.HARD_INTERRUPTED and kind == uc.GESTURE_EVENT and session.state == state_before:
+            assert len(session.gesture_inbox) == queued_before
+        # a soft interruption keeps the queued clauses aside
+        if state_before == uc.SPEAKING and session.state == uc.SOFT_INTERRUPTED:
+            assert len(session.gesture_inbox) == 0
+
+        new_alignments = emitted[nb_emitted:]
+        assert all(a["event"] in ALIGNMENT_EVENTS for a in new_alignments)
+        eot = [a for a in new_alignments if a["event"] == "agent_EOT"]
+        if eot:
+            assert [a["event"] for a in new_alignments] == ["ius_from_last_turn", "agent_EOT"]
+            assert eot[0]["turn_id"] not in ended_turns
+            assert eot[0]["turn_id"] not in session.last_clause_each_turn
+            ended_turns.add(eot[0]["turn_id"])
+
+
+def test_soft_interruption_then_continue_requeues_clauses(make_unity_comm, unity_response):
+    unity_comm = make_unity_comm()
+    emitted = unity_comm.emitted
+    session = unity_comm.session()
+    events = EventGenerator(random.Random(0), unity_comm)
+    events.rng.random = lambda: 0.5  # clauses only, no manual commands
+
+    for _ in range(3):
+        unity_comm.handle_event(session, uc.GESTURE_EVENT, events.gesture())
+    start = unity_response(unity_comm, 0, 0, "start", requestID="req:0")
+    unity_comm.handle_event(session, uc.UNITY_EVENT, start)
+    soft = types.SimpleNamespace(action="soft_interruption", event=None, turn_id=0, final=False)
+    unity_comm.handle_event(session, uc.DM_EVENT, soft)
+    assert session.state == uc.SOFT_INTERRUPTED and len(session.gesture_inbox) == 0
+    unity_comm.handle_event(session, uc.GESTURE_EVENT, events.gesture())
+    assert len(session.interrupted_turn_iu_buffer) == 4
+
+    resume = types.SimpleNamespace(action="continue", event=None, turn_id=0, final=False)
+    unity_comm.handle_event(session, uc.DM_EVENT, resume)
+    assert session.state == uc.SPEAKING
+    assert [iu.clauseID for iu in session.gesture_inbox.drain()] == [0, 1, 2, 3]
+    assert [a["event"] for a in emitted] == ["agent_BOT", "interruption", "continue"]
+
+
+def test_dm_actions_are_routed_to_the_session_of_their_dialogue_manager(make_unity_comm, unity_response):
+    unity_comm = make_unity_comm()
+    sessions = {session_id: unity_comm.session(session_id) for session_id in ["a", "b"]}
+    for session_id, session in sessions.items():
+        clause = types.SimpleNamespace(turnID=0, clauseID=0, final=False, sessionID=session_id)
+        unity_comm.handle_event(session, uc.GESTURE_EVENT, clause)
+        start = unity_response(unity_comm, 0, 0, "start", sessionID=session_id)
+        unity_comm.process_update([(start, retico_core.UpdateType.ADD)])
+
+    def hard_interruption(dm):
+        iu = DMIU(creator=dm, iuid=0)
+        iu.action, iu.event, iu.turn_id, iu.final = "hard_interruption", None, 0, False
+        return iu
+
+    dm_b = types.SimpleNamespace(id="dm_b", session_id="b")
+    unity_comm.process_update([(hard_interruption(dm_b), retico_core.UpdateType.ADD)])
+    assert (sessions["a"].state, sessions["b"].state) == (uc.SPEAKING, uc.HARD_INTERRUPTED)
+
+    # a DMIU that can't be attributed to a session is dropped, instead of interrupting the default session
+    dm = types.SimpleNamespace(id="dm")
+    unity_comm.process_update([(hard_interruption(dm), retico_core.UpdateType.ADD)])
+    assert sessions["a"].state == uc.SPEAKING and set(unity_comm.sessions) == {"a", "b"}
@@ -0,0 +1,90 @@
+import threading
+import time
+
+import msgpack
+
+from retico_conversational_agent_unity.local_broker import LocalStompBroker
+from retico_conversational_agent_unity.unity_simulator import UnitySimulator
+
+
+def command(turn_id, clause_id, duration=0.1, session_id=None):
+    return msgpack.packb(
+        {
+            "sessionID": session_id,
+            "turnID": turn_id,
+            "clauseID": clause_id,
+            "timings": [0.0, 0.05],
+            "audios": [{"transcription": "hello there", "words": ["hello", "there"]}],
+            "animations": [{"animation": "talking_4", "duration": duration, "delay": 0.0}],
+        }
+    )
+
+
+def run_simulation(commands, nb_responses, destination_in="/topic/retico_out_{avatar}", **kwargs):
+    responses = []
+    received = threading.Condition()
+
+    def on_response(destination):
+        def listener(body, headers):
+            with received:
+                responses.append((destination, msgpack.unpackb(body)))
+                received.notify()
+
+        return listener
+
+    with LocalStompBroker() as broker:
+        simulator = UnitySimulator(
+            port=broker.port,
+            destination_in=destination_in,
+            destination_out="/topic/unity_out_{avatar}",
+            speed=10,
+            **kwargs,
+        )
+        for avatar in simulator.avatars:
+            broker.add_listener(avatar.destination_out, on_response(avatar.destination_out))
+        simulator.start()
+        for destination, body in commands:
+            broker.publish(destination, body)
+        deadline = time.monotonic() + 5
+        with received:
+            while len(responses) < nb_responses and time.monotonic() < deadline:
+                received.wait(0.1)
+        simulator.stop()
+    return responses, simulator.stats()
+
+
+def test_simulator_plays_commands_in_order_for_each_avatar():
+    commands = [(f"/topic/retico_out_{avatar}", command(0, clause)) for clause in range(2) for avatar in range(3)]
+    responses, stats = run_simulation(commands, nb_responses=12, nb_avatars=3)
+    assert stats["responses"] == {"start": 6, "completed": 6}
+    for avatar in range(3):
+        statuses = [(r["clauseID"], r["status"]) for d, r in responses if d == f"/topic/unity_out_{avatar}"]
+        assert statuses == [(0, "start"), (0, "completed"), (1, "start"), (1, "completed")]
+    completed = [r for _, r in responses if r["status"] == "completed"]
+    assert all(r["timingIndex"] == 1 and r["timeEnd"] >= r["timeStart"] for r in completed)
+
+
+def test_simulator_interruption_aborts_rest_of_turn():
+    commands = [("/topic/retico_out_0", command(0, clause)) for clause in range(3)]
+    commands.append(("/topic/retico_out_0", command(1, 0)))
+    responses, stats = run_simulation(commands, nb_responses=6, nb_avatars=1, interruption_probability=1.0)
+    statuses = [(r["turnID"], r["clauseID"], r["status"]) for _, r in responses]
+    assert statuses == [
+        (0, 0, "start"),
+        (0, 0, "interrupted"),
+        (0, 1, "aborted"),
+        (0, 2, "aborted"),
+        (1, 0, "start"),
+        (1, 0, "interrupted"),
+    ]
+    assert responses[1][1]["timingIndex"] in (0, 1)
+
+
+def test_simulator_sessions_share_destination():
+    commands = [("/topic/retico_out", command(0, 0, session_id=avatar)) for avatar in range(2)]
+    responses, stats = run_simulation(
+        commands, nb_responses=4, nb_avatars=2, sessions=True, destination_in="/topic/retico_out"
+    )
+    assert stats["responses"] == {"start": 2, "completed": 2}
+    for avatar in range(2):
+        assert [r["sessionID"] for d, r in responses if d == f"/topic/unity_out_{avatar}"] == [avatar, avatar]
@@ -0,0 +1,83 @@
+import os
+import threading
+
+from retico_conversational_agent_unity.wav_writer import WavFileWriter
+
+
+def test_callbacks_are_called_in_submission_order_outside_of_the_lock(tmp_path):
+    writer = WavFileWriter(folder=tmp_path, session_id="s")
+    called, first_write_may_end = [], threading.Event()
+    data = b"RIFF" + b"\x00" * 40
+
+    def slow_write(seq, path, data, on_committed, on_failed):
+        if seq == 0:
+            first_write_may_end.wait(timeout=5)
+        return write(seq, path, data, on_committed, on_failed)
+
+    write, writer._write = writer._write, slow_write
+    first = writer.write(data, 0, 0, on_committed=lambda path: called.append(os.path.basename(path)))
+    second = writer.write(data, 0, 1, on_committed=lambda path: called.append(os.path.basename(path)))
+    # a callback can submit work to the writer, it isn't called under its lock
+    writer.call_in_order(lambda: writer.call_in_order(lambda: called.append("nested")))
+    second.result(timeout=5)
+    assert called == []
+    first_write_may_end.set()
+    first.result(timeout=5)
+    writer.shutdown()
+    assert called == ["s_turn_0_clause_0.wav", "s_turn_0_clause_1.wav", "nested"]
+
+
+def test_retention_removes_the_oldest_files(tmp_path):
+    assert WavFileWriter(folder=tmp_path).max_files is not None
+    writer = WavFileWriter(folder=tmp_path, session_id="s", max_files=2, max_bytes=None)
+    for clause_id in range(3):
+        writer.write(b"\x00" * 10, 0, clause_id).result(timeout=5)
+    writer.shutdown()
+    assert sorted(os.listdir(tmp_path)) == ["s_turn_0_clause_1.wav", "s_turn_0_clause_2.wav"]
+    assert writer.nb_evicted == 1
+
+
+def test_failed_write_is_reported_in_order_and_not_retained(tmp_path):
+    writer = WavFileWriter(folder=tmp_path, session_id="s")
+    os.makedirs(writer.path(0, 0))  # the file can't be written
+    failures, called = [], []
+    writer.write(b"\x00" * 10, 0, 0, on_committed=called.append, on_failed=failures.append).exception(timeout=5)
+    writer.call_in_order(lambda: called.append("next"))
+    writer.shutdown()
+    assert len(failures) == 1 and isinstance(failures[0], OSError)
+    assert called == ["next"] and len(writer._files) == 0
+
+
+def test_failed_write_committed_behind_a_slower_write(tmp_path):
+    writer = WavFileWriter(folder=tmp_path, session_id="s")
+    os.makedirs(writer.path(0, 1))
+    failures, called, first_write_may_end = [], [], threading.Event()
+
+    def slow_write(seq, path, data, on_committed, on_failed):
+        if seq == 0:
+            first_write_may_end.wait(timeout=5)
+        return write(seq, path, data, on_committed, on_failed)
+
+    write, writer._write = writer._write, slow_write
+    first = writer.write(b"\x00" * 10, 0, 0, on_committed=called.append)
+    # the failure is committed once the first write ends, after its except block is over
+    assert isinstance(writer.write(b"\x00" * 10, 0, 1, on_failed=failures.append).exception(timeout=5), OSError)
+    writer.call_in_order(lambda: called.append("next"))
+    assert failures == [] and called == []
+    first_write_may_end.set()
+    assert first.result(timeout=5) == writer.path(0, 0)
+    writer.shutdown()
+    assert len(failures) == 1 and isinstance(failures[0], OSError)
+    assert called == [writer.path(0, 0), "next"]
+
+
+def test_clause_whose_file_cant_be_written_is_sent_inline(tmp_path, tts_ius, make_nvg):
+    writer = WavFileWriter(folder=tmp_path, session_id="s")
+    nvg = make_nvg(store_audio=True, wav_writer=writer)
+    os.makedirs(writer.path(0, 1))
+    nvg.process_clause(tts_ius(clause_id=0))
+    nvg.process_clause(tts_ius(clause_id=1))
+    writer.shutdown()
+    written, inline = nvg.output_buffer.drain()
+    assert written.audios[0]["path"] == writer.path(0, 0) and "bytes" not in written.audios[0]
+    assert "path" not in inline.audios[0] and inline.audios[0]["bytes"][:4] == b"RIFF"
@@ -0,0 +1,63 @@
+import types
+
+from retico_conversational_agent_unity import unity_communicator as uc
+from retico_conversational_agent_unity.word_timings import WordTimings
+
+
+def test_from_ius_merges_the_audio_chunks_of_each_word():
+    def iu(word, nb_bytes, word_id=None, char_id=None):
+        return types.SimpleNamespace(raw_audio=b"\x00" * nb_bytes, grounded_word=word, word_id=word_id, char_id=char_id)
+
+    # two chunks of "Hello", then "world" : 1000 bytes per second
+    ius = [iu("Hello", 200, 0, 0), iu("Hello", 300, 0, 0), iu("world", 500, 1, 6)]
+    timings = WordTimings.from_ius(ius, bytes_per_second=1000)
+    assert (timings.words, timings.starts, timings.ends) == (["Hello", "world"], [0.0, 0.5], [0.5, 1.0])
+    assert timings.transcription == "Hello world" and timings.word_at(1) == ("world", 1, 6)
+    assert timings.word_at(2) is None
+    # without word ids, a new word starts when the grounded word changes
+    ius = [iu("so", 100), iu("so", 100), iu("yes", 100)]
+    assert WordTimings.from_ius(ius, bytes_per_second=1000).starts == [0.0, 0.2]
+
+    # the table sent with the clause is rebuilt by the UnityCommunicator
+    rebuilt = WordTimings.from_audio(timings.audio_fields(), timings.starts)
+    assert (rebuilt.words, rebuilt.starts, rebuilt.char_ids) == (["Hello", "world"], [0.0, 0.5], [0, 6])
+
+
+def test_index_at_finds_the_word_being_spoken():
+    timings = WordTimings(words=["Hello", "there", "friend"], starts=[0.0, 0.4, 0.9])
+    assert [timings.index_at(t) for t in (-0.1, 0.0, 0.39, 0.4, 2.0)] == [0, 0, 0, 1, 2]
+    assert WordTimings().index_at(1.0) is None
+
+
+def test_interruption_alignments_ground_on_the_word_being_spoken(make_unity_comm, unity_response):
+    clock = types.SimpleNamespace(now=100.0)
+    unity_comm = make_unity_comm(clock=lambda: clock.now)
+    emitted = unity_comm.emitted
+    session = unity_comm.session()
+    clause = types.SimpleNamespace(
+        turnID=0,
+        clauseID=0,
+        final=False,
+        sessionID=None,
+        audios=[{"words": ["Hello", "there", "friend"], "wordIDs": [0, 1, 2]}],
+        timings=[0.0, 0.4, 0.9],
+    )
+    unity_comm.handle_event(session, uc.GESTURE_EVENT, clause)
+
+    def response(status, timing_index=None):
+        iu = unity_response(unity_comm, 0, 0, status, timingIndex=timing_index)
+        iu.start_time = 99.5
+        return iu
+
+    unity_comm.handle_event(session, uc.UNITY_EVENT, response("start", timing_index=0))
+    # the DM interrupts the agent 0.5s after Unity started the clause, before Unity answers
+    hard = types.SimpleNamespace(action="hard_interruption", event=None, turn_id=0, final=False)
+    unity_comm.handle_event(session, uc.DM_EVENT, hard)
+    assert emitted[-1]["event"] == "interruption" and emitted[-1]["grounded_word"] == "there"
+    # Unity's response tells the word it was playing
+    unity_comm.handle_event(session, uc.UNITY_EVENT, response("interrupted", timing_index=2))
+    assert emitted[-1]["grounded_word"] == "friend"
+    # or, without timingIndex, the time it played the clause
+    interrupted = response("interrupted")
+    interrupted.end_time = 99.6
+    assert unity_comm.word_alignment(session, interrupted)["grounded_word"] == "Hello"